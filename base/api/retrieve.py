@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+
+from base.core.retrieval import build_filter
+from base.core.snapshots import READER, SNAPSHOT_RETRIEVER
+from base.schema.requests import QueryRequest
+
+router = APIRouter(tags=["retrieve"])
+
+
+@router.post("/query")
+async def query_endpoint(req: QueryRequest):
+    READER.start()
+    filter = build_filter(
+        type=req.type,
+        sender_id=req.sender_id,
+        thread_id=req.thread_id,
+        since=req.since,
+        until=req.until,
+    )
+    # One version for both rankers and the reported number, even if a
+    # refresh swaps in a newer one mid-search.
+    snapshot = READER.current
+    hits = await SNAPSHOT_RETRIEVER.search(
+        req.text, req.k, filter=filter, rankers=snapshot.rankers()
+    )
+    return {"version": snapshot.version, "hits": hits}
+
+
+@router.get("/snapshot")
+async def snapshot_endpoint():
+    READER.start()
+    return READER.info()
@@ -1,12 +1,145 @@
-from fastapi import APIRouter
+import asyncio
+import os
+import uuid
 
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from base.config import settings
+from base.core.assembler import ASSEMBLERS, Assembler
+from base.core.context_cache import CONTEXT_CACHE, CachedContext
+from base.core.graph import GRAPH  # registers the "related" section builder
+from base.core.ingest import QUEUE, Backpressure
+from base.core.lexical import LEXICAL
+from base.core.preferences import PREFERENCES
+from base.core.registry import REGISTRY
+from base.core.retrieval import build_filter
+from base.core.snapshots import READER, SNAPSHOT_RETRIEVER
+from base.core.storage import STORAGE
+from base.helpers import _json_dumps
 from base.schema.requests import IngestRequest, QueryRequest
 
 router = APIRouter()
 
 
 @router.post("/ingest")
-async def ingest_endpoint(req: IngestRequest): ...
+async def ingest_endpoint(req: IngestRequest):
+    try:
+        entry_id = await QUEUE.submit(req.model_dump(exclude_none=True))
+    except Backpressure as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+    return {"id": entry_id, "status": "queued"}
+
+
+async def _ndjson_lines(request: Request):
+    buffer = b""
+    async for block in request.stream():
+        buffer += block
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def _items(body: list):
+    for item in body:
+        yield item
+
+
+@router.post("/ingest/batch")
+async def ingest_batch_endpoint(request: Request):
+    """Queue many items from a JSON array or a streamed NDJSON body.
+
+    NDJSON bodies are read line by line and queued ``INGEST_BATCH_SIZE``
+    items at a time as they arrive; the response has one result line per
+    input line. It is sent once the body is consumed, since a streaming
+    response would compete with the body for ``receive``.
+    """
+
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        results = QUEUE.submit_stream(_ndjson_lines(request), settings.INGEST_BATCH_SIZE)
+        lines = [_json_dumps(r) + "\n" async for r in results]
+        return Response("".join(lines), media_type="application/x-ndjson")
+
+    body = await request.json()
+    if isinstance(body, dict):
+        body = body.get("items")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=422, detail="expected a list of items")
+    results = [r async for r in QUEUE.submit_stream(_items(body), settings.INGEST_BATCH_SIZE)]
+    counts: dict = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {"items": results, "counts": counts}
+
+
+@router.post("/ingest/file")
+async def ingest_file_endpoint(request: Request, source: str | None = None, type: str = "doc"):
+    """Spool a streamed request body to disk and queue it for chunking.
+
+    Workers read the spooled file with ``mmap``, so the document is never
+    held in memory whole on either side.
+    """
+
+    if await QUEUE.backlog() >= QUEUE.max_backlog:
+        raise HTTPException(
+            status_code=503, detail="ingest backlog full", headers={"Retry-After": "1"}
+        )
+    os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.INGEST_SPOOL_DIR, uuid.uuid4().hex)
+    size = 0
+    with open(path, "wb") as f:
+        async for block in request.stream():
+            await asyncio.to_thread(f.write, block)
+            size += len(block)
+
+    item = {"type": type, "path": path, "source": source or path, "spooled": True}
+    try:
+        entry_id = await QUEUE.submit(item)
+    except Backpressure as exc:
+        os.remove(path)
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+    return {"id": entry_id, "status": "queued", "bytes": size}
+
+
+def _route(thread_id: str | None, request: Request):
+    """Redirect to the worker that owns ``thread_id`` if it is not this one."""
+
+    if thread_id is None or REGISTRY.is_local(thread_id):
+        return
+    url = REGISTRY.owner(thread_id).rstrip("/") + request.url.path
+    if request.url.query:
+        url += f"?{request.url.query}"
+    raise HTTPException(status_code=307, detail="thread owned by another worker", headers={"Location": url})
+
+
+@router.post("/messages")
+async def messages_endpoint(req: IngestRequest, request: Request):
+    """Append a message; without ``thread_id`` a new thread is started."""
+
+    _route(req.thread_id, request)
+    content = {"text": req.text, "sender": req.sender_id} if req.sender_id else req.text
+    thread = await REGISTRY.append(req.thread_id, content)
+    return {"thread_id": thread.metadata.thread_id, "messages": len(thread.content)}
+
+
+@router.get("/messages")
+async def recent_messages_endpoint(thread_id: str, request: Request, n: int = 20):
+    """The last ``n`` messages of a thread, oldest first.
+
+    A resident thread answers from memory; any other is one prepared query
+    on ``messages`` instead of a load into the registry.
+    """
+
+    _route(thread_id, request)
+    thread = REGISTRY.peek(thread_id)
+    if thread is not None:
+        messages = thread.content.recent(n)
+    else:
+        messages = [r.content for r in await STORAGE.last_messages(thread_id, n)]
+    return {"thread_id": thread_id, "messages": messages}
 
 
 @router.post("/classify")
@@ -14,7 +147,40 @@ async def classify_endpoint(req: IngestRequest): ...
 
 
 @router.post("/context")
-async def context_endpoint(req: QueryRequest): ...
+async def context_endpoint(req: QueryRequest, request: Request):
+    _route(req.thread_id, request)
+    sections = {}
+    if req.thread_id is not None:
+        sections = (await CONTEXT_CACHE.get(req.thread_id)).sections
+    if req.sender_id is not None and (preferences := PREFERENCES.lines(req.sender_id)):
+        sections = sections | {"preferences": preferences}
+    if req.text.strip():
+        # ``sender_id`` picks the preferences; it does not filter the hits,
+        # since thread messages and most chunks carry no sender.
+        filter = build_filter(type=req.type, since=req.since, until=req.until)
+        hits = await SNAPSHOT_RETRIEVER.search(
+            req.text, req.k, filter=filter, rankers=READER.current.rankers(LEXICAL)
+        )
+        related = [h["payload"]["text"] for h in hits if (h["payload"] or {}).get("text")]
+        if related:
+            linked = sections.get("related", [])
+            sections = sections | {"related": linked + [t for t in related if t not in linked]}
+    budget = req.budget or settings.CONTEXT_TOKEN_BUDGET
+    asm = ASSEMBLERS.get(req.thread_id) if req.thread_id is not None else None
+    if asm is None:
+        asm = Assembler.from_sections(sections, budget)
+        if req.thread_id is not None:
+            ASSEMBLERS.put(req.thread_id, asm)
+    else:
+        # The current thread reaches the assembler through ``append``.
+        asm.update({name: sections.get(name, []) for name in ("preferences", "related")}, budget)
+    sections = asm.sections()
+    return {
+        "thread_id": req.thread_id,
+        "context": CachedContext(req.thread_id, sections).render(),
+        "sections": sections,
+        "tokens": asm.used,
+    }
 
 
 @router.post("/knowledge")
@@ -22,4 +188,12 @@ async def knowledge_endpoint(req: IngestRequest): ...
 
 
 @router.post("/preferences")
-async def preferences_endpoint(req: IngestRequest): ...
+async def preferences_endpoint(req: IngestRequest):
+    if req.sender_id is None:
+        raise HTTPException(status_code=422, detail="sender_id is required")
+    result = await PREFERENCES.observe(req.sender_id, req.text)
+    return {
+        "sender_id": req.sender_id,
+        **result,
+        "preferences": PREFERENCES.get(req.sender_id).values(),
+    }
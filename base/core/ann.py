@@ -0,0 +1,468 @@
+from __future__ import annotations
+
+import json
+import operator
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+from attrs import define, field
+
+from base.core.similarity import normalize, top_k
+
+
+_RANGE = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+def _number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _values(value: Any) -> List[Any]:
+    if isinstance(value, (list, tuple, set)):
+        return [v for v in value if isinstance(v, (str, int, float, bool))]
+    if isinstance(value, (str, int, float, bool)):
+        return [value]
+    return []
+
+
+@define
+class PayloadIndex:
+    """Payload values of numbered slots, indexed for filtering.
+
+    Scalar values (and the scalar members of list values) go into an
+    inverted map. Numeric values also go into one float column per key,
+    which answers range conditions with a vectorized comparison; float
+    values are only kept there, so per-record timestamps do not grow the
+    map. Keys in ``unindexed`` are skipped.
+    """
+
+    unindexed: Tuple[str, ...] = field(default=("text",))
+    fields: Dict[str, Dict[Any, Set[int]]] = field(factory=dict, init=False)
+    numeric: Dict[str, np.ndarray] = field(factory=dict, init=False)
+    capacity: int = field(default=0, init=False)
+
+    def grow(self, capacity: int):
+        for key, column in self.numeric.items():
+            grown = np.full(capacity, np.nan)
+            grown[: len(column)] = column
+            self.numeric[key] = grown
+        self.capacity = capacity
+
+    def add(self, slot: int, payload: Dict[str, Any] | None):
+        for key, value in (payload or {}).items():
+            if key in self.unindexed:
+                continue
+            if _number(value):
+                column = self.numeric.get(key)
+                if column is None:
+                    column = self.numeric[key] = np.full(self.capacity, np.nan)
+                column[slot] = value
+                if isinstance(value, float):
+                    continue
+            postings = self.fields.setdefault(key, {})
+            for v in _values(value):
+                postings.setdefault(v, set()).add(slot)
+
+    def remove(self, slot: int, payload: Dict[str, Any] | None):
+        for key, value in (payload or {}).items():
+            if key in self.unindexed:
+                continue
+            if key in self.numeric:
+                self.numeric[key][slot] = np.nan
+            postings = self.fields.get(key, {})
+            for v in _values(value):
+                postings.get(v, set()).discard(slot)
+
+    def match(self, filter: Dict[str, Any], alive: np.ndarray) -> np.ndarray:
+        """Slots below ``len(alive)`` matching every condition of ``filter``.
+
+        A condition is a value, a list of values (any may match) or a range
+        dict with ``gt``/``gte``/``lt``/``lte`` bounds. ``alive`` only masks
+        range-only filters; equality postings never hold dead slots.
+        """
+
+        empty = np.empty(0, dtype=np.int64)
+        matched: Set[int] | None = None
+        mask = None
+        n = len(alive)
+        for key, want in filter.items():
+            if isinstance(want, float):
+                want = {"gte": want, "lte": want}
+            if isinstance(want, dict):
+                column = self.numeric.get(key)
+                if column is None:
+                    return empty
+                cond = np.ones(n, dtype=bool)
+                for op, bound in want.items():
+                    cond &= _RANGE[op](column[:n], bound)
+                mask = cond if mask is None else mask & cond
+                continue
+            postings = self.fields.get(key, {})
+            match = set().union(*(postings.get(v, ()) for v in _values(want)))
+            matched = match if matched is None else matched & match
+            if not matched:
+                return empty
+
+        if matched is None:
+            return np.flatnonzero(mask & alive)
+        slots = np.fromiter(matched, dtype=np.int64, count=len(matched))
+        return slots if mask is None else slots[mask[slots]]
+
+
+@define
+class _List:
+    """One inverted list: a growable block of vectors and their slots.
+
+    ``vectors`` may be a read-only view into a loaded snapshot; it is copied
+    on the first append.
+    """
+
+    vectors: np.ndarray
+    slots: np.ndarray
+    size: int = 0
+
+    @classmethod
+    def empty(cls, dim: int, capacity: int = 16):
+        return cls(
+            np.empty((capacity, dim), dtype=np.float32),
+            np.empty(capacity, dtype=np.int64),
+        )
+
+    def extend(self, slots: np.ndarray, vectors: np.ndarray):
+        need = self.size + len(slots)
+        if need > len(self.slots) or not self.vectors.flags.writeable:
+            cap = max(need, 2 * len(self.slots), 16)
+            grown = np.empty((cap, self.vectors.shape[1]), dtype=np.float32)
+            grown[: self.size] = self.vectors[: self.size]
+            ids = np.empty(cap, dtype=np.int64)
+            ids[: self.size] = self.slots[: self.size]
+            self.vectors, self.slots = grown, ids
+        self.vectors[self.size : need] = vectors
+        self.slots[self.size : need] = slots
+        self.size = need
+
+
+@define
+class VectorIndex:
+    """In-process IVF index over normalized float32 vectors.
+
+    Below ``train_threshold`` live vectors every record sits in a single list
+    and search is exact. Past it, spherical k-means splits the data into
+    ``nlist`` cells and a query only scans the ``nprobe`` closest cells.
+    Deletes are tombstones; once more than ``compact_ratio`` of the slots are
+    dead the index is rebuilt, retraining the cells if it has grown enough.
+
+    Payloads are indexed by a ``PayloadIndex``, so equality and range
+    filters such as ``{"created": {"gte": t}}`` resolve to slots before
+    scoring. A filter that matches at most ``exact_threshold`` records is
+    answered by brute force over just those records. Keys in ``unindexed``
+    are stored but never filtered on.
+    """
+
+    dim: int = field(default=1536)
+    nprobe: int = field(default=8)
+    train_threshold: int = field(default=4096)
+    exact_threshold: int = field(default=2048)
+    compact_ratio: float = field(default=0.2)
+    unindexed: Tuple[str, ...] = field(default=("text",))
+    ids: List[str | None] = field(factory=list, init=False)
+    payloads: List[Dict[str, Any] | None] = field(factory=list, init=False)
+    _slots: Dict[str, int] = field(factory=dict, init=False)
+    _alive: np.ndarray = field(default=None, init=False)
+    _where: np.ndarray = field(default=None, init=False)
+    _lists: List[_List] = field(factory=list, init=False)
+    _centroids: np.ndarray | None = field(default=None, init=False)
+    _trained_on: int = field(default=0, init=False)
+    _filters: PayloadIndex = field(default=None, init=False)
+
+    def __attrs_post_init__(self):
+        self._alive = np.zeros(0, dtype=bool)
+        self._where = np.zeros((0, 2), dtype=np.int64)
+        self._lists = [_List.empty(self.dim)]
+        self._filters = PayloadIndex(self.unindexed)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, id: str):
+        return id in self._slots
+
+    @property
+    def dead(self) -> int:
+        return len(self.ids) - len(self._slots)
+
+    def payload(self, id: str) -> Dict[str, Any] | None:
+        slot = self._slots.get(id)
+        return None if slot is None else self.payloads[slot]
+
+    def vectors(self, ids: Iterable[str]) -> np.ndarray:
+        """Normalized vectors of ``ids``, which must all be present."""
+
+        slots = np.array([self._slots[str(i)] for i in ids], dtype=np.int64)
+        return self._gather(slots)
+
+    def add(
+        self,
+        ids: Iterable[str],
+        vectors: Any,
+        payloads: Iterable[Dict[str, Any] | None] | None = None,
+    ):
+        ids = [str(i) for i in ids]
+        if not ids:
+            return
+        rows = normalize(vectors)
+        if rows.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}")
+        payloads = list(payloads) if payloads is not None else [None] * len(ids)
+
+        self.delete(i for i in ids if i in self._slots)
+        start = len(self.ids)
+        slots = np.arange(start, start + len(ids), dtype=np.int64)
+        self._grow(start + len(ids))
+        self._alive[slots] = True
+        for slot, id, payload in zip(slots.tolist(), ids, payloads):
+            self.ids.append(id)
+            self.payloads.append(payload)
+            self._slots[id] = slot
+            self._filters.add(slot, payload)
+
+        self._place(slots, rows)
+        if self._centroids is None and len(self) >= self.train_threshold:
+            self.rebuild(train=True)
+        elif self._centroids is not None and len(self) > 8 * self._trained_on:
+            self.rebuild(train=True)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        removed = 0
+        for id in list(ids):
+            slot = self._slots.pop(str(id), None)
+            if slot is None:
+                continue
+            self._alive[slot] = False
+            self._filters.remove(slot, self.payloads[slot])
+            self.ids[slot] = self.payloads[slot] = None
+            removed += 1
+
+        if removed and self.dead > self.compact_ratio * max(len(self.ids), 1):
+            self.rebuild(train=len(self) > 4 * self._trained_on)
+        return removed
+
+    def search(
+        self,
+        query: Any,
+        k: int = 8,
+        *,
+        filter: Dict[str, Any] | None = None,
+        nprobe: int | None = None,
+    ) -> List[Dict[str, Any]]:
+        q = normalize(query)[0]
+        allowed = None
+        if filter:
+            allowed = self._filters.match(filter, self._alive[: len(self.ids)])
+        if allowed is not None:
+            if not len(allowed):
+                return []
+            if len(allowed) <= self.exact_threshold:
+                return self._exact(q, allowed, k)
+
+        mask = self._alive
+        if allowed is not None:
+            mask = np.zeros_like(self._alive)
+            mask[allowed] = True
+
+        probe = nprobe or self.nprobe
+        while True:
+            hits = self._probe(q, k, mask, probe)
+            if len(hits) >= k or probe >= len(self._lists):
+                return hits
+            probe *= 2
+
+    def rebuild(self, *, train: bool = False):
+        """Drop tombstones and lay the live vectors out again."""
+
+        live = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self))
+        vectors = self._gather(live)
+        ids = [self.ids[s] for s in live.tolist()]
+        payloads = [self.payloads[s] for s in live.tolist()]
+
+        centroids = self._centroids
+        if train and len(ids) >= self.train_threshold:
+            centroids, self._trained_on = self._kmeans(vectors), len(ids)
+        elif len(ids) < self.train_threshold:
+            centroids, self._trained_on = None, 0
+
+        self.ids, self.payloads, self._slots = [], [], {}
+        self._filters = PayloadIndex(self.unindexed)
+        self._alive = np.zeros(0, dtype=bool)
+        self._where = np.zeros((0, 2), dtype=np.int64)
+        self._centroids = centroids
+        n = 1 if centroids is None else len(centroids)
+        self._lists = [_List.empty(self.dim) for _ in range(n)]
+        # ``add`` would re-enter rebuild, so place the rows directly.
+        self._grow(len(ids))
+        self._alive[: len(ids)] = True
+        for slot, (id, payload) in enumerate(zip(ids, payloads)):
+            self.ids.append(id)
+            self.payloads.append(payload)
+            self._slots[id] = slot
+            self._filters.add(slot, payload)
+        self._place(np.arange(len(ids), dtype=np.int64), vectors)
+
+    def save(self, path: str):
+        """Write a compacted snapshot to ``path`` atomically."""
+
+        if self.dead:
+            self.rebuild()
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        order = np.argsort(self._where[: len(self.ids), 0], kind="stable")
+        offsets = np.zeros(len(self._lists) + 1, dtype=np.int64)
+        np.cumsum([lst.size for lst in self._lists], out=offsets[1:])
+        np.save(os.path.join(tmp, "vectors.npy"), self._gather(order))
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        if self._centroids is not None:
+            np.save(os.path.join(tmp, "centroids.npy"), self._centroids)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "dim": self.dim,
+                    "trained_on": self._trained_on,
+                    "ids": [self.ids[i] for i in order.tolist()],
+                    "payloads": [self.payloads[i] for i in order.tolist()],
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, *, mmap: bool = False, **kwargs):
+        """Load a snapshot; with ``mmap`` the vectors stay on disk until written."""
+
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        index = cls(dim=meta["dim"], **kwargs)
+        vectors = np.load(
+            os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None
+        )
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        centroids = os.path.join(path, "centroids.npy")
+        if os.path.exists(centroids):
+            index._centroids = np.load(centroids)
+            index._trained_on = meta["trained_on"]
+
+        n = len(meta["ids"])
+        index._grow(n)
+        index._alive[:n] = True
+        index._lists = []
+        for c in range(len(offsets) - 1):
+            lo, hi = int(offsets[c]), int(offsets[c + 1])
+            index._lists.append(
+                _List(vectors[lo:hi], np.arange(lo, hi, dtype=np.int64), hi - lo)
+            )
+            index._where[lo:hi, 0] = c
+            index._where[lo:hi, 1] = np.arange(hi - lo)
+        for slot, (id, payload) in enumerate(zip(meta["ids"], meta["payloads"])):
+            index.ids.append(id)
+            index.payloads.append(payload)
+            index._slots[id] = slot
+            index._filters.add(slot, payload)
+        return index
+
+    def _grow(self, n: int):
+        if n <= len(self._alive):
+            return
+        cap = max(n, 2 * len(self._alive), 64)
+        alive = np.zeros(cap, dtype=bool)
+        alive[: len(self._alive)] = self._alive
+        where = np.zeros((cap, 2), dtype=np.int64)
+        where[: len(self._where)] = self._where
+        self._alive, self._where = alive, where
+        self._filters.grow(cap)
+
+    def _place(self, slots: np.ndarray, rows: np.ndarray):
+        if self._centroids is None:
+            cells = np.zeros(len(slots), dtype=np.int64)
+        else:
+            cells = np.argmax(rows @ self._centroids.T, axis=1)
+        for c in np.unique(cells).tolist():
+            pick = np.flatnonzero(cells == c)
+            lst = self._lists[c]
+            self._where[slots[pick], 0] = c
+            self._where[slots[pick], 1] = np.arange(lst.size, lst.size + len(pick))
+            lst.extend(slots[pick], rows[pick])
+
+    def _gather(self, slots: np.ndarray) -> np.ndarray:
+        out = np.empty((len(slots), self.dim), dtype=np.float32)
+        if not len(slots):
+            return out
+        where = self._where[slots]
+        order = np.argsort(where[:, 0], kind="stable")
+        cells = where[order, 0]
+        bounds = [0, *(np.flatnonzero(np.diff(cells)) + 1).tolist(), len(order)]
+        for lo, hi, c in zip(bounds, bounds[1:], cells[bounds[:-1]].tolist()):
+            pick = order[lo:hi]
+            out[pick] = self._lists[c].vectors[where[pick, 1]]
+        return out
+
+    def _exact(self, q: np.ndarray, slots: np.ndarray, k: int):
+        scores = self._gather(slots) @ q
+        return self._hits(slots, scores, top_k(scores, k))
+
+    def _probe(self, q: np.ndarray, k: int, mask: np.ndarray, nprobe: int):
+        if self._centroids is None:
+            cells = [0]
+        else:
+            cells = top_k(self._centroids @ q, nprobe).tolist()
+
+        slots, scores = [], []
+        for c in cells:
+            lst = self._lists[c]
+            if not lst.size:
+                continue
+            ids = lst.slots[: lst.size]
+            keep = mask[ids]
+            s = lst.vectors[: lst.size] @ q
+            slots.append(ids[keep])
+            scores.append(s[keep])
+        if not slots:
+            return []
+        slots, scores = np.concatenate(slots), np.concatenate(scores)
+        return self._hits(slots, scores, top_k(scores, k))
+
+    def _hits(self, slots: np.ndarray, scores: np.ndarray, order: np.ndarray):
+        return [
+            {
+                "id": self.ids[slots[i]],
+                "score": float(scores[i]),
+                "payload": self.payloads[slots[i]],
+            }
+            for i in order.tolist()
+        ]
+
+    def _kmeans(self, vectors: np.ndarray, iterations: int = 10) -> np.ndarray:
+        nlist = max(1, min(int(np.sqrt(len(vectors))), len(vectors) // 39))
+        rng = np.random.default_rng(0)
+        sample = vectors
+        if len(vectors) > 256 * nlist:
+            sample = vectors[rng.choice(len(vectors), 256 * nlist, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            cells = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, cells, sample)
+            empty = np.bincount(cells, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize(sums)
+        return centroids
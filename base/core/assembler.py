@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+import tiktoken
+from attrs import define, field
+
+from base.config import settings
+from base.core.cache import LRUCache
+from base.core.context import Metadata, render_content
+from base.schema.messages import Content
+from base.schema.threads import Thread, observe
+
+# Sections are shrunk in this order: related threads first, then
+# preferences, then the current thread.
+PRIORITY = {"related": 0, "preferences": 1, "current": 2}
+ORDER = ("preferences", "related", "current")
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text, disallowed_special=()))
+
+
+def _ranks(section: str, n: int) -> range:
+    # Newer lines of the current thread rank higher; in the other sections
+    # earlier lines rank higher, matching retrieval order.
+    return range(n) if section == "current" else range(0, -n, -1)
+
+
+@define
+class Segment:
+    """One line of context with its token count computed once."""
+
+    section: str
+    text: str
+    rank: float = 0.0
+    tokens: int | None = field(default=None)
+    seq: int = field(default=0, init=False)
+    included: bool = field(default=False, init=False)
+
+    def __attrs_post_init__(self):
+        if self.tokens is None:
+            self.tokens = count_tokens(self.text)
+
+    @property
+    def key(self) -> Tuple[int, float, int]:
+        return PRIORITY.get(self.section, 0), self.rank, self.seq
+
+
+@define
+class Assembler:
+    """Selects context lines under a token budget.
+
+    Every segment is ordered by ``(section priority, rank, arrival)``; the
+    lowest keys are dropped first. ``select`` sorts once and fills the budget
+    greedily. ``append`` handles a single new message by evicting the
+    cheapest included segments from a min-heap, so a growing thread costs
+    O(log n) per message instead of a full re-selection.
+    """
+
+    budget: int = field(default=4000)
+    segments: Dict[str, List[Segment]] = field(factory=dict)
+    used: int = field(default=0, init=False)
+    _heap: List[Tuple[Tuple[int, float, int], int, Segment]] = field(factory=list, init=False)
+    _seq: itertools.count = field(factory=itertools.count, init=False)
+
+    @classmethod
+    def from_sections(cls, sections: Dict[str, List[str]], budget: int):
+        """Build from rendered sections."""
+
+        asm = cls(budget)
+        for name, lines in sections.items():
+            asm.extend(name, lines, ranks=_ranks(name, len(lines)))
+        asm.select()
+        return asm
+
+    @classmethod
+    def for_thread(
+        cls,
+        metadata: Metadata,
+        content: List[Content],
+        budget: int,
+        *,
+        preferences: Iterable[str] = (),
+        related: Iterable[Tuple[str, float]] = (),
+    ):
+        """Build from a thread: its summary always outranks its messages and
+        related threads are ranked by similarity score."""
+
+        asm = cls(budget)
+        asm.extend("preferences", preferences)
+        asm.extend("related", [t for t, _ in related], ranks=[s for _, s in related])
+        if metadata is not None and metadata.summary:
+            asm.extend("current", [f"Summary: {metadata.summary}"], ranks=[float("inf")])
+        asm.extend("current", [render_content(c) for c in content], ranks=range(len(content)))
+        asm.select()
+        return asm
+
+    def extend(self, section: str, lines: Iterable[str], ranks: Iterable[float] | None = None):
+        lines = list(lines)
+        ranks = list(ranks) if ranks is not None else [0.0] * len(lines)
+        bucket = self.segments.setdefault(section, [])
+        for text, rank in zip(lines, ranks):
+            seg = Segment(section, text, rank)
+            seg.seq = next(self._seq)
+            bucket.append(seg)
+
+    def replace(self, section: str, lines: List[str]) -> bool:
+        """Set ``section`` to ``lines``; returns whether it changed.
+
+        Segments whose text is unchanged are reused with their token counts.
+        """
+
+        bucket = self.segments.get(section, [])
+        if [s.text for s in bucket] == lines:
+            return False
+        known = {s.text: s.tokens for s in bucket}
+        self.segments[section] = []
+        for text, rank in zip(lines, _ranks(section, len(lines))):
+            seg = Segment(section, text, rank, tokens=known.get(text))
+            seg.seq = next(self._seq)
+            self.segments[section].append(seg)
+        return True
+
+    def update(self, sections: Dict[str, List[str]], budget: int):
+        """Bring ``sections`` and the budget up to date, re-selecting only on a change."""
+
+        changed = budget != self.budget
+        self.budget = budget
+        for name, lines in sections.items():
+            changed = self.replace(name, lines) or changed
+        if changed:
+            self.select()
+        return self
+
+    def select(self):
+        """Re-select from scratch: O(n log n) in the number of segments."""
+
+        pool = [s for bucket in self.segments.values() for s in bucket]
+        pool.sort(key=lambda s: s.key, reverse=True)
+        self.used, self._heap = 0, []
+        for seg in pool:
+            seg.included = self.used + seg.tokens <= self.budget
+            if seg.included:
+                self.used += seg.tokens
+                self._heap.append((seg.key, seg.seq, seg))
+        heapq.heapify(self._heap)
+        return self
+
+    def append(self, content: Content, section: str = "current") -> bool:
+        """Add one message, evicting lower-priority segments if needed.
+
+        The new message ranks above everything already in ``section``.
+        Returns whether it was included.
+        """
+
+        bucket = self.segments.setdefault(section, [])
+        seg = Segment(section, render_content(content), float(len(bucket)))
+        seg.seq = next(self._seq)
+        bucket.append(seg)
+
+        evicted, freed = [], 0
+        while self.used - freed + seg.tokens > self.budget and self._heap:
+            key, _, low = self._heap[0]
+            if not low.included:
+                heapq.heappop(self._heap)
+                continue
+            if key >= seg.key:
+                break
+            evicted.append(heapq.heappop(self._heap))
+            freed += low.tokens
+
+        if self.used - freed + seg.tokens > self.budget:
+            for item in evicted:
+                heapq.heappush(self._heap, item)
+            return False
+
+        for _, _, low in evicted:
+            low.included = False
+        self.used += seg.tokens - freed
+        seg.included = True
+        heapq.heappush(self._heap, (seg.key, seg.seq, seg))
+        return True
+
+    def sections(self) -> Dict[str, List[str]]:
+        out = {}
+        for name in sorted(self.segments, key=lambda n: ORDER.index(n) if n in ORDER else len(ORDER)):
+            lines = [s.text for s in self.segments[name] if s.included]
+            if lines:
+                out[name] = lines
+        return out
+
+    def tokens(self) -> Dict[str, int]:
+        return {
+            name: sum(s.tokens for s in bucket if s.included)
+            for name, bucket in self.segments.items()
+        }
+
+
+# One assembler per thread, so a new message costs one ``append`` and a
+# request only re-selects when another section or the budget changed.
+ASSEMBLERS = LRUCache(maxsize=settings.CONTEXT_ASSEMBLERS)
+
+
+@observe
+def _on_update(thread: Thread, content: Content, embed: List[float] | None):
+    thread_id = thread.metadata.thread_id
+    asm = ASSEMBLERS.get(thread_id) if thread_id is not None else None
+    if asm is not None:
+        asm.append(content)
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from attrs import define, field
+
+from base.helpers import hash_text
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+@define
+class LRUCache:
+    maxsize: int = field(default=10_000)
+    _data: OrderedDict = field(factory=OrderedDict, init=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def items(self):
+        return self._data.items()
+
+    def clear(self):
+        self._data.clear()
+
+
+def _stamp(key: str) -> int:
+    """Non-zero 63-bit tag of a hex ``hash_text`` key."""
+
+    return (int(key[:16], 16) >> 1) | 1
+
+
+@define
+class DiskTier:
+    """Fixed-capacity float32 vector store backed by a memory-mapped file.
+
+    ``vectors.f32`` holds ``capacity`` rows of ``dim`` floats. ``index.json``
+    maps each key to its model and row, ordered from least to most recently
+    used, and is rewritten atomically every ``sync_every`` writes and on
+    ``close``. All files are opened on first use, not on construction.
+
+    ``stamps.i64`` holds a tag of the key stored in each row. A writer
+    zeroes it, writes the row, then sets it, so a ``readonly`` tier in
+    another process can share the files: a row whose tag is not the key's
+    before and after the copy is a miss, not a wrong vector. A read-only
+    tier never writes and re-reads ``index.json`` when it changes, at most
+    every ``refresh_interval`` seconds.
+    """
+
+    path: str = field()
+    dim: int = field(default=1536)
+    capacity: int = field(default=200_000)
+    sync_every: int = field(default=1024)
+    readonly: bool = field(default=False)
+    refresh_interval: float = field(default=1.0)
+    _vectors: np.memmap = field(default=None, init=False)
+    _stamps: np.memmap = field(default=None, init=False)
+    _index: OrderedDict = field(factory=OrderedDict, init=False)
+    _free: List[int] = field(factory=list, init=False)
+    _dirty: int = field(default=0, init=False)
+    _mtime: float = field(default=0.0, init=False)
+    _checked: float = field(default=0.0, init=False)
+
+    def _open(self):
+        if self._vectors is not None:
+            return
+        if self.readonly:
+            self._open_readonly()
+            return
+        os.makedirs(self.path, exist_ok=True)
+        data = os.path.join(self.path, "vectors.f32")
+        stamps = os.path.join(self.path, "stamps.i64")
+        self._read_index()
+
+        mode = "r+" if os.path.exists(data) and self._index else "w+"
+        self._vectors = np.memmap(
+            data, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim)
+        )
+        fresh = mode == "w+" or not os.path.exists(stamps)
+        self._stamps = np.memmap(
+            stamps, dtype=np.int64, mode="w+" if fresh else "r+", shape=(self.capacity,)
+        )
+        if fresh:
+            for key, (_, slot) in self._index.items():
+                self._stamps[slot] = _stamp(key)
+        used = {slot for _, slot in self._index.values()}
+        self._free = [i for i in range(self.capacity - 1, -1, -1) if i not in used]
+
+    def _open_readonly(self):
+        data = os.path.join(self.path, "vectors.f32")
+        stamps = os.path.join(self.path, "stamps.i64")
+        if not (os.path.exists(data) and os.path.exists(stamps)):
+            return
+        self._vectors = np.memmap(
+            data, dtype=np.float32, mode="r", shape=(self.capacity, self.dim)
+        )
+        self._stamps = np.memmap(stamps, dtype=np.int64, mode="r", shape=(self.capacity,))
+        self._read_index()
+
+    def _read_index(self):
+        index = os.path.join(self.path, "index.json")
+        try:
+            mtime = os.stat(index).st_mtime
+            with open(index, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._mtime = mtime
+        if saved["dim"] == self.dim and saved["capacity"] == self.capacity:
+            self._index = OrderedDict((key, (model, slot)) for key, model, slot in saved["entries"])
+
+    def refresh(self):
+        """Pick up entries synced by the writer (read-only tiers)."""
+
+        now = time.monotonic()
+        if now - self._checked < self.refresh_interval:
+            return
+        self._checked = now
+        if self._vectors is None:
+            self._open()
+            return
+        try:
+            mtime = os.stat(os.path.join(self.path, "index.json")).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._read_index()
+
+    def __len__(self):
+        self._open()
+        return len(self._index)
+
+    def get(self, key: str) -> np.ndarray | None:
+        if self.readonly:
+            self.refresh()
+        else:
+            self._open()
+        entry = self._index.get(key)
+        if entry is None or self._vectors is None:
+            return None
+        slot, stamp = entry[1], _stamp(key)
+        if self._stamps[slot] != stamp:
+            return None
+        vector = np.array(self._vectors[slot])
+        if self._stamps[slot] != stamp:
+            return None
+        if not self.readonly:
+            self._index.move_to_end(key)
+        return vector
+
+    def put(self, key: str, model: str, vector: np.ndarray):
+        if self.readonly or vector.shape != (self.dim,):
+            return
+        self._open()
+        if key in self._index:
+            slot = self._index[key][1]
+            self._index.move_to_end(key)
+        elif self._free:
+            slot = self._free.pop()
+        else:
+            _, (_, slot) = self._index.popitem(last=False)
+
+        self._stamps[slot] = 0
+        self._vectors[slot] = vector
+        self._stamps[slot] = _stamp(key)
+        self._index[key] = (model, slot)
+        self._dirty += 1
+        if self._dirty >= self.sync_every:
+            self.sync()
+
+    def invalidate(self, model: str) -> int:
+        if self.readonly:
+            return 0
+        self._open()
+        stale = [k for k, (m, _) in self._index.items() if m == model]
+        for key in stale:
+            slot = self._index.pop(key)[1]
+            self._stamps[slot] = 0
+            self._free.append(slot)
+        if stale:
+            self.sync()
+        return len(stale)
+
+    def sync(self):
+        if self._vectors is None or self.readonly:
+            return
+        self._vectors.flush()
+        self._stamps.flush()
+        index = os.path.join(self.path, "index.json")
+        tmp = f"{index}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "dim": self.dim,
+                    "capacity": self.capacity,
+                    "entries": [[k, m, s] for k, (m, s) in self._index.items()],
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp, index)
+        self._dirty = 0
+
+    def close(self):
+        self.sync()
+
+
+@define
+class EmbeddingCache:
+    """Two-tier embedding cache keyed on ``hash_text(model, normalized text)``."""
+
+    memory: LRUCache = field(factory=LRUCache)
+    disk: DiskTier | None = field(default=None)
+    stats: Dict[str, int] = field(
+        factory=lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+    )
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hash_text(model, normalize_text(text))
+
+    def get(self, model: str, text: str) -> List[float] | None:
+        key = self.key(model, text)
+        hit: Tuple[str, np.ndarray] | None = self.memory.get(key)
+        if hit is not None:
+            self.stats["memory_hits"] += 1
+            return hit[1].tolist()
+
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.stats["disk_hits"] += 1
+                self.memory.put(key, (model, vector))
+                return vector.tolist()
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, model: str, text: str, vector: List[float]):
+        key = self.key(model, text)
+        arr = np.asarray(vector, dtype=np.float32)
+        self.memory.put(key, (model, arr))
+        if self.disk is not None:
+            self.disk.put(key, model, arr)
+
+    def invalidate(self, model: str) -> int:
+        stale = [k for k, (m, _) in self.memory.items() if m == model]
+        for key in stale:
+            self.memory.pop(key)
+        removed = len(stale)
+        if self.disk is not None:
+            removed = max(removed, self.disk.invalidate(model))
+        return removed
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "memory_size": len(self.memory),
+            "disk_size": len(self.disk) if self.disk is not None else 0,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
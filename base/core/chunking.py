@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import mmap
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+from attrs import define, field
+
+from base.config import settings
+from base.helpers import hash_text
+
+Block = Tuple[int, str]
+
+
+@define
+class DocumentChunk:
+    text: str
+    metadata: Dict[str, Any] = field(factory=dict)
+
+
+@lru_cache(maxsize=None)
+def chunker():
+    """The shared markdown chunker.
+
+    ``chonkie`` is imported here rather than at module level: it is slow to
+    import and building a chunker loads a tokenizer, which processes that
+    never chunk should not pay for.
+    """
+
+    from chonkie import RecursiveChunker
+
+    return RecursiveChunker.from_recipe("markdown")
+
+
+def read_blocks(path: str, block_size: int = settings.CHUNK_BLOCK_SIZE) -> Iterator[Block]:
+    """Yield ``(byte offset, text)`` blocks of a UTF-8 file through ``mmap``.
+
+    Blocks end on a paragraph break where possible, then on a line break,
+    and never inside a multi-byte character, so chunk boundaries rarely
+    depend on ``block_size``. Only one block is decoded at a time.
+    """
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start, size = 0, len(mm)
+            while start < size:
+                end = min(start + block_size, size)
+                if end < size:
+                    cut = mm.rfind(b"\n\n", start, end)
+                    if cut > start:
+                        end = cut + 2
+                    elif (cut := mm.rfind(b"\n", start, end)) > start:
+                        end = cut + 1
+                    else:
+                        while end > start + 1 and mm[end] & 0xC0 == 0x80:
+                            end -= 1
+                yield start, mm[start:end].decode("utf-8", errors="replace")
+                start = end
+
+
+def split_blocks(text: str, block_size: int = settings.CHUNK_BLOCK_SIZE) -> Iterator[Block]:
+    """``read_blocks`` for text already in memory; offsets are UTF-8 bytes."""
+
+    start, offset = 0, 0
+    while start < len(text):
+        end = min(start + block_size, len(text))
+        if end < len(text):
+            cut = text.rfind("\n\n", start, end)
+            if cut > start:
+                end = cut + 2
+            elif (cut := text.rfind("\n", start, end)) > start:
+                end = cut + 1
+        block = text[start:end]
+        yield offset, block
+        offset += len(block.encode("utf-8"))
+        start = end
+
+
+def stream_chunks(blocks: Iterable[Block], source: str) -> Iterator[DocumentChunk]:
+    """Chunk ``blocks`` lazily, tagging each chunk with where it came from.
+
+    ``offset`` and ``length`` are in bytes of the source; ``hash`` is the
+    SHA-256 of the chunk text.
+    """
+
+    prefix = hash_text(source)[:12]
+    i = 0
+    for offset, block in blocks:
+        pos = 0
+        for chunk in chunker().chunk(block):
+            offset += len(block[pos : chunk.start_index].encode("utf-8"))
+            pos = chunk.start_index
+            yield DocumentChunk(
+                chunk.text,
+                {
+                    "chunk_id": f"{prefix}:{i:05d}",
+                    "source": source,
+                    "index": i,
+                    "offset": offset,
+                    "length": len(chunk.text.encode("utf-8")),
+                    "hash": hash_text(chunk.text),
+                },
+            )
+            i += 1
+
+
+def chunk_file(path: str, source: str | None = None) -> Iterator[DocumentChunk]:
+    return stream_chunks(read_blocks(path), source or os.path.abspath(path))
+
+
+def chunk_markdown(input: str, source: str = "inline") -> Iterator[DocumentChunk]:
+    return stream_chunks(split_blocks(input), source)
@@ -1,9 +1,128 @@
 from __future__ import annotations
 
+import asyncio
 import random
-from typing import Any
+import re
+import time
+from typing import Any, Dict, Tuple
 
-from base.config import OPENAI_CLIENT
+from attrs import define, field
+
+from base.config import settings
+from base.core.cache import LRUCache
+from base.core.gateway import GATEWAY
+from base.core.limits import TokenBucket
+from base.helpers import hash_text
+
+PARAMETER_PROMPT = "{val} is a parameter for the following function:\n\n{obj}\n\nPlease generate a single sentence describing the parameter."
+THREAD_PROMPT = "Generate a name and description for this conversation, which is used to populate the class object's `name` and `description` fields. Simple provide a concise name in the form of a title and a one-sentence description. Return the name on the first line and the description on the second line."
+
+REASONING_MODEL = re.compile(r"o\d")
+
+
+def reasoning_model(model: str) -> bool:
+    """True for o-series models, which reject ``temperature`` and ``top_p``."""
+
+    return REASONING_MODEL.match(model) is not None
+
+
+@define
+class LimitedClient:
+    """``responses.create`` with at most ``max_inflight`` calls outstanding
+    and no more than ``rate`` calls started per second."""
+
+    client: Any = field()
+    max_inflight: int = field(default=settings.CLASSIFY_MAX_INFLIGHT)
+    rate: TokenBucket | None = field(
+        factory=lambda: TokenBucket(settings.CLASSIFY_RATE, settings.CLASSIFY_RATE)
+    )
+    stats: Dict[str, int] = field(factory=lambda: {"requests": 0, "errors": 0})
+    _slots: asyncio.Semaphore | None = field(default=None, init=False)
+
+    async def create(self, **req: Any):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_inflight)
+        async with self._slots:
+            if self.rate is not None:
+                await self.rate.acquire()
+            self.stats["requests"] += 1
+            try:
+                return await self.client.responses.create(**req)
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+
+
+@define
+class Classifier:
+    """Cached, coalescing front end for ``classify``.
+
+    Results are cached for ``ttl`` seconds in the ``cache`` LRU, keyed on
+    ``(kind, val, hash of obj)``. Concurrent calls with the same key share
+    one in-flight request. With ``deterministic`` unset, ``top_p`` and
+    ``temperature`` are sampled per request as before, and the cache keeps
+    whichever sample came back first. Neither is sent to o-series models.
+    """
+
+    client: LimitedClient = field()
+    model: str = field(default="o4-mini")
+    deterministic: bool = field(default=settings.CLASSIFY_DETERMINISTIC)
+    ttl: float = field(default=settings.CLASSIFY_CACHE_TTL)
+    cache: LRUCache = field(factory=lambda: LRUCache(settings.CLASSIFY_CACHE_SIZE))
+    stats: Dict[str, int] = field(
+        factory=lambda: {"hits": 0, "misses": 0, "coalesced": 0}
+    )
+    _inflight: Dict[Tuple, asyncio.Task] = field(factory=dict, init=False)
+
+    def request(self, obj: Any, kind: str, val: str | None = None) -> Dict[str, Any]:
+        req: Dict[str, Any] = {"model": self.model}
+        if reasoning_model(self.model):
+            sampling = {}
+        elif self.deterministic:
+            sampling = {"top_p": 1.0, "temperature": 0.0}
+        else:
+            sampling = {
+                "top_p": round(random.uniform(0.5, 1), 2),
+                "temperature": round(random.uniform(0.9, 1.7), 2),
+            }
+        req |= sampling
+        if kind == "parameter":
+            req["input"] = PARAMETER_PROMPT.format(val=val, obj=obj)
+        if kind == "thread":
+            req["input"] = f"{THREAD_PROMPT}\n\n{obj}"
+        return req
+
+    async def classify(self, obj: Any, kind: str, val: str | None = None) -> str | None:
+        key = (kind, val, hash_text(str(obj)))
+        hit = self.cache.get(key)
+        if hit is not None:
+            expires, text = hit
+            if expires > time.monotonic():
+                self.stats["hits"] += 1
+                return text
+            self.cache.pop(key)
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(self._send(key, self.request(obj, kind, val)))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # One caller giving up must not cancel the request for the others.
+        return await asyncio.shield(task)
+
+    async def _send(self, key: Tuple, req: Dict[str, Any]) -> str | None:
+        res = await self.client.create(**req)
+        text = res.output_text
+        if text is not None:
+            self.cache.put(key, (time.monotonic() + self.ttl, text))
+        return text
+
+
+CLIENT = LimitedClient(GATEWAY)
+CLASSIFIER = Classifier(CLIENT)
 
 
 async def classify(obj: Any, kind: str, /, val: str | None = None) -> str | None:
@@ -23,21 +142,14 @@ async def classify(obj: Any, kind: str, /, val: str | None = None) -> str | None
     -------
     str | None
         The generated text returned by OpenAI or ``None`` if no text
-        was produced.
+        was produced. Repeated and concurrent identical calls are served
+        by ``CLASSIFIER``.
     """
 
-    req = {
-        "model": "o4-mini",
-        "top_p": round(random.uniform(0.5, 1), 2),
-        "temperature": round(random.uniform(0.9, 1.7), 2),
-    }
-    if kind == "parameter":
-        msg = f"{val} is a parameter for the following function:\n\n{obj}\n\nPlease generate a single sentence describing the parameter."
-        req["input"] = msg
-    if kind == "thread":
-        msg = "Generate a name and description for this conversation, which is used to populate the class object's `name` and `description` fields. Simple provide a concise name in the form of a title and a one-sentence description. Return the name on the first line and the description on the second line."
-        req["input"] = f"{msg}\n\n{obj}"
-
-    res = await OPENAI_CLIENT.responses.create(**req)
-    if res.output_text is not None:
-        return res.output_text
+    return await CLASSIFIER.classify(obj, kind, val)
+
+
+async def generate(**req: Any):
+    """Send a raw ``responses.create`` request through ``GATEWAY``."""
+
+    return await GATEWAY.responses.create(**req)
@@ -6,10 +6,23 @@ from typing import List
 from attrs import define, field
 
 from base.core.classify import generate
-from base.helpers import serialize
+from base.helpers import SCHEMAS, serialize
 from base.schema.messages import Content
 
-SIMILARITY_THRESHOLD = 0.85
+
+def render_content(content: Content) -> str:
+    """Render one message as a single context line."""
+
+    if isinstance(content, bytes):
+        return content.decode("utf-8", errors="replace")
+    if isinstance(content, dict):
+        text = content.get("text", content.get("content"))
+        sender = content.get("sender") or content.get("role")
+        if isinstance(text, str):
+            return f"{sender.title()}: {text}" if sender else text
+    if isinstance(content, (dict, list)):
+        return json.dumps(content, separators=(",", ":"))
+    return str(content)
 
 
 @define
@@ -18,11 +31,13 @@ class Header:
     thread_id: str = field(default=None)
 
 
+@SCHEMAS.register
 @define
 class Metadata:
     thread_id: str = field(default=None)
     summary: str = field(default=None)
     embedding: List[float] = field(default=None)
+    events: List[dict] = field(factory=list)
 
     @classmethod
     async def metadata(cls):
@@ -50,4 +65,4 @@ class Metadata:
 class Context:
     header: Header = field(default=None)
     metadata: Metadata = field(default=None)
-    content: Content
+    content: Content = field(default=None)
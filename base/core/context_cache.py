@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+
+from attrs import define, field
+
+from base.config import redis_client, settings
+from base.core.context import render_content
+from base.schema.threads import Thread, observe
+
+SECTIONS = ("preferences", "related", "current")
+
+Builder = Callable[[str], Awaitable[List[str] | None]]
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def pack(lines: Iterable[str]) -> bytes:
+    """Encode ``lines`` as varint length-prefixed UTF-8 records.
+
+    Concatenating two packed blobs yields the packed concatenation of their
+    lines, which is what lets the cache ``APPEND`` to a section.
+    """
+
+    out = bytearray()
+    for line in lines:
+        data = line.encode("utf-8")
+        out += _varint(len(data))
+        out += data
+    return bytes(out)
+
+
+def unpack(blob: bytes | None) -> List[str]:
+    lines, i, view = [], 0, memoryview(blob or b"")
+    while i < len(view):
+        n = shift = 0
+        while True:
+            b = view[i]
+            i += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        lines.append(str(view[i : i + n], "utf-8"))
+        i += n
+    return lines
+
+
+@define
+class CachedContext:
+    thread_id: str
+    sections: Dict[str, List[str]] = field(factory=dict)
+    rebuilt: List[str] = field(factory=list)
+
+    def render(self, system: str | None = None) -> str:
+        parts = ["# Context"]
+        if system:
+            parts.append(system)
+        for title, name in (
+            ("Preferences", "preferences"),
+            ("Related Threads", "related"),
+            ("Current Thread", "current"),
+        ):
+            lines = self.sections.get(name)
+            if lines:
+                parts.append(f"## {title}\n\n" + "\n".join(lines))
+        return "\n\n".join(parts)
+
+
+@define
+class ContextCache:
+    """Read-through cache of rendered context sections keyed by thread id.
+
+    Each section is its own Redis string ``{prefix}:{thread_id}:{section}``
+    holding ``pack``-encoded lines, so sections are fetched together with one
+    ``MGET`` and invalidated independently. New messages for the current
+    thread are ``APPEND``-ed to a ``:tail`` key rather than forcing a rebuild;
+    the tail is only trusted while the section it extends is present.
+
+    A builder returns ``None`` when it has nothing to rebuild from. The
+    section is then served from what the cache still holds (the tail, for
+    ``current``) and is not written, so no appended line is dropped.
+    Without a ``redis`` client the shared ``redis_client()`` is used.
+    """
+
+    _redis: Any = field(default=None)
+    builders: Dict[str, Builder] = field(factory=dict)
+    prefix: str = field(default="ctx")
+    ttl: int = field(default=3600)
+    stats: Dict[str, int] = field(factory=lambda: {"hits": 0, "misses": 0})
+
+    @property
+    def redis(self) -> Any:
+        if self._redis is None:
+            self._redis = redis_client()
+        return self._redis
+
+    @redis.setter
+    def redis(self, client: Any):
+        self._redis = client
+
+    def _key(self, thread_id: str, section: str) -> str:
+        return f"{self.prefix}:{thread_id}:{section}"
+
+    async def get(self, thread_id: str) -> CachedContext:
+        keys = [self._key(thread_id, s) for s in SECTIONS]
+        tail = self._key(thread_id, "current:tail")
+        *blobs, tail_blob = await self.redis.mget(keys + [tail])
+
+        ctx = CachedContext(thread_id)
+        missing = []
+        for section, blob in zip(SECTIONS, blobs):
+            if blob is None:
+                missing.append(section)
+            else:
+                ctx.sections[section] = unpack(blob)
+        if "current" in ctx.sections:
+            ctx.sections["current"] += unpack(tail_blob)
+
+        if not missing:
+            self.stats["hits"] += 1
+            return ctx
+
+        self.stats["misses"] += 1
+        for section in missing:
+            builder = self.builders.get(section)
+            lines = await builder(thread_id) if builder is not None else None
+            if lines is None:
+                ctx.sections[section] = unpack(tail_blob) if section == "current" else []
+                continue
+            ctx.sections[section] = lines
+            await self.put(thread_id, section, lines)
+        ctx.rebuilt = missing
+        return ctx
+
+    async def put(self, thread_id: str, section: str, lines: List[str]):
+        await self.redis.set(self._key(thread_id, section), pack(lines), ex=self.ttl)
+        if section == "current":
+            await self.redis.delete(self._key(thread_id, "current:tail"))
+
+    async def append(self, thread_id: str, line: str):
+        tail = self._key(thread_id, "current:tail")
+        await self.redis.append(tail, pack([line]))
+        await self.redis.expire(tail, self.ttl)
+
+    async def invalidate(self, thread_id: str, *sections: str):
+        names = sections or SECTIONS
+        keys = [self._key(thread_id, s) for s in names]
+        if "current" in names:
+            keys.append(self._key(thread_id, "current:tail"))
+        await self.redis.delete(*keys)
+
+
+CONTEXT_CACHE = ContextCache(ttl=settings.CONTEXT_CACHE_TTL)
+
+
+@observe
+async def _on_update(thread: Thread, content: Any, embed: List[float] | None):
+    thread_id = thread.metadata.thread_id
+    if thread_id is None:
+        return
+    await CONTEXT_CACHE.append(thread_id, render_content(content))
+    if embed is not None:
+        await CONTEXT_CACHE.invalidate(thread_id, "related")
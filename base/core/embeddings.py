@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Set
+
+from attrs import define, field
+
+from base.core.cache import EmbeddingCache
+
+
+@define
+class EmbeddingService:
+    """Micro-batching front end for an OpenAI compatible embeddings client.
+
+    Concurrent ``embed`` calls are collected until either ``batch_size``
+    distinct inputs are pending or ``window`` seconds have passed, then sent
+    as a single ``embeddings.create`` request. Identical inputs within a batch
+    are sent once and fanned back out to every waiting caller. At most
+    ``max_inflight`` requests are outstanding at any time. When a ``cache``
+    is attached, hits are answered without joining a batch and fresh
+    vectors are written back to it.
+    """
+
+    client: Any = field(default=None)
+    model: str = field(default="text-embedding-3-small")
+    batch_size: int = field(default=256)
+    window: float = field(default=0.01)
+    max_inflight: int = field(default=4)
+    cache: EmbeddingCache | None = field(default=None)
+    stats: Dict[str, int] = field(
+        factory=lambda: {"requests": 0, "inputs": 0, "deduped": 0}
+    )
+    _pending: Dict[str, List[asyncio.Future]] = field(factory=dict, init=False)
+    _timer: asyncio.TimerHandle | None = field(default=None, init=False)
+    _tasks: Set[asyncio.Task] = field(factory=set, init=False)
+    _slots: asyncio.Semaphore | None = field(default=None, init=False)
+
+    async def embed(self, input: str) -> List[float]:
+        if self.cache is not None:
+            hit = self.cache.get(self.model, input)
+            if hit is not None:
+                return hit
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        waiters = self._pending.get(input)
+        if waiters is None:
+            self._pending[input] = [fut]
+        else:
+            waiters.append(fut)
+            self.stats["deduped"] += 1
+
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    async def embed_many(self, inputs: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.embed(i) for i in inputs)))
+
+    async def aclose(self):
+        """Send anything still pending and wait for in-flight batches."""
+
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_inflight)
+
+        inputs = list(batch)
+        try:
+            async with self._slots:
+                res = await self.client.embeddings.create(
+                    model=self.model, input=inputs
+                )
+        except Exception as exc:
+            for waiters in batch.values():
+                for fut in waiters:
+                    if not fut.done():
+                        fut.set_exception(exc)
+            return
+
+        self.stats["requests"] += 1
+        self.stats["inputs"] += len(inputs)
+        for item in res.data:
+            if self.cache is not None:
+                self.cache.put(self.model, inputs[item.index], item.embedding)
+            for fut in batch[inputs[item.index]]:
+                if not fut.done():
+                    fut.set_result(item.embedding)
+
+        for waiters in batch.values():
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_exception(RuntimeError("No embedding returned for input"))
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+import numpy as np
+from attrs import define, field
+
+from base.config import openai_client, settings
+from base.core.limits import AIMDLimiter, TokenBucket
+
+RETRY_STATUS = {408, 409, 429}
+
+
+@define
+class LatencyHistogram:
+    """Latencies in log-spaced buckets from ``base`` seconds up, each
+    ``growth`` times wider than the last."""
+
+    base: float = field(default=1e-3)
+    growth: float = field(default=1.1)
+    size: int = field(default=128)
+    count: int = field(default=0, init=False)
+    total: float = field(default=0.0, init=False)
+    counts: np.ndarray = field(default=None, init=False)
+
+    def __attrs_post_init__(self):
+        self.counts = np.zeros(self.size, dtype=np.int64)
+
+    def observe(self, seconds: float):
+        i = 0
+        if seconds > self.base:
+            i = min(self.size - 1, int(math.log(seconds / self.base, self.growth)) + 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper edge of the bucket holding the ``q`` quantile."""
+
+        if not self.count:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.counts), q * self.count))
+        return self.base * self.growth ** min(i, self.size - 1)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+@define
+class _Model:
+    bucket: TokenBucket
+    limiter: AIMDLimiter
+    latency: LatencyHistogram = field(factory=LatencyHistogram)
+    stats: Dict[str, int] = field(
+        factory=lambda: {"calls": 0, "retries": 0, "errors": 0, "hedged": 0, "hedge_wins": 0}
+    )
+
+
+def status_of(exc: BaseException) -> int | None:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def overloaded(exc: BaseException) -> bool:
+    """Errors that mean the provider wants less traffic."""
+
+    status = status_of(exc)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def retryable(exc: BaseException) -> bool:
+    status = status_of(exc)
+    if status is not None:
+        return status in RETRY_STATUS or status >= 500
+    # Connection errors and timeouts carry no status.
+    return isinstance(exc, (OSError, asyncio.TimeoutError)) or type(exc).__name__ in (
+        "APIConnectionError",
+        "APITimeoutError",
+    )
+
+
+def retry_after(exc: BaseException) -> float | None:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@define
+class _Endpoint:
+    gateway: Gateway
+    name: str
+
+    async def create(self, **req: Any):
+        fn = getattr(self.gateway.target(), self.name).create
+        return await self.gateway.call(req.get("model", "default"), fn, **req)
+
+
+@define
+class Gateway:
+    """Single path for outbound model calls.
+
+    Per model, a ``TokenBucket`` caps the call rate (``rates`` overrides
+    ``rate``) and an ``AIMDLimiter`` adapts concurrency: it grows while
+    calls succeed and halves on 429 or 5xx. Retryable failures (429, 408,
+    409, 5xx, connection errors) are retried up to ``retries`` times with
+    full-jitter exponential backoff, never sooner than a ``Retry-After``
+    header asks.
+
+    With ``hedge_quantile`` set, a call still running after that quantile of
+    the model's observed latency is duplicated once, if the model has spare
+    rate and concurrency, and the first response wins.
+
+    ``responses.create`` and ``embeddings.create`` mirror the OpenAI client,
+    so the gateway can stand in for it. Without a ``client`` the shared
+    ``openai_client()`` is used, created on the first call.
+    """
+
+    client: Any = field(default=None)
+    rate: float = field(default=settings.GATEWAY_RATE)
+    rates: Dict[str, float] = field(factory=lambda: dict(settings.GATEWAY_RATES))
+    concurrency: float = field(default=settings.GATEWAY_CONCURRENCY)
+    max_concurrency: float = field(default=settings.GATEWAY_MAX_CONCURRENCY)
+    retries: int = field(default=settings.GATEWAY_RETRIES)
+    backoff: float = field(default=settings.GATEWAY_BACKOFF)
+    max_backoff: float = field(default=20.0)
+    hedge_quantile: float | None = field(default=settings.GATEWAY_HEDGE_QUANTILE)
+    hedge_min_samples: int = field(default=50)
+    responses: _Endpoint = field(default=None, init=False)
+    embeddings: _Endpoint = field(default=None, init=False)
+    _models: Dict[str, _Model] = field(factory=dict, init=False)
+
+    def __attrs_post_init__(self):
+        self.responses = _Endpoint(self, "responses")
+        self.embeddings = _Endpoint(self, "embeddings")
+
+    def target(self) -> Any:
+        """The wrapped client with its own retries turned off."""
+
+        if self.client is None:
+            self.client = openai_client()
+        # Retries happen here, where they are visible to the limiter.
+        if getattr(self.client, "max_retries", 0) and hasattr(self.client, "with_options"):
+            self.client = self.client.with_options(max_retries=0)
+        return self.client
+
+    def model(self, name: str) -> _Model:
+        state = self._models.get(name)
+        if state is None:
+            rate = self.rates.get(name, self.rate)
+            state = self._models[name] = _Model(
+                TokenBucket(rate, max(rate, 1.0)),
+                AIMDLimiter(self.concurrency, max_limit=self.max_concurrency),
+            )
+        return state
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: state.stats
+            | {
+                "limit": state.limiter.limit,
+                "inflight": state.limiter.inflight,
+                "latency": state.latency.snapshot(),
+            }
+            for name, state in self._models.items()
+        }
+
+    async def call(self, model: str, fn: Callable[..., Awaitable[Any]], /, **req: Any):
+        state = self.model(model)
+        state.stats["calls"] += 1
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._attempt(state, fn, req)
+            except Exception as exc:
+                if attempt == self.retries or not retryable(exc):
+                    state.stats["errors"] += 1
+                    raise
+                state.stats["retries"] += 1
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+                await asyncio.sleep(max(delay, retry_after(exc) or 0.0))
+
+    async def _attempt(self, state: _Model, fn, req: Dict[str, Any]):
+        if self.hedge_quantile is None or state.latency.count < self.hedge_min_samples:
+            return await self._send(state, fn, req)
+
+        tasks = [asyncio.ensure_future(self._send(state, fn, req))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=state.latency.quantile(self.hedge_quantile))
+            if done or not (state.limiter.has_room() and state.bucket.try_acquire()):
+                return await tasks[0]
+
+            state.stats["hedged"] += 1
+            tasks.append(asyncio.ensure_future(self._send(state, fn, req, paid=True)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            state.stats["hedge_wins"] += 1
+                        return task.result()
+            # Both failed; surface the original call's error.
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _send(self, state: _Model, fn, req: Dict[str, Any], paid: bool = False):
+        if not paid:
+            await state.bucket.acquire()
+        await state.limiter.acquire()
+        start = time.perf_counter()
+        success = overload = False
+        try:
+            res = await fn(**req)
+            success = True
+            return res
+        except Exception as exc:
+            overload = overloaded(exc)
+            raise
+        finally:
+            state.limiter.release(success, overload)
+            if success:
+                state.latency.observe(time.perf_counter() - start)
+
+
+GATEWAY = Gateway()
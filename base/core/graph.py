@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+from attrs import define, field
+
+from base.config import settings
+from base.core.ann import VectorIndex
+from base.core.context_cache import CONTEXT_CACHE
+from base.core.embeddings import EmbeddingService
+from base.core.indexes import EMBEDDER
+
+log = logging.getLogger(__name__)
+
+
+@define
+class ThreadGraph:
+    """Links between thread summaries, kept up to date one summary at a time.
+
+    Every thread holds at most ``degree`` neighbors in a fixed-width row of
+    ``_neighbors`` (node slots, ``-1`` for free) and ``_scores``. Adding a
+    summary searches ``VectorIndex`` for its nearest existing summaries at
+    or above ``threshold``. Those become the new row. Each of them is also
+    offered the new node, which takes a free slot or replaces its weakest
+    link if it scores higher. No other row changes, so an insert costs one
+    search plus ``degree`` row updates whatever the size of the graph.
+
+    ``_incoming`` holds, per slot, the rows that link to it, so ``remove``
+    only visits those rows. Removed slots go on ``_free`` and are reused
+    by later inserts.
+
+    ``on_change`` is awaited with the ids whose rows changed. With ``path``
+    set, the snapshot there is loaded on first use.
+    """
+
+    degree: int = field(default=settings.GRAPH_DEGREE)
+    threshold: float = field(default=settings.GRAPH_THRESHOLD)
+    dim: int = field(default=settings.EMBED_DIMENSIONS)
+    path: str | None = field(default=None)
+    embedder: EmbeddingService = field(default=EMBEDDER)
+    on_change: Callable[[List[str]], Awaitable[Any]] | None = field(default=None)
+    ids: List[str | None] = field(factory=list, init=False)
+    summaries: List[str | None] = field(factory=list, init=False)
+    _slots: Dict[str, int] = field(factory=dict, init=False)
+    _free: List[int] = field(factory=list, init=False)
+    _incoming: List[Set[int]] = field(factory=list, init=False)
+    _neighbors: np.ndarray = field(default=None, init=False)
+    _scores: np.ndarray = field(default=None, init=False)
+    _vectors: VectorIndex = field(default=None, init=False)
+    _ready: bool = field(default=False, init=False)
+
+    def __attrs_post_init__(self):
+        self._neighbors = np.full((0, self.degree), -1, dtype=np.int32)
+        self._scores = np.zeros((0, self.degree), dtype=np.float32)
+        self._vectors = VectorIndex(dim=self.dim)
+        self._ready = self.path is None
+
+    def __len__(self):
+        self._ensure()
+        return len(self._slots)
+
+    def __contains__(self, id: str):
+        self._ensure()
+        return id in self._slots
+
+    async def link(self, id: str, summary: str) -> List[str]:
+        """Embed ``summary`` and add it; returns the ids whose links changed."""
+
+        vector = await self.embedder.embed(summary)
+        changed = self.add(id, summary, vector)
+        if self.on_change is not None and changed:
+            await self.on_change(changed)
+        return changed
+
+    def add(self, id: str, summary: str, vector: Any) -> List[str]:
+        self._ensure()
+        id = str(id)
+        if id in self._slots:
+            self.remove(id)
+        hits = [
+            (self._slots[h["id"]], h["score"])
+            for h in self._vectors.search(vector, self.degree)
+            if h["score"] >= self.threshold
+        ]
+
+        if self._free:
+            slot = self._free.pop()
+            self.ids[slot], self.summaries[slot] = id, summary
+        else:
+            slot = len(self.ids)
+            self._grow(slot + 1)
+            self.ids.append(id)
+            self.summaries.append(summary)
+            self._incoming.append(set())
+        self._slots[id] = slot
+        self._vectors.add([id], [vector])
+        for i, (other, score) in enumerate(hits):
+            self._neighbors[slot, i] = other
+            self._scores[slot, i] = score
+            self._incoming[other].add(slot)
+
+        changed = [id]
+        for other, score in hits:
+            if self._offer(other, slot, score):
+                changed.append(self.ids[other])
+        return changed
+
+    def _offer(self, row: int, slot: int, score: float) -> bool:
+        neighbors, scores = self._neighbors[row], self._scores[row]
+        free = np.flatnonzero(neighbors < 0)
+        if len(free):
+            i = int(free[0])
+        else:
+            i = int(np.argmin(scores))
+            if scores[i] >= score:
+                return False
+            self._incoming[int(neighbors[i])].discard(row)
+        neighbors[i], scores[i] = slot, score
+        self._incoming[slot].add(row)
+        return True
+
+    def remove(self, id: str) -> List[str]:
+        """Drop ``id`` and every link to it; returns the ids that lost a link."""
+
+        self._ensure()
+        slot = self._slots.pop(str(id), None)
+        if slot is None:
+            return []
+        self._vectors.delete([id])
+        rows = sorted(self._incoming[slot])
+        for row in rows:
+            hit = self._neighbors[row] == slot
+            self._neighbors[row][hit] = -1
+            self._scores[row][hit] = 0.0
+        for other in self._neighbors[slot][self._neighbors[slot] >= 0].tolist():
+            self._incoming[other].discard(slot)
+        self._neighbors[slot] = -1
+        self._scores[slot] = 0.0
+        self._incoming[slot] = set()
+        self.ids[slot] = self.summaries[slot] = None
+        self._free.append(slot)
+        return [self.ids[r] for r in rows]
+
+    def neighbors(self, id: str, fanout: int | None = None) -> List[Tuple[str, float]]:
+        self._ensure()
+        slot = self._slots.get(str(id))
+        if slot is None:
+            return []
+        return [(self.ids[s], score) for s, score in self._row(slot, fanout)]
+
+    def _row(self, slot: int, fanout: int | None) -> List[Tuple[int, float]]:
+        neighbors, scores = self._neighbors[slot], self._scores[slot]
+        order = np.argsort(-scores, kind="stable")[: fanout or self.degree]
+        return [
+            (int(neighbors[i]), float(scores[i])) for i in order.tolist() if neighbors[i] >= 0
+        ]
+
+    def expand(
+        self,
+        seeds: Iterable[str],
+        depth: int = settings.GRAPH_DEPTH,
+        fanout: int = settings.GRAPH_FANOUT,
+        limit: int = settings.GRAPH_LIMIT,
+    ) -> List[Tuple[str, float]]:
+        """Threads reachable from ``seeds`` within ``depth`` hops.
+
+        Only the ``fanout`` strongest links of a node are followed and at
+        most ``limit`` nodes are carried to the next hop, so the work is
+        bounded by ``depth * limit * fanout`` whatever the graph's size. A
+        thread's score is the best product of edge scores along a path.
+        """
+
+        self._ensure()
+        start = {self._slots[s]: 1.0 for s in map(str, seeds) if s in self._slots}
+        best: Dict[int, float] = {}
+        frontier = start
+        for _ in range(depth):
+            reached: Dict[int, float] = {}
+            for node, score in frontier.items():
+                for other, edge in self._row(node, fanout):
+                    s = score * edge
+                    if other in start or s <= best.get(other, 0.0):
+                        continue
+                    best[other] = reached[other] = s
+            frontier = dict(sorted(reached.items(), key=lambda kv: -kv[1])[:limit])
+            if not frontier:
+                break
+        ranked = sorted(best.items(), key=lambda kv: -kv[1])[:limit]
+        return [(self.ids[s], score) for s, score in ranked]
+
+    async def related(self, thread_id: str) -> List[str]:
+        """``ContextCache`` builder: summaries of the expanded threads."""
+
+        return [self.summaries[self._slots[id]] for id, _ in self.expand([thread_id])]
+
+    def save(self, path: str | None = None):
+        """Write a snapshot atomically; a graph without a path keeps none."""
+
+        self._ensure()
+        path = path or self.path
+        if path is None:
+            return
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        n = len(self.ids)
+        np.save(os.path.join(tmp, "neighbors.npy"), self._neighbors[:n])
+        np.save(os.path.join(tmp, "scores.npy"), self._scores[:n])
+        self._vectors.save(os.path.join(tmp, "vectors"))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(
+                {"degree": self.degree, "ids": self.ids, "summaries": self.summaries},
+                f,
+                separators=(",", ":"),
+            )
+
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def _read(self, path: str):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        neighbors = np.load(os.path.join(path, "neighbors.npy"))
+        if meta["degree"] != self.degree:
+            log.warning("graph at %s has degree %d, not %d; ignored", path, meta["degree"], self.degree)
+            return
+        n = len(meta["ids"])
+        self._grow(n)
+        self._neighbors[:n] = neighbors
+        self._scores[:n] = np.load(os.path.join(path, "scores.npy"))
+        self._vectors = VectorIndex.load(os.path.join(path, "vectors"))
+        self.ids, self.summaries = meta["ids"], meta["summaries"]
+        self._slots = {id: slot for slot, id in enumerate(self.ids) if id is not None}
+        self._free = [slot for slot, id in enumerate(self.ids) if id is None]
+        self._incoming = [set() for _ in range(n)]
+        for row, col in zip(*np.nonzero(neighbors >= 0)):
+            self._incoming[int(neighbors[row, col])].add(int(row))
+
+    def _ensure(self):
+        if self._ready:
+            return
+        self._ready = True
+        if self.path and os.path.exists(os.path.join(self.path, "meta.json")):
+            self._read(self.path)
+
+    def _grow(self, n: int):
+        if n <= len(self._neighbors):
+            return
+        cap = max(n, 2 * len(self._neighbors), 64)
+        neighbors = np.full((cap, self.degree), -1, dtype=np.int32)
+        neighbors[: len(self._neighbors)] = self._neighbors
+        scores = np.zeros((cap, self.degree), dtype=np.float32)
+        scores[: len(self._scores)] = self._scores
+        self._neighbors, self._scores = neighbors, scores
+
+
+async def _invalidate_related(thread_ids: List[str]):
+    for thread_id in thread_ids:
+        await CONTEXT_CACHE.invalidate(thread_id, "related")
+
+
+GRAPH = ThreadGraph(
+    path=os.path.join(settings.INDEX_DIR, "threads.graph"), on_change=_invalidate_related
+)
+CONTEXT_CACHE.builders.setdefault("related", GRAPH.related)
@@ -1,37 +1,95 @@
 from __future__ import annotations
 
+import os
+import shutil
 from typing import Any, Dict, List
 
 from attrs import define, field
-from chonkie import RecursiveChunker
 
+from base.config import settings
+from base.core.ann import VectorIndex
+from base.core.cache import DiskTier, EmbeddingCache, LRUCache
+from base.core.chunking import chunk_markdown
+from base.core.embeddings import EmbeddingService
+from base.core.gateway import GATEWAY
 
-async def embed(input: str):
-    req = {"model": "text-embedding-3-small", "input": str(input)}
-    res = await OPENAI_CLIENT.embeddings.create(**req)
-    return res.data[0].embedding
-
+EMBED_CACHE = EmbeddingCache(
+    memory=LRUCache(settings.EMBED_CACHE_MEMORY_SIZE),
+    disk=DiskTier(
+        settings.EMBED_CACHE_DIR,
+        dim=settings.EMBED_DIMENSIONS,
+        capacity=settings.EMBED_CACHE_DISK_SIZE,
+        readonly=settings.EMBED_CACHE_READONLY,
+    ),
+)
 
-def chunk_markdown(input: str):
-    chunker = RecursiveChunker().from_recipe("markdown")
-    chunks = chunker(input)
+EMBEDDER = EmbeddingService(
+    GATEWAY,
+    model=settings.EMBED_MODEL,
+    batch_size=settings.EMBED_BATCH_SIZE,
+    window=settings.EMBED_BATCH_WINDOW,
+    max_inflight=settings.EMBED_MAX_INFLIGHT,
+    cache=EMBED_CACHE,
+)
 
-    for i, chunk in enumerate(chunks):
-        chunk.metadata = {
-            "chunk_id": f"ai_text_chunk_{i+1:03d}",
-            "source": "AI overview article",
-        }
 
-    return chunks
+async def embed(input: str):
+    return await EMBEDDER.embed(str(input))
 
 
 @define
 class Indexes:
-    client: None = field(None)
-    indexes: Dict[str, Any] = field(factory=dict)
-
-    async def load_indexes(self, index_names: List[str]): ...
-    async def get_index(self, name: str): ...
-    async def delete_index(self, name: str): ...
-    async def add_records(self, records: List[Dict[str, Any]]): ...
-    async def delete_records(self, document_ids: List[str]): ...
+    """Named in-process vector indexes with on-disk snapshots.
+
+    Records are Qdrant-style dicts: ``{"id": ..., "vector": [...],
+    "payload": {...}}``. Snapshots live under ``path/<name>``.
+    """
+
+    client: None = field(default=None)
+    indexes: Dict[str, VectorIndex] = field(factory=dict)
+    path: str = field(default=settings.INDEX_DIR)
+    dim: int = field(default=settings.EMBED_DIMENSIONS)
+
+    async def load_indexes(self, index_names: List[str]):
+        for name in index_names:
+            snapshot = os.path.join(self.path, name)
+            if os.path.exists(os.path.join(snapshot, "meta.json")):
+                self.indexes[name] = VectorIndex.load(snapshot)
+            else:
+                self.indexes.setdefault(name, VectorIndex(dim=self.dim))
+        return self.indexes
+
+    async def get_index(self, name: str):
+        index = self.indexes.get(name)
+        if index is None:
+            index = self.indexes[name] = VectorIndex(dim=self.dim)
+        return index
+
+    async def delete_index(self, name: str):
+        self.indexes.pop(name, None)
+        shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    async def save_index(self, name: str):
+        os.makedirs(self.path, exist_ok=True)
+        (await self.get_index(name)).save(os.path.join(self.path, name))
+
+    async def add_records(self, records: List[Dict[str, Any]], *, index: str = "default"):
+        target = await self.get_index(index)
+        target.add(
+            [r["id"] for r in records],
+            [r["vector"] for r in records],
+            [r.get("payload") for r in records],
+        )
+
+    async def delete_records(self, document_ids: List[str], *, index: str = "default"):
+        return (await self.get_index(index)).delete(document_ids)
+
+    async def search(
+        self,
+        vector: List[float],
+        k: int = 8,
+        *,
+        index: str = "default",
+        filter: Dict[str, Any] | None = None,
+    ):
+        return (await self.get_index(index)).search(vector, k, filter=filter)
@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+from attrs import define, field
+from pydantic import ValidationError
+
+from base.config import redis_client, settings
+from base.core.embeddings import EmbeddingService
+from base.core.chunking import chunk_file, chunk_markdown
+from base.core.indexes import EMBEDDER, Indexes
+from base.core.lexical import LexicalIndex
+from base.core.snapshots import PUBLISHER, linked
+from base.core.storage import STORAGE
+from base.helpers import _json_dumps
+from base.schema.requests import IngestRequest
+
+log = logging.getLogger(__name__)
+
+Entry = Tuple[str, Dict[str, Any]]
+
+
+class Backpressure(Exception):
+    """Raised when the ingest stream holds more than ``max_backlog`` entries."""
+
+
+@define
+class IngestQueue:
+    """Producer side of the ingest stream.
+
+    Workers delete entries once they are acknowledged, so ``XLEN`` is the
+    number of requests not yet processed. The length is re-read at most every
+    ``check_interval`` seconds and counted locally in between. Without a
+    ``redis`` client the shared ``redis_client(decode_responses=True)`` is
+    used.
+    """
+
+    _redis: Any = field(default=None)
+    stream: str = field(default=settings.REDIS_STREAM_KEY)
+    max_backlog: int = field(default=settings.INGEST_MAX_BACKLOG)
+    check_interval: float = field(default=0.05)
+    _backlog: int = field(default=0, init=False)
+    _checked: float = field(default=0.0, init=False)
+
+    @property
+    def redis(self) -> Any:
+        if self._redis is None:
+            self._redis = redis_client(decode_responses=True)
+        return self._redis
+
+    @redis.setter
+    def redis(self, client: Any):
+        self._redis = client
+
+    async def backlog(self) -> int:
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._backlog = await self.redis.xlen(self.stream)
+            self._checked = now
+        return self._backlog
+
+    async def submit(self, item: Dict[str, Any]) -> str:
+        if await self.backlog() >= self.max_backlog:
+            raise Backpressure(f"{self.stream} backlog exceeds {self.max_backlog}")
+        entry_id = await self.redis.xadd(self.stream, {"body": _json_dumps(item)})
+        self._backlog += 1
+        return entry_id
+
+    async def submit_many(self, items: List[Dict[str, Any]]) -> List[str]:
+        """Queue as many of ``items`` as the backlog allows in one round trip.
+
+        Returns the ids of the accepted prefix; the rest were not queued.
+        """
+
+        room = self.max_backlog - await self.backlog()
+        items = items[: max(room, 0)]
+        if not items:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for item in items:
+                pipe.xadd(self.stream, {"body": _json_dumps(item)})
+            ids = await pipe.execute()
+        self._backlog += len(ids)
+        return ids
+
+    async def submit_stream(
+        self,
+        items: AsyncIterable[str | bytes | Dict[str, Any]],
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Validate raw items one by one and queue them ``batch_size`` at a time.
+
+        Items may be JSON strings (NDJSON lines) or dicts. Yields one result
+        per item, in input order: ``{"index", "status", "id"}`` with status
+        ``queued``, ``rejected`` (backlog full, retry later) or ``invalid``
+        (with ``error``).
+        """
+
+        results: List[Dict[str, Any]] = []
+        valid: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        index = 0
+        async for raw in items:
+            result: Dict[str, Any] = {"index": index}
+            index += 1
+            try:
+                if isinstance(raw, dict):
+                    req = IngestRequest.model_validate(raw)
+                else:
+                    req = IngestRequest.model_validate_json(raw)
+            except ValidationError as exc:
+                errors = exc.errors(include_url=False, include_context=False, include_input=False)
+                result |= {"status": "invalid", "error": errors}
+            else:
+                valid.append((result, req.model_dump(exclude_none=True)))
+            results.append(result)
+            if len(valid) >= batch_size:
+                for out in await self._flush(results, valid):
+                    yield out
+                results, valid = [], []
+        for out in await self._flush(results, valid):
+            yield out
+
+    async def _flush(self, results, valid):
+        ids = await self.submit_many([item for _, item in valid])
+        for i, (result, _) in enumerate(valid):
+            if i < len(ids):
+                result |= {"status": "queued", "id": ids[i]}
+            else:
+                result["status"] = "rejected"
+        return results
+
+
+@define
+class IngestWorker:
+    """Consumer-group worker that chunks, embeds and upserts ingest entries.
+
+    Chunks are embedded and indexed ``flush_size`` at a time as they are
+    produced, so a large document is never held in memory whole. Record ids
+    are deterministic, which makes a partially indexed retry harmless. A
+    failed batch is retried item by item so one bad entry does not hold
+    back the rest. Entries that stay unacknowledged for ``retry_idle`` ms are
+    reclaimed; after ``max_retries`` deliveries they are moved to the
+    ``dead_letter`` stream. With ``lexical`` set, chunks are also added to
+    that BM25 index.
+    """
+
+    redis: Any = field()
+    indexes: Indexes = field(factory=Indexes)
+    embedder: EmbeddingService = field(default=EMBEDDER)
+    store: Callable[[List[Dict[str, Any]]], Awaitable[Any]] | None = field(default=None)
+    lexical: LexicalIndex | None = field(default=None)
+    name: str = field(default="worker-0")
+    stream: str = field(default=settings.REDIS_STREAM_KEY)
+    group: str = field(default=settings.INGEST_GROUP)
+    dead_letter: str = field(default=settings.INGEST_DEAD_LETTER_KEY)
+    index: str = field(default="default")
+    batch_size: int = field(default=settings.INGEST_BATCH_SIZE)
+    flush_size: int = field(default=settings.EMBED_BATCH_SIZE)
+    block: int = field(default=1000)
+    max_retries: int = field(default=settings.INGEST_MAX_RETRIES)
+    retry_idle: int = field(default=settings.INGEST_RETRY_IDLE)
+    stats: Dict[str, int] = field(
+        factory=lambda: {"processed": 0, "failed": 0, "retried": 0, "dead": 0}
+    )
+
+    async def setup(self):
+        from redis.exceptions import ResponseError
+
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    async def run(self, stop: asyncio.Event | None = None):
+        await self.setup()
+        last_reclaim = 0.0
+        while stop is None or not stop.is_set():
+            if time.monotonic() - last_reclaim >= self.retry_idle / 1000:
+                await self.reclaim()
+                last_reclaim = time.monotonic()
+
+            res = await self.redis.xreadgroup(
+                self.group,
+                self.name,
+                {self.stream: ">"},
+                count=self.batch_size,
+                block=self.block,
+            )
+            for _, entries in res or []:
+                await self.process(entries)
+
+    async def reclaim(self):
+        # Redis 7 appends the ids of deleted entries; 6.2 replies with two items.
+        claimed = (
+            await self.redis.xautoclaim(
+                self.stream, self.group, self.name, self.retry_idle, count=self.batch_size
+            )
+        )[1]
+        if not claimed:
+            return
+
+        deliveries = await self._deliveries([entry_id for entry_id, _ in claimed])
+        retry, dead = [], []
+        for entry in claimed:
+            if deliveries.get(entry[0], 0) > self.max_retries:
+                dead.append(entry)
+            else:
+                retry.append(entry)
+
+        for entry_id, fields in dead:
+            await self.redis.xadd(self.dead_letter, {**fields, "source_id": entry_id})
+            await self._done([(entry_id, fields)])
+            self.stats["dead"] += 1
+        if retry:
+            self.stats["retried"] += len(retry)
+            await self.process(retry)
+
+    async def _deliveries(self, ids: List[str]) -> Dict[str, int]:
+        """Delivery count of each of ``ids``, which this worker has just claimed.
+
+        A range over the claimed ids would also return entries pending for
+        other consumers, so each id is looked up on its own, in one pipeline.
+        """
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for entry_id in ids:
+                pipe.xpending_range(
+                    self.stream, self.group, entry_id, entry_id, 1, consumername=self.name
+                )
+            pages = await pipe.execute()
+        return {p["message_id"]: p["times_delivered"] for page in pages for p in page}
+
+    async def process(self, entries: List[Entry]):
+        try:
+            await self.handle(entries)
+        except Exception:
+            if len(entries) == 1:
+                log.exception("ingest entry %s failed", entries[0][0])
+                self.stats["failed"] += 1
+                return
+            for entry in entries:
+                await self.process([entry])
+            return
+
+        await self._done(entries)
+        self.stats["processed"] += len(entries)
+
+    async def handle(self, entries: List[Entry]):
+        records = []
+        for entry_id, fields in entries:
+            item = json.loads(fields["body"])
+            payload = {k: v for k, v in item.items() if k not in ("text", "path", "spooled")}
+            if payload.get("created") is None:
+                payload["created"] = time.time()
+            for i, (text, meta) in enumerate(self._chunks(item)):
+                records.append(
+                    {
+                        "id": f"{entry_id}:{i}",
+                        "text": text,
+                        "payload": payload | meta | {"entry_id": entry_id, "text": text},
+                    }
+                )
+                if len(records) >= self.flush_size:
+                    await self._index(records)
+                    records = []
+        await self._index(records)
+
+    async def _index(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        vectors = await self.embedder.embed_many([r["text"] for r in records])
+        for record, vector in zip(records, vectors):
+            record["vector"] = vector
+        await self.indexes.add_records(records, index=self.index)
+        if self.lexical is not None:
+            self.lexical.add_records(records)
+        if self.store is not None:
+            await self.store(records)
+
+    def _chunks(self, item: Dict[str, Any]):
+        text = item.get("text") or ""
+        if item.get("path"):
+            chunks = chunk_file(item["path"], item.get("source"))
+        elif item.get("type") == "doc":
+            chunks = chunk_markdown(text, item.get("source") or "inline")
+        elif text:
+            yield text, {}
+            return
+        else:
+            return
+        for chunk in chunks:
+            yield chunk.text, chunk.metadata
+
+    async def _done(self, entries: List[Entry]):
+        """Acknowledge and delete ``entries``, then their spooled uploads."""
+
+        ids = [entry_id for entry_id, _ in entries]
+        await self.redis.xack(self.stream, self.group, *ids)
+        await self.redis.xdel(self.stream, *ids)
+        for _, fields in entries:
+            item = json.loads(fields["body"])
+            if item.get("spooled") and item.get("path"):
+                try:
+                    os.remove(item["path"])
+                except FileNotFoundError:
+                    pass
+
+
+async def store_records(records: List[Dict[str, Any]]):
+    """``IngestWorker.store`` that keeps every indexed chunk in ``messages``."""
+
+    await STORAGE.upsert_messages(
+        [
+            {
+                "id": r["id"],
+                "thread_id": r["payload"].get("thread_id") or "",
+                "kind": r["payload"].get("type") or "message",
+                "content": r["payload"],
+                "created": r["payload"]["created"],
+            }
+            for r in records
+        ]
+    )
+
+
+QUEUE = IngestQueue()
+
+
+async def serve(consumers: int, stop: asyncio.Event | None = None):
+    """Run ``consumers`` workers in this process until ``stop`` is set."""
+
+    from redis.asyncio import Redis
+
+    redis = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    indexes = Indexes()
+    await indexes.load_indexes(["default"])
+    await STORAGE.init()
+    lexical = LexicalIndex(path=os.path.join(indexes.path, "default.bm25"))
+    workers = [
+        IngestWorker(
+            redis,
+            indexes,
+            store=store_records,
+            lexical=lexical,
+            name=f"{socket.gethostname()}-{i}",
+        )
+        for i in range(consumers)
+    ]
+    stop = stop or asyncio.Event()
+
+    async def snapshot():
+        while not stop.is_set():
+            await asyncio.sleep(settings.INGEST_SNAPSHOT_INTERVAL)
+            await save()
+
+    async def save():
+        await indexes.save_index("default")
+        lexical.save()
+        PUBLISHER.publish(
+            {
+                "default": linked(os.path.join(indexes.path, "default")),
+                "default.bm25": linked(lexical.path),
+            }
+        )
+
+    tasks = [asyncio.create_task(w.run(stop)) for w in workers]
+    tasks.append(asyncio.create_task(snapshot()))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await save()
+        await redis.aclose()
+        await STORAGE.aclose()
+
+
+def run_pool(consumers: int = 4):
+    """Run ``consumers`` workers in one process until interrupted.
+
+    The ``default`` index is private to the process and saved to fixed
+    paths, which the read-only retrieval workers follow, so one ingest
+    process runs per host. Scale with ``consumers``, or with more hosts in
+    the same consumer group.
+    """
+
+    asyncio.run(serve(consumers))
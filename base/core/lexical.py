@@ -0,0 +1,455 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from attrs import define, field
+
+from base.config import settings
+from base.core.ann import PayloadIndex
+from base.core.context import render_content
+from base.core.similarity import top_k
+from base.schema.threads import Thread, observe
+
+TOKEN = re.compile(r"[A-Za-z0-9_]+(?:[.:/\-][A-Za-z0-9_]+)*")
+SEPARATORS = re.compile(r"[._:/\-]+")
+CAMEL = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word and identifier tokens.
+
+    Compound identifiers are kept whole and also split into their parts, so
+    ``ERR_CONN_RESET`` yields ``err_conn_reset``, ``err``, ``conn`` and
+    ``reset``, and ``getUserById`` yields ``getuserbyid`` plus
+    ``get``/``user``/``by``/``id``.
+    """
+
+    out = []
+    for m in TOKEN.finditer(text):
+        token = m.group()
+        out.append(token.lower())
+        parts = [p for piece in SEPARATORS.split(token) for p in CAMEL.findall(piece)]
+        if len(parts) > 1:
+            out.extend(p.lower() for p in parts)
+    return out
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """LEB128-encode non-negative integers."""
+
+    if len(values) <= 16:
+        # Short lists (most postings appends) are cheaper without numpy.
+        out = bytearray()
+        for v in values:
+            v = int(v)
+            while v >= 0x80:
+                out.append((v & 0x7F) | 0x80)
+                v >>= 7
+            out.append(v)
+        return bytes(out)
+
+    values = np.asarray(values, dtype=np.int64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> 7
+    while rest.any():
+        sizes += rest > 0
+        rest >>= 7
+    starts = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for g in range(int(sizes.max())):
+        pick = sizes > g
+        byte = (values[pick] >> (7 * g)) & 0x7F
+        more = (sizes[pick] - 1 > g).astype(np.int64) << 7
+        out[starts[pick] + g] = byte | more
+    return out.tobytes()
+
+
+def decode_varints(buf: Any) -> np.ndarray:
+    buf = np.frombuffer(buf, dtype=np.uint8) if isinstance(buf, (bytes, bytearray)) else buf
+    if not len(buf):
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shift = np.arange(len(buf)) - np.repeat(starts, ends - starts + 1)
+    parts = (buf & 0x7F).astype(np.int64) << (7 * shift)
+    return np.add.reduceat(parts, starts)
+
+
+@define
+class _Postings:
+    """Doc-gap and term-frequency varint pairs for one term.
+
+    ``base`` is the part loaded from a snapshot (possibly memory-mapped)
+    and ``base_last`` its last slot; new postings are appended to ``tail``,
+    whose first gap counts from ``base_last``. Slots only ever grow, so the
+    gaps stay non-negative.
+    """
+
+    base: np.ndarray | None = None
+    tail: bytearray = field(factory=bytearray)
+    last: int = -1
+    base_last: int = -1
+
+    def append(self, slot: int, tf: int):
+        self.tail += encode_varints([slot - self.last, tf])
+        self.last = slot
+
+    def raw(self) -> np.ndarray:
+        tail = np.frombuffer(self.tail, dtype=np.uint8)
+        return tail if self.base is None else np.concatenate([self.base, tail])
+
+    def decode(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Base and tail are decoded apart, so a query never copies the
+        # mapped postings just to join them to a few appended bytes.
+        values = decode_varints(np.frombuffer(self.tail, dtype=np.uint8))
+        docs, tfs = np.cumsum(values[0::2]) + self.base_last, values[1::2]
+        if self.base is None:
+            return docs, tfs
+        values = decode_varints(self.base)
+        if not len(docs):
+            return np.cumsum(values[0::2]) - 1, values[1::2]
+        return (
+            np.concatenate([np.cumsum(values[0::2]) - 1, docs]),
+            np.concatenate([values[1::2], tfs]),
+        )
+
+
+@define
+class LexicalIndex:
+    """In-process BM25 index over short texts with compressed postings.
+
+    Documents get increasing slots, so every term's postings list stays
+    sorted and an insert is one varint append per distinct term. Deletes are
+    tombstones; document frequencies are counted over live postings at query
+    time, and the postings are rewritten once more than ``compact_ratio``
+    of the slots are dead. Payloads are filtered the same way as in
+    ``VectorIndex``.
+
+    With ``path`` set, the snapshot there is loaded on first use.
+    """
+
+    k1: float = field(default=1.2)
+    b: float = field(default=0.75)
+    path: str | None = field(default=None)
+    compact_ratio: float = field(default=0.2)
+    unindexed: Tuple[str, ...] = field(default=("text",))
+    ids: List[str | None] = field(factory=list, init=False)
+    payloads: List[Dict[str, Any] | None] = field(factory=list, init=False)
+    _slots: Dict[str, int] = field(factory=dict, init=False)
+    _lengths: np.ndarray = field(default=None, init=False)
+    _alive: np.ndarray = field(default=None, init=False)
+    _terms: Dict[str, _Postings] = field(factory=dict, init=False)
+    _filters: PayloadIndex = field(default=None, init=False)
+    _total: int = field(default=0, init=False)
+    _ready: bool = field(default=False, init=False)
+
+    def __attrs_post_init__(self):
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._filters = PayloadIndex(self.unindexed)
+        self._ready = self.path is None
+
+    def __len__(self):
+        self._ensure()
+        return len(self._slots)
+
+    def __contains__(self, id: str):
+        self._ensure()
+        return id in self._slots
+
+    @property
+    def dead(self) -> int:
+        return len(self.ids) - len(self._slots)
+
+    def add(self, id: str, text: str, payload: Dict[str, Any] | None = None):
+        self._ensure()
+        id = str(id)
+        if id in self._slots:
+            self.delete([id])
+        tokens = tokenize(text)
+        slot = len(self.ids)
+        self._grow(slot + 1)
+        self.ids.append(id)
+        self.payloads.append(payload)
+        self._slots[id] = slot
+        self._alive[slot] = True
+        self._lengths[slot] = len(tokens)
+        self._total += len(tokens)
+        self._filters.add(slot, payload)
+        for term, tf in Counter(tokens).items():
+            postings = self._terms.get(term)
+            if postings is None:
+                postings = self._terms[term] = _Postings()
+            postings.append(slot, tf)
+
+    def add_records(self, records: Iterable[Dict[str, Any]]):
+        """Add Qdrant-style records whose text is in ``text``.
+
+        Postings are grouped per term and encoded once for the whole batch,
+        which is much faster than ``add`` in a loop for bulk builds.
+        """
+
+        self._ensure()
+        batch = {str(r["id"]): r for r in records}
+        self.delete([id for id in batch if id in self._slots])
+        start = len(self.ids)
+        self._grow(start + len(batch))
+        pending: Dict[str, List[int]] = {}
+        for slot, (id, r) in enumerate(batch.items(), start):
+            tokens = tokenize(r["text"])
+            payload = r.get("payload")
+            self.ids.append(id)
+            self.payloads.append(payload)
+            self._slots[id] = slot
+            self._alive[slot] = True
+            self._lengths[slot] = len(tokens)
+            self._total += len(tokens)
+            self._filters.add(slot, payload)
+            for term, tf in Counter(tokens).items():
+                pending.setdefault(term, []).extend((slot, tf))
+
+        for term, pairs in pending.items():
+            postings = self._terms.get(term)
+            if postings is None:
+                postings = self._terms[term] = _Postings()
+            last = postings.last
+            for i in range(0, len(pairs), 2):
+                pairs[i], last = pairs[i] - last, pairs[i]
+            postings.tail += encode_varints(pairs)
+            postings.last = last
+
+    def delete(self, ids: Iterable[str]) -> int:
+        self._ensure()
+        removed = 0
+        for id in list(ids):
+            slot = self._slots.pop(str(id), None)
+            if slot is None:
+                continue
+            self._alive[slot] = False
+            self._total -= int(self._lengths[slot])
+            self._filters.remove(slot, self.payloads[slot])
+            self.ids[slot] = self.payloads[slot] = None
+            removed += 1
+        if removed and self.dead > self.compact_ratio * max(len(self.ids), 1):
+            self.rebuild()
+        return removed
+
+    def search(
+        self, query: str, k: int = 8, *, filter: Dict[str, Any] | None = None
+    ) -> List[Dict[str, Any]]:
+        self._ensure()
+        if not self._slots:
+            return []
+        n = len(self.ids)
+        alive = self._alive[:n]
+        allowed = None
+        if filter:
+            slots = self._filters.match(filter, alive)
+            if not len(slots):
+                return []
+            allowed = np.zeros(n, dtype=bool)
+            allowed[slots] = True
+
+        total_docs = len(self._slots)
+        avgdl = max(self._total / total_docs, 1e-9)
+        docs_all, scores_all = [], []
+        for term in dict.fromkeys(tokenize(query)):
+            postings = self._terms.get(term)
+            if postings is None:
+                continue
+            docs, tfs = postings.decode()
+            keep = alive[docs]
+            docs, tfs = docs[keep], tfs[keep].astype(np.float64)
+            df = len(docs)
+            if allowed is not None:
+                keep = allowed[docs]
+                docs, tfs = docs[keep], tfs[keep]
+            if not len(docs):
+                continue
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[docs] / avgdl)
+            docs_all.append(docs)
+            scores_all.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not docs_all:
+            return []
+
+        docs, inverse = np.unique(np.concatenate(docs_all), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(scores_all))
+        return [
+            {
+                "id": self.ids[docs[i]],
+                "score": float(scores[i]),
+                "payload": self.payloads[docs[i]],
+            }
+            for i in top_k(scores, k).tolist()
+        ]
+
+    async def rank(
+        self, text: str, vector: Any, k: int, filter: Dict[str, Any] | None
+    ) -> List[Dict[str, Any]]:
+        """``Retriever`` ranker signature; the query vector is unused."""
+
+        return self.search(text, k, filter=filter)
+
+    def rebuild(self):
+        """Drop tombstones and renumber the live documents."""
+
+        n = len(self.ids)
+        live = np.flatnonzero(self._alive[:n])
+        remap = np.full(n, -1, dtype=np.int64)
+        remap[live] = np.arange(len(live))
+
+        terms = {}
+        for term, postings in self._terms.items():
+            docs, tfs = postings.decode()
+            keep = remap[docs] >= 0
+            if not keep.any():
+                continue
+            docs, tfs = remap[docs[keep]], tfs[keep]
+            gaps = np.diff(docs, prepend=-1)
+            pairs = np.empty(2 * len(docs), dtype=np.int64)
+            pairs[0::2], pairs[1::2] = gaps, tfs
+            terms[term] = _Postings(None, bytearray(encode_varints(pairs)), int(docs[-1]))
+
+        ids = [self.ids[s] for s in live.tolist()]
+        payloads = [self.payloads[s] for s in live.tolist()]
+        lengths = self._lengths[live]
+        self.ids, self.payloads, self._terms = ids, payloads, terms
+        self._slots = {id: slot for slot, id in enumerate(ids)}
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._filters = PayloadIndex(self.unindexed)
+        self._grow(len(ids))
+        self._lengths[: len(ids)] = lengths
+        self._alive[: len(ids)] = True
+        for slot, payload in enumerate(payloads):
+            self._filters.add(slot, payload)
+
+    def save(self, path: str | None = None):
+        """Write a compacted snapshot directory atomically.
+
+        ``postings.npy`` holds every term's varint pairs back to back;
+        ``offsets.npy`` and ``last.npy`` locate each term's bytes and its
+        last slot, in the order of ``terms`` in ``meta.json``.
+        """
+
+        self._ensure()
+        path = path or self.path
+        if self.dead:
+            self.rebuild()
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        terms = list(self._terms)
+        chunks = [self._terms[t].raw() for t in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in chunks], out=offsets[1:])
+        blob = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8)
+        np.save(os.path.join(tmp, "postings.npy"), blob)
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp, "last.npy"), np.array([self._terms[t].last for t in terms]))
+        np.save(os.path.join(tmp, "lengths.npy"), self._lengths[: len(self.ids)])
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "k1": self.k1,
+                    "b": self.b,
+                    "terms": terms,
+                    "ids": self.ids,
+                    "payloads": self.payloads,
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, *, mmap: bool = True, **kwargs):
+        """Load a snapshot; with ``mmap`` postings are read from disk on use."""
+
+        index = cls(path=path, **kwargs)
+        index._ready = True
+        index._read(path, mmap)
+        return index
+
+    def _read(self, path: str, mmap: bool = True):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        blob = np.load(os.path.join(path, "postings.npy"), mmap_mode="r" if mmap else None)
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        last = np.load(os.path.join(path, "last.npy")).tolist()
+        lengths = np.load(os.path.join(path, "lengths.npy"))
+
+        self.k1, self.b = meta["k1"], meta["b"]
+        self._terms = {
+            term: _Postings(blob[offsets[i] : offsets[i + 1]], bytearray(), last[i], last[i])
+            for i, term in enumerate(meta["terms"])
+        }
+        n = len(meta["ids"])
+        self._grow(n)
+        self._lengths[:n] = lengths
+        self._alive[:n] = True
+        self._total = int(lengths.sum())
+        for slot, (id, payload) in enumerate(zip(meta["ids"], meta["payloads"])):
+            self.ids.append(id)
+            self.payloads.append(payload)
+            self._slots[id] = slot
+            self._filters.add(slot, payload)
+
+    def _ensure(self):
+        if self._ready:
+            return
+        self._ready = True
+        if os.path.exists(os.path.join(self.path, "meta.json")):
+            self._read(self.path)
+
+    def _grow(self, n: int):
+        if n <= len(self._alive):
+            return
+        cap = max(n, 2 * len(self._alive), 64)
+        alive = np.zeros(cap, dtype=bool)
+        alive[: len(self._alive)] = self._alive
+        lengths = np.zeros(cap, dtype=np.int32)
+        lengths[: len(self._lengths)] = self._lengths
+        self._alive, self._lengths = alive, lengths
+        self._filters.grow(cap)
+
+
+def lexical_ranker(*indexes: LexicalIndex):
+    """A ``Retriever`` ranker over several lexical indexes, merged by score."""
+
+    async def rank(text: str, vector: Any, k: int, filter: Dict[str, Any] | None):
+        hits = [h for index in indexes for h in index.search(text, k, filter=filter)]
+        hits.sort(key=lambda h: h["score"], reverse=True)
+        return hits[:k]
+
+    return rank
+
+
+LEXICAL = LexicalIndex(path=os.path.join(settings.INDEX_DIR, "messages.bm25"))
+
+
+@observe
+def _on_update(thread: Thread, content: Any, embed: List[float] | None):
+    thread_id = thread.metadata.thread_id
+    if thread_id is None:
+        return
+    text = render_content(content)
+    payload = {"thread_id": thread_id, "type": "message", "created": thread.touched, "text": text}
+    LEXICAL.add(f"{thread_id}:{len(thread.content) - 1}", text, payload)
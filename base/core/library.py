@@ -1,22 +1,154 @@
 from __future__ import annotations
 
 import json
-from typing import Callable, Dict
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List
 
-from attrs import define, field
+from attrs import define, field, frozen
+
+from base.config import settings
+from base.core.lexical import LexicalIndex
+
+log = logging.getLogger(__name__)
+
+
+@frozen
+class Instruction:
+    name: str
+    content: str
+    category: str | None = None
+    version: int = 1
+
+
+@frozen
+class _Snapshot:
+    mtime: float
+    versions: Dict[str, Dict[int, Instruction]]
+    latest: Dict[str, Instruction]
+    index: LexicalIndex
+
+
+def _build(path: str, mtime: float) -> _Snapshot:
+    with open(path, "r") as f:
+        items = json.load(f)
+
+    versions: Dict[str, Dict[int, Instruction]] = {}
+    for item in items:
+        inst = Instruction(
+            item["name"].lower(),
+            item["content"],
+            item.get("category"),
+            int(item.get("version", 1)),
+        )
+        versions.setdefault(inst.name, {})[inst.version] = inst
+    latest = {name: by[max(by)] for name, by in versions.items()}
+
+    index = LexicalIndex()
+    index.add_records(
+        {
+            "id": inst.name,
+            "text": f"{inst.name.replace('_', ' ')} {inst.content}",
+            "payload": {"category": inst.category} if inst.category else {},
+        }
+        for inst in latest.values()
+    )
+    return _Snapshot(mtime, versions, latest, index)
+
+
+@define
+class InstructionLibrary:
+    """Instructions from ``path``, indexed by name and searchable.
+
+    Each entry has a ``name`` and ``content`` and may set ``category`` and
+    ``version``; lookups return the highest version unless one is asked for.
+    The file is parsed into an immutable snapshot holding the name map and
+    a BM25 index over the latest versions. At most every ``check_interval``
+    seconds a read compares the file's mtime; a changed file is rebuilt on a
+    background thread while readers keep using the current snapshot, which
+    is then swapped in whole.
+    """
+
+    path: str = field(default=settings.INSTRUCTIONS_PATH)
+    check_interval: float = field(default=settings.INSTRUCTIONS_CHECK_INTERVAL)
+    _snapshot: _Snapshot | None = field(default=None, init=False)
+    _checked: float = field(default=0.0, init=False)
+    _reloading: threading.Lock = field(factory=threading.Lock, init=False)
+
+    def _current(self) -> _Snapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._reloading:
+                if self._snapshot is None:
+                    self._snapshot = _build(self.path, os.stat(self.path).st_mtime)
+            return self._snapshot
+
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                return snapshot
+            if mtime != snapshot.mtime and self._reloading.acquire(blocking=False):
+                threading.Thread(target=self._reload, args=(mtime,), daemon=True).start()
+        return snapshot
+
+    def _reload(self, mtime: float):
+        try:
+            self._snapshot = _build(self.path, mtime)
+        except Exception:
+            # A half-written file; the next check tries again.
+            log.exception("reloading %s failed", self.path)
+        finally:
+            self._reloading.release()
+
+    def reload(self):
+        """Rebuild synchronously."""
+
+        with self._reloading:
+            self._snapshot = _build(self.path, os.stat(self.path).st_mtime)
+
+    def __len__(self):
+        return len(self._current().latest)
+
+    def names(self) -> List[str]:
+        return list(self._current().latest)
+
+    def get(self, name: str, version: int | None = None) -> Instruction | None:
+        snapshot = self._current()
+        if version is None:
+            return snapshot.latest.get(name.lower())
+        return snapshot.versions.get(name.lower(), {}).get(version)
+
+    def versions(self, name: str) -> List[int]:
+        return sorted(self._current().versions.get(name.lower(), {}))
+
+    def search(self, query: str, category: str | None = None, k: int = 5) -> List[Instruction]:
+        snapshot = self._current()
+        filter = {"category": category} if category else None
+        hits = snapshot.index.search(query, k, filter=filter)
+        return [snapshot.latest[h["id"]] for h in hits]
+
+
+INSTRUCTIONS = InstructionLibrary()
 
 
 def load_instructions(name: str):
-    with open("config/instructions.json", "r") as f:
-        content = f.read()
-        for i in json.loads(content):
-            if i.get("name") == name.lower():
-                return i.get("content")
+    inst = INSTRUCTIONS.get(name)
+    if inst is not None:
+        return inst.content
 
 
 @define
 class Library:
     preferences: Dict[str, Callable] = field(factory=dict)
+    instructions: InstructionLibrary = field(default=INSTRUCTIONS)
+
+    async def load(self, id: str) -> Instruction | None:
+        return self.instructions.get(id)
 
-    async def load(self, id: str): ...
-    async def search(self, query: str, category: str): ...
+    async def search(self, query: str, category: str | None = None) -> List[Instruction]:
+        return self.instructions.search(query, category)
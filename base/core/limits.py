@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+
+from attrs import define, field
+
+
+@define
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, bursting to ``capacity``."""
+
+    rate: float = field(default=10.0)
+    capacity: float = field(default=10.0)
+    _tokens: float = field(default=None, init=False)
+    _updated: float = field(factory=time.monotonic, init=False)
+    _lock: asyncio.Lock = field(factory=asyncio.Lock, init=False)
+
+    def __attrs_post_init__(self):
+        self._tokens = self.capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, n: float = 1.0) -> bool:
+        self._refill()
+        if self._tokens >= n:
+            self._tokens -= n
+            return True
+        return False
+
+    async def acquire(self, n: float = 1.0):
+        async with self._lock:
+            while not self.try_acquire(n):
+                await asyncio.sleep((n - self._tokens) / self.rate)
+
+
+@define
+class AIMDLimiter:
+    """Adaptive concurrency limit.
+
+    Each success raises ``limit`` by ``increase / limit`` (about ``increase``
+    per window of calls); an overload signal multiplies it by ``decrease``,
+    at most once per ``cooldown`` seconds so one burst of rejections counts
+    once.
+    """
+
+    limit: float = field(default=8.0)
+    min_limit: float = field(default=1.0)
+    max_limit: float = field(default=64.0)
+    increase: float = field(default=1.0)
+    decrease: float = field(default=0.5)
+    cooldown: float = field(default=1.0)
+    inflight: int = field(default=0, init=False)
+    _waiters: deque = field(factory=deque, init=False)
+    _decreased: float = field(default=0.0, init=False)
+
+    def has_room(self) -> bool:
+        return self.inflight < int(self.limit)
+
+    def try_acquire(self) -> bool:
+        if self.has_room() and not self._waiters:
+            self.inflight += 1
+            return True
+        return False
+
+    async def acquire(self):
+        while not self.try_acquire():
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+                else:
+                    self._wake()
+                raise
+            if self.has_room():
+                self.inflight += 1
+                return
+
+    def release(self, success: bool = True, overloaded: bool = False):
+        self.inflight -= 1
+        if overloaded:
+            now = time.monotonic()
+            if now - self._decreased >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._decreased = now
+        elif success:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        self._wake()
+
+    def _wake(self):
+        room = int(self.limit) - self.inflight
+        while room > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                room -= 1
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+from attrs import define, field
+
+from base.config import settings
+from base.core.classify import generate
+from base.core.embeddings import EmbeddingService
+from base.core.indexes import EMBEDDER
+from base.core.similarity import VectorMatrix
+from base.helpers import _json_dumps
+
+
+Extractor = Callable[[Dict[str, str], str], Awaitable[Dict[str, str]]]
+
+EXTRACT_PROMPT = (
+    "You maintain a user's preferences (language, tone, style, formatting, habits and "
+    "similar). Given the current preferences and a new excerpt of conversation, return "
+    "the complete updated preferences as a JSON object mapping short snake_case names "
+    "to concise values. Keep entries the excerpt does not contradict; drop entries it "
+    "clearly revokes.\n\nCurrent preferences:\n{current}\n\nConversation:\n{text}"
+)
+
+
+async def extract_preferences(current: Dict[str, str], text: str) -> Dict[str, str]:
+    res = await generate(
+        model=settings.PREFERENCES_MODEL,
+        input=EXTRACT_PROMPT.format(current=_json_dumps(current), text=text),
+        text={"format": {"type": "json_object"}},
+    )
+    data = json.loads(res.output_text or "{}")
+    return {str(k): str(v) for k, v in data.items() if v not in (None, "")}
+
+
+def diff(old: Dict[str, str], new: Dict[str, str]) -> Dict[str, Any]:
+    """Added, changed (``[old, new]``) and removed preference names."""
+
+    return {
+        "added": {k: v for k, v in new.items() if k not in old},
+        "changed": {k: [old[k], v] for k, v in new.items() if k in old and old[k] != v},
+        "removed": [k for k in old if k not in new],
+    }
+
+
+def _normalize(vector: Any) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+@define
+class Preference:
+    value: str
+    centroid: np.ndarray
+    weight: int = field(default=1)
+
+    def absorb(self, vector: np.ndarray):
+        """Fold a slice embedding into the running mean."""
+
+        self.weight += 1
+        self.centroid = _normalize(self.centroid + (vector - self.centroid) / self.weight)
+
+
+@define
+class UserPreferences:
+    """A user's preferences; ``seed`` is the centroid of the slices seen
+    while there were none, so those do not all go to the extractor."""
+
+    items: Dict[str, Preference] = field(factory=dict)
+    version: int = field(default=0)
+    history: List[Dict[str, Any]] = field(factory=list)
+    lines: List[str] = field(factory=list)
+    seed: Preference | None = field(default=None)
+    _centroids: VectorMatrix | None = field(default=None, init=False, repr=False)
+    _rows: Dict[str, int] = field(factory=dict, init=False, repr=False)
+
+    def values(self) -> Dict[str, str]:
+        return {name: p.value for name, p in self.items.items()}
+
+    def render(self):
+        """Rebuild ``lines`` after ``items`` changed; centroids follow lazily."""
+
+        self.lines = [f"{name}: {p.value}" for name, p in sorted(self.items.items())]
+        self._centroids = None
+
+    def centroids(self, dim: int) -> VectorMatrix:
+        if self._centroids is None:
+            self._centroids = VectorMatrix(dim=dim)
+            self._rows = {name: row for row, name in enumerate(self.items)}
+            if self.items:
+                self._centroids.add(self.items, [p.centroid for p in self.items.values()])
+        return self._centroids
+
+    def absorb(self, name: str | None, vector: np.ndarray) -> Preference:
+        """Fold ``vector`` into preference ``name``, or into ``seed`` for None."""
+
+        if name is None:
+            if self.seed is None:
+                self.seed = Preference("", vector.copy())
+            else:
+                self.seed.absorb(vector)
+            return self.seed
+        preference = self.items[name]
+        preference.absorb(vector)
+        if self._centroids is not None:
+            self._centroids.update(self._rows[name], preference.centroid)
+        return preference
+
+
+@define
+class PreferenceStore:
+    """Per-user preferences, re-extracted only when a conversation drifts.
+
+    Every preference keeps the normalized mean embedding of the conversation
+    slices that supported it. A new slice is embedded and compared with the
+    user's centroids, or with their ``seed`` while they have none. When it
+    is within ``threshold`` cosine distance of the nearest one, it is folded
+    into that centroid and no model call is made. Otherwise ``extract``
+    rewrites the preferences and the new version's diff is appended to
+    ``journal``. Absorbed centroids are only kept in memory; after
+    ``snapshot_every`` changes, and on ``save()``, the journal is replaced
+    by one snapshot line per user.
+
+    ``lines(user)`` returns the rendered preferences for ``/context`` from
+    memory; they are rebuilt only when a version changes.
+    """
+
+    embedder: EmbeddingService = field(default=EMBEDDER)
+    extract: Extractor = field(default=extract_preferences)
+    journal: str | None = field(default=settings.PREFERENCES_JOURNAL)
+    threshold: float = field(default=settings.PREFERENCES_THRESHOLD)
+    history: int = field(default=settings.PREFERENCES_HISTORY)
+    snapshot_every: int = field(default=settings.PREFERENCES_SNAPSHOT_EVERY)
+    stats: Dict[str, int] = field(
+        factory=lambda: {"slices": 0, "skipped": 0, "extracted": 0, "versions": 0}
+    )
+    _users: Dict[str, UserPreferences] = field(factory=dict, init=False)
+    _locks: Dict[str, asyncio.Lock] = field(factory=dict, init=False)
+    _loaded: bool = field(default=False, init=False)
+    _io: asyncio.Lock = field(factory=asyncio.Lock, init=False)
+    _pending: int = field(default=0, init=False)
+
+    def get(self, user: str) -> UserPreferences:
+        self.load()
+        return self._users.get(user) or UserPreferences()
+
+    def lines(self, user: str) -> List[str]:
+        return self.get(user).lines
+
+    async def observe(self, user: str, text: str) -> Dict[str, Any]:
+        """Feed a conversation slice; extract only if it drifts."""
+
+        self.load()
+        self.stats["slices"] += 1
+        vector = _normalize(await self.embedder.embed(text))
+        lock = self._locks.setdefault(user, asyncio.Lock())
+        async with lock:
+            state = self._users.setdefault(user, UserPreferences())
+            nearest, distance = self._nearest(state, vector)
+            if distance is not None and distance <= self.threshold:
+                state.absorb(nearest, vector)
+                self.stats["skipped"] += 1
+                await self._changed()
+                return {"version": state.version, "extracted": False, "distance": distance}
+
+            self.stats["extracted"] += 1
+            old = state.values()
+            new = await self.extract(old, text)
+            change = diff(old, new)
+            if not any(change.values()):
+                # Nothing new: similar slices skip the model next time.
+                state.absorb(nearest, vector)
+                await self._changed()
+                return {"version": state.version, "extracted": True, "distance": distance}
+
+            for name in change["removed"]:
+                del state.items[name]
+            for name in (*change["added"], *change["changed"]):
+                state.items[name] = Preference(new[name], vector.copy())
+            await self._commit(user, state, change, vector)
+            return {
+                "version": state.version,
+                "extracted": True,
+                "distance": distance,
+                "diff": change,
+            }
+
+    def _nearest(self, state: UserPreferences, vector: np.ndarray):
+        best = state.centroids(vector.shape[0]).top_k(vector, 1)
+        if best:
+            name, score = best[0]
+            return name, 1.0 - score
+        if state.seed is not None:
+            return None, 1.0 - float(state.seed.centroid @ vector)
+        return None, None
+
+    async def _commit(
+        self, user: str, state: UserPreferences, change: Dict[str, Any], vector
+    ):
+        state.version += 1
+        entry = {"user": user, "version": state.version, "at": time.time(), **change}
+        state.history.append(entry)
+        del state.history[: -self.history]
+        state.render()
+        self.stats["versions"] += 1
+        changed = [*change["added"], *change["changed"]]
+        line = _json_dumps(entry | {"centroid": vector.tolist() if changed else None})
+        if self.journal:
+            async with self._io:
+                await asyncio.to_thread(self._write, [line], "a")
+        await self._changed()
+
+    async def _changed(self):
+        self._pending += 1
+        if self._pending >= self.snapshot_every:
+            await self.save()
+
+    async def save(self):
+        """Replace the journal with one snapshot line per user."""
+
+        if not self.journal or not self._pending:
+            return
+        async with self._io:
+            # Diffs still waiting for the lock are already in these
+            # snapshots; replay skips them by version.
+            self._pending = 0
+            lines = [_json_dumps(_snapshot(u, s)) for u, s in self._users.items()]
+            await asyncio.to_thread(self._write, lines, "w")
+
+    def _write(self, lines: List[str], mode: str):
+        os.makedirs(os.path.dirname(self.journal) or ".", exist_ok=True)
+        path = self.journal if mode == "a" else f"{self.journal}.tmp"
+        with open(path, mode) as f:
+            f.writelines(line + "\n" for line in lines)
+        if path != self.journal:
+            os.replace(path, self.journal)
+
+    def load(self):
+        """Replay the journal once: snapshots reset a user, later diffs
+        overwrite earlier ones."""
+
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.journal or not os.path.exists(self.journal):
+            return
+        with open(self.journal, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn final write
+                if "items" in entry:
+                    self._users[entry["user"]] = _restore(entry)
+                    continue
+                state = self._users.setdefault(entry["user"], UserPreferences())
+                if entry["version"] <= state.version:
+                    continue
+                centroid = entry.pop("centroid", None)
+                for name in entry["removed"]:
+                    state.items.pop(name, None)
+                updates = entry["added"] | {k: v[1] for k, v in entry["changed"].items()}
+                for name, value in updates.items():
+                    state.items[name] = Preference(value, _normalize(centroid))
+                state.version = entry["version"]
+                state.history.append(entry)
+                del state.history[: -self.history]
+        for state in self._users.values():
+            state.render()
+
+
+def _snapshot(user: str, state: UserPreferences) -> Dict[str, Any]:
+    def dump(p: Preference):
+        return {"value": p.value, "weight": p.weight, "centroid": p.centroid.tolist()}
+
+    return {
+        "user": user,
+        "version": state.version,
+        "items": {name: dump(p) for name, p in state.items.items()},
+        "seed": dump(state.seed) if state.seed is not None else None,
+        "history": state.history,
+    }
+
+
+def _restore(entry: Dict[str, Any]) -> UserPreferences:
+    def load(p: Dict[str, Any]):
+        return Preference(p["value"], _normalize(p["centroid"]), p["weight"])
+
+    seed = entry["seed"]
+    return UserPreferences(
+        items={name: load(p) for name, p in entry["items"].items()},
+        version=entry["version"],
+        history=entry["history"],
+        seed=load(seed) if seed is not None else None,
+    )
+
+
+PREFERENCES = PreferenceStore()
@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List
+
+from attrs import define, field
+
+from base.config import settings
+from base.core.context import Metadata, render_content
+from base.core.context_cache import CONTEXT_CACHE
+from base.core.segments import History
+from base.core.storage import STORAGE, event_rows
+from base.schema.messages import Content
+from base.schema.threads import THREAD_TIMEOUT, Thread, Threads, ThreadState
+
+if TYPE_CHECKING:
+    from base.schema.records import ThreadRecord
+
+log = logging.getLogger(__name__)
+
+
+def stable_hash(key: str) -> int:
+    """64-bit hash that is the same in every process, unlike ``hash()``."""
+
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+@define
+class HashRing:
+    """Consistent hashing of keys onto named nodes.
+
+    Each node is placed at ``replicas`` points on a 64-bit ring and a key
+    belongs to the first point at or after its hash. Adding or removing a
+    node only moves the keys of that node.
+    """
+
+    nodes: List[str] = field(factory=list)
+    replicas: int = field(default=settings.REGISTRY_REPLICAS)
+    _points: List[int] = field(factory=list, init=False)
+    _owners: List[str] = field(factory=list, init=False)
+
+    def __attrs_post_init__(self):
+        nodes, self.nodes = self.nodes, []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.replicas):
+            point = stable_hash(f"{node}#{i}")
+            at = bisect.bisect(self._points, point)
+            self._points.insert(at, point)
+            self._owners.insert(at, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        keep = [i for i, owner in enumerate(self._owners) if owner != node]
+        self._points = [self._points[i] for i in keep]
+        self._owners = [self._owners[i] for i in keep]
+
+    def owner(self, key: str) -> str | None:
+        if not self._points:
+            return None
+        at = bisect.bisect_left(self._points, stable_hash(key)) % len(self._points)
+        return self._owners[at]
+
+
+async def save_thread(thread: Thread):
+    """Write a thread's row, its new messages and events and its history
+    handle to storage."""
+
+    thread.content.store.flush()
+    rows, thread.unsaved = thread.unsaved, []
+    try:
+        await STORAGE.insert_messages(rows)
+    except BaseException:
+        thread.unsaved[:0] = rows
+        raise
+    last, count = thread.content.handle
+    row = {
+        "thread_id": thread.metadata.thread_id,
+        "state": thread.state.value,
+        "touched": thread.touched,
+        "history_last": last,
+        "history_count": count,
+    }
+    if thread.metadata.summary is not None:
+        # The summary scheduler stores summaries itself; never clear one.
+        row["summary"] = thread.metadata.summary
+    await STORAGE.upsert_threads([row])
+    events = thread.metadata.events[thread.saved_events :]
+    await STORAGE.insert_events(event_rows(thread.metadata.thread_id, events))
+    thread.saved_events += len(events)
+
+
+def thread_from_record(record: ThreadRecord) -> Thread:
+    return Thread(
+        Metadata(thread_id=record.thread_id, summary=record.summary),
+        History.attach((record.history_last, record.history_count)),
+        state=ThreadState(record.state),
+        touched=record.touched,
+    )
+
+
+async def load_thread(thread_id: str) -> Thread | None:
+    record = await STORAGE.thread(thread_id)
+    return None if record is None else thread_from_record(record)
+
+
+async def unsummarized_threads() -> List[Thread]:
+    """``SummaryScheduler.backlog``: saved threads still waiting for a summary."""
+
+    return [thread_from_record(r) for r in await STORAGE.unsummarized()]
+
+
+@define
+class _Shard:
+    threads: OrderedDict = field(factory=OrderedDict)
+    locks: Dict[str, asyncio.Lock] = field(factory=dict)
+    loading: Dict[str, asyncio.Future] = field(factory=dict)
+    evicting: Dict[str, Thread] = field(factory=dict)
+
+
+@define
+class ThreadRegistry:
+    """Resident threads by id, for correlation-id routing.
+
+    Threads are spread over ``shards`` by a stable hash of their id. Each
+    shard keeps its threads in an ``OrderedDict`` from least to most
+    recently used, so lookup, touch and finding idle threads are O(1). Each
+    thread has its own lock: appends to one thread run in order while other
+    threads proceed. There is no global lock.
+
+    A thread that is not resident is read back with ``load``. Concurrent
+    misses for the same id share one load. ``evict_idle`` writes threads
+    untouched for ``timeout`` with ``save`` and drops them. A thread that is
+    requested while it is being saved is put back.
+
+    Resident threads are also tracked by ``threads``, so touches keep their
+    lifecycle lanes in order. An active thread is encoded when it is
+    evicted, which hands it to a summary scheduler attached to ``threads``.
+
+    With ``ring`` holding several workers, ``owner(thread_id)`` names the
+    worker that should hold a thread. Every worker computes the same answer,
+    so requests for a thread can be sent to one place.
+    """
+
+    shards: int = field(default=settings.REGISTRY_SHARDS)
+    timeout: timedelta = field(default=THREAD_TIMEOUT)
+    interval: float = field(default=settings.REGISTRY_SWEEP_INTERVAL)
+    load: Callable[[str], Awaitable[Thread | None]] | None = field(default=load_thread)
+    save: Callable[[Thread], Awaitable[Any]] | None = field(default=save_thread)
+    threads: Threads = field(factory=Threads)
+    ring: HashRing = field(factory=lambda: HashRing(list(settings.REGISTRY_WORKERS)))
+    worker: str = field(default=settings.REGISTRY_WORKER)
+    stats: Dict[str, int] = field(
+        factory=lambda: {"hits": 0, "loads": 0, "created": 0, "evicted": 0, "restored": 0}
+    )
+    _shards: List[_Shard] = field(factory=list, init=False)
+    _task: asyncio.Task | None = field(default=None, init=False)
+
+    def __attrs_post_init__(self):
+        self._shards = [_Shard() for _ in range(self.shards)]
+
+    def __len__(self):
+        return sum(len(s.threads) for s in self._shards)
+
+    def _shard(self, thread_id: str) -> _Shard:
+        return self._shards[stable_hash(thread_id) % self.shards]
+
+    def owner(self, thread_id: str) -> str | None:
+        return self.ring.owner(thread_id)
+
+    def is_local(self, thread_id: str) -> bool:
+        owner = self.owner(thread_id)
+        return owner is None or owner == self.worker
+
+    def peek(self, thread_id: str) -> Thread | None:
+        """The resident thread, without touching or loading it."""
+
+        return self._shard(thread_id).threads.get(thread_id)
+
+    async def get(self, thread_id: str) -> Thread | None:
+        shard = self._shard(thread_id)
+        thread = shard.threads.get(thread_id)
+        if thread is not None:
+            shard.threads.move_to_end(thread_id)
+            self.threads.touch(thread)
+            self.stats["hits"] += 1
+            return thread
+
+        thread = shard.evicting.get(thread_id)
+        if thread is not None:
+            self.stats["restored"] += 1
+            shard.threads[thread_id] = thread
+            self.threads.touch(self.threads.add(thread))
+            return thread
+
+        pending = shard.loading.get(thread_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        if self.load is None:
+            return None
+
+        future = shard.loading[thread_id] = asyncio.get_running_loop().create_future()
+        try:
+            thread = await self.load(thread_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # retrieved; waiters re-raise it
+            raise
+        finally:
+            shard.loading.pop(thread_id, None)
+        self.stats["loads"] += 1
+        if thread is not None:
+            # Another caller may have created it while the load was running.
+            thread = shard.threads.setdefault(thread_id, thread)
+            self.threads.touch(self.threads.add(thread))
+        future.set_result(thread)
+        return thread
+
+    async def current(self, thread_id: str) -> List[str] | None:
+        """``CONTEXT_CACHE`` builder for the current-thread section.
+
+        Renders the in-memory window of a resident thread, or returns
+        ``None`` for one that is not resident so the cached tail is kept.
+        """
+
+        thread = self.peek(thread_id)
+        if thread is None:
+            return None
+        history = thread.content
+        return [render_content(c) for c in history.recent(history.window)]
+
+    def new_id(self) -> str:
+        """A fresh thread id owned by this worker."""
+
+        while True:
+            thread_id = uuid.uuid4().hex
+            if self.is_local(thread_id):
+                return thread_id
+
+    async def resolve(self, thread_id: str | None = None) -> Thread:
+        """The thread for a correlation id; a new thread when there is none."""
+
+        if thread_id is not None:
+            thread = await self.get(thread_id)
+            if thread is not None:
+                return thread
+        thread_id = thread_id or self.new_id()
+        shard = self._shard(thread_id)
+        thread = shard.threads.get(thread_id)
+        if thread is None:
+            thread = self.threads.append(metadata=Metadata(thread_id=thread_id))
+            shard.threads[thread_id] = thread
+            self.stats["created"] += 1
+        return thread
+
+    async def append(
+        self, thread_id: str | None, content: Content, *, embed: List[float] | None = None
+    ) -> Thread:
+        thread = await self.resolve(thread_id)
+        thread_id = thread.metadata.thread_id
+        shard = self._shard(thread_id)
+        lock = shard.locks.get(thread_id)
+        if lock is None:
+            lock = shard.locks[thread_id] = asyncio.Lock()
+        async with lock:
+            await thread.update(content, embed=embed)
+            thread.unsaved.append(
+                {
+                    "id": f"{thread_id}:{len(thread.content) - 1}",
+                    "thread_id": thread_id,
+                    "kind": "message",
+                    "content": content,
+                    "created": thread.touched,
+                }
+            )
+        if thread_id in shard.threads:
+            shard.threads.move_to_end(thread_id)
+        return thread
+
+    async def evict_idle(self, now: float | None = None) -> int:
+        """Save and drop threads untouched for ``timeout``; returns the count."""
+
+        cutoff = (now or time.time()) - self.timeout.total_seconds()
+        evicted = []
+        for shard in self._shards:
+            for thread_id, thread in list(shard.threads.items()):
+                if thread.touched > cutoff:
+                    break
+                lock = shard.locks.get(thread_id)
+                if lock is not None and lock.locked():
+                    continue
+                del shard.threads[thread_id]
+                shard.locks.pop(thread_id, None)
+                shard.evicting[thread_id] = thread
+                if thread.state is ThreadState.ACTIVE:
+                    # Encoding queues it for a summary before it leaves memory.
+                    self.threads.advance(thread)
+                self.threads.discard(thread)
+                evicted.append((shard, thread_id, thread))
+        if not evicted:
+            return 0
+
+        results = await asyncio.gather(
+            *(self._save(t) for _, _, t in evicted), return_exceptions=True
+        )
+        for (shard, thread_id, thread), res in zip(evicted, results):
+            shard.evicting.pop(thread_id, None)
+            if isinstance(res, Exception):
+                log.error("saving thread %s failed: %r", thread_id, res)
+                shard.threads.setdefault(thread_id, thread)
+                shard.threads.move_to_end(thread_id, last=False)
+                self.threads.add(thread)
+        self.stats["evicted"] += sum(not isinstance(r, Exception) for r in results)
+        return len(evicted)
+
+    async def _save(self, thread: Thread):
+        if self.save is not None:
+            await self.save(thread)
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def run(self, stop: asyncio.Event | None = None):
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            try:
+                await self.evict_idle()
+            except Exception:
+                log.exception("thread eviction failed")
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+REGISTRY = ThreadRegistry()
+CONTEXT_CACHE.builders.setdefault("current", REGISTRY.current)
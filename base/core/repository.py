@@ -4,12 +4,18 @@ from typing import Any, Dict
 
 from attrs import define, field
 
+from base.helpers import SCHEMAS
+
 
 @define
 class Repository:
     outlines: Dict[str, Any] = field(factory=dict)
     tools: Dict[str, Any] = field(factory=dict)
 
+    def __attrs_post_init__(self):
+        for tool in self.tools.values():
+            SCHEMAS.register(tool)
+
     # Outline CRUD methods
     def add_outline(self, name: str, outline: Any) -> None:
         """Store a new outline."""
@@ -40,7 +46,7 @@ class Repository:
     def add_tool(self, name: str, tool: Any) -> None:
         """Store a new tool."""
 
-        self.tools[name] = tool
+        self.tools[name] = SCHEMAS.register(tool)
 
     def get_tool(self, name: str) -> Any | None:
         """Retrieve a tool by name."""
@@ -50,7 +56,7 @@ class Repository:
     def update_tool(self, name: str, tool: Any) -> None:
         """Update or create a tool."""
 
-        self.tools[name] = tool
+        self.tools[name] = SCHEMAS.register(tool)
 
     def delete_tool(self, name: str) -> None:
         """Remove a tool if present."""
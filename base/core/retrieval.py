@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+from attrs import define, field
+
+from base.config import settings
+from base.core.embeddings import EmbeddingService
+from base.core.indexes import EMBEDDER, Indexes
+
+Hit = Dict[str, Any]
+Ranker = Callable[[str, List[float], int, Dict[str, Any] | None], Awaitable[List[Hit]]]
+Reranker = Callable[[str, List[Hit]], Awaitable[List[Hit]]]
+
+
+def build_filter(
+    *,
+    type: str | List[str] | None = None,
+    sender_id: str | None = None,
+    thread_id: str | None = None,
+    since: float | None = None,
+    until: float | None = None,
+) -> Dict[str, Any] | None:
+    """Translate request fields into a ``VectorIndex`` payload filter."""
+
+    filter: Dict[str, Any] = {}
+    if type is not None:
+        filter["type"] = type
+    if sender_id is not None:
+        filter["sender_id"] = sender_id
+    if thread_id is not None:
+        filter["thread_id"] = thread_id
+    window = {}
+    if since is not None:
+        window["gte"] = float(since)
+    if until is not None:
+        window["lte"] = float(until)
+    if window:
+        filter["created"] = window
+    return filter or None
+
+
+def rrf(lists: Dict[str, List[Hit]], weights: Dict[str, float], c: int) -> Dict[str, float]:
+    """Reciprocal rank fusion: ``sum(weight / (c + rank))`` over ranked lists."""
+
+    fused: Dict[str, float] = {}
+    for name, hits in lists.items():
+        w = weights.get(name, 1.0)
+        for rank, hit in enumerate(hits, 1):
+            fused[hit["id"]] = fused.get(hit["id"], 0.0) + w / (c + rank)
+    return fused
+
+
+@define
+class Retriever:
+    """Hybrid retrieval over one named index.
+
+    Every ranker in ``rankers`` returns its own ranked candidates for the
+    query, with structured filters pushed down to the index. The lists are
+    fused with reciprocal rank fusion plus a recency term: an item created
+    now earns ``recency_weight`` times a first-place rank, halving every
+    ``half_life`` seconds. ``rerank`` optionally reorders the best
+    ``rerank_depth`` fused hits. ``search(rankers=...)`` replaces the
+    rankers for one call, e.g. to pin them to one index snapshot.
+    """
+
+    indexes: Indexes = field(factory=Indexes)
+    embedder: EmbeddingService = field(default=EMBEDDER)
+    index: str = field(default="default")
+    rankers: Dict[str, Ranker] = field(factory=dict)
+    weights: Dict[str, float] = field(factory=dict)
+    depth: int = field(default=4)
+    rrf_c: int = field(default=settings.RETRIEVAL_RRF_C)
+    half_life: float = field(default=settings.RETRIEVAL_HALF_LIFE)
+    recency_weight: float = field(default=settings.RETRIEVAL_RECENCY_WEIGHT)
+    rerank: Reranker | None = field(default=None)
+    rerank_depth: int = field(default=50)
+    _loaded: bool = field(default=False, init=False)
+
+    def __attrs_post_init__(self):
+        self.rankers.setdefault("dense", self.dense)
+
+    async def dense(
+        self, text: str, vector: List[float], k: int, filter: Dict[str, Any] | None
+    ) -> List[Hit]:
+        if not self._loaded:
+            await self.indexes.load_indexes([self.index])
+            self._loaded = True
+        return await self.indexes.search(vector, k, index=self.index, filter=filter)
+
+    async def search(
+        self,
+        text: str,
+        k: int = 8,
+        *,
+        filter: Dict[str, Any] | None = None,
+        now: float | None = None,
+        rankers: Dict[str, Ranker] | None = None,
+    ) -> List[Hit]:
+        vector = await self.embedder.embed(text)
+        pool = k * self.depth
+        rankers = self.rankers if rankers is None else rankers
+        names = list(rankers)
+        results = await asyncio.gather(*(rankers[n](text, vector, pool, filter) for n in names))
+        lists = dict(zip(names, results))
+        fused = rrf(lists, self.weights, self.rrf_c)
+
+        hits: Dict[str, Hit] = {}
+        for name, ranked in lists.items():
+            for hit in ranked:
+                merged = hits.setdefault(
+                    hit["id"], {"id": hit["id"], "payload": hit.get("payload")}
+                )
+                merged[name] = hit["score"]
+
+        now = time.time() if now is None else now
+        bonus = self.recency_weight / (self.rrf_c + 1)
+        for id, hit in hits.items():
+            created = (hit["payload"] or {}).get("created")
+            decay = 0.0
+            if created is not None and self.half_life > 0:
+                decay = math.exp2(-max(now - created, 0.0) / self.half_life)
+            hit["score"] = fused[id] + bonus * decay
+
+        ranked = sorted(hits.values(), key=lambda h: h["score"], reverse=True)
+        if self.rerank is not None:
+            head = await self.rerank(text, ranked[: self.rerank_depth])
+            ranked = head + ranked[self.rerank_depth :]
+        return ranked[:k]
+
+
+def mmr(indexes: Indexes, index: str = "default", diversity: float = 0.3) -> Reranker:
+    """Maximal marginal relevance re-ranking over the index's vectors.
+
+    Each pick maximizes ``(1 - diversity) * fused score - diversity *
+    (max similarity to the hits already picked)``, which pushes
+    near-duplicate chunks down the list.
+    """
+
+    async def rerank(text: str, hits: List[Hit]) -> List[Hit]:
+        target = await indexes.get_index(index)
+        present = [h for h in hits if h["id"] in target]
+        if len(present) < 2:
+            return hits
+        vectors = target.vectors([h["id"] for h in present])
+        scores = np.array([h["score"] for h in present])
+        scores = scores / scores.max()
+        sims = vectors @ vectors.T
+
+        picked: List[int] = []
+        # Similarities below zero are not redundancy, so start from zero.
+        closest = np.zeros(len(present))
+        left = np.ones(len(present), dtype=bool)
+        for _ in range(len(present)):
+            value = (1 - diversity) * scores - diversity * closest
+            value[~left] = -np.inf
+            i = int(np.argmax(value))
+            picked.append(i)
+            left[i] = False
+            closest = np.maximum(closest, sims[i])
+        order = [present[i] for i in picked]
+        return order + [h for h in hits if h["id"] not in target]
+
+    return rerank
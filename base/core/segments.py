@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from collections import deque
+from typing import Any, Deque, Iterator, List, Tuple
+
+import numpy as np
+from attrs import define, field
+
+from base.config import settings
+from base.core.cache import LRUCache
+from base.schema.messages import Content
+
+RAW, ZSTD = 0, 1
+
+# blocks.idx rows: segment, byte offset, stored length, codec.
+# messages.idx rows: block, offset in block, length, previous message of the thread.
+ROW = np.dtype("<i8")
+
+
+def encode_content(content: Content) -> bytes:
+    """One tag byte (``s``, ``b`` or ``j``) followed by the payload."""
+
+    if isinstance(content, str):
+        return b"s" + content.encode("utf-8")
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return b"b" + bytes(content)
+    return b"j" + json.dumps(content, separators=(",", ":")).encode("utf-8")
+
+
+def decode_content(buf: Any) -> Content:
+    tag, body = bytes(buf[:1]), buf[1:]
+    if tag == b"s":
+        return str(body, "utf-8")
+    if tag == b"b":
+        return bytes(body)
+    return json.loads(bytes(body))
+
+
+@define
+class _Rows:
+    """An append-only file of fixed-width int64 rows, read through ``mmap``."""
+
+    path: str = field()
+    width: int = field()
+    _file: Any = field(default=None, init=False)
+    _map: np.ndarray = field(default=None, init=False)
+    count: int = field(default=0, init=False)
+
+    def open(self):
+        self._file = open(self.path, "a+b")
+        size = self._file.seek(0, os.SEEK_END)
+        row = self.width * ROW.itemsize
+        if size % row:
+            self._file.truncate(size - size % row)
+        self.count = size // row
+        self._map = np.zeros((0, self.width), dtype=ROW)
+
+    def truncate(self, count: int):
+        self._file.truncate(count * self.width * ROW.itemsize)
+        self.count = count
+        self._map = np.zeros((0, self.width), dtype=ROW)
+
+    def append(self, rows: np.ndarray):
+        self._file.write(np.ascontiguousarray(rows, dtype=ROW).tobytes())
+        self._file.flush()
+        self.count += len(rows)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if i >= len(self._map):
+            # Grown since the last map; the old map stays valid for its readers.
+            with open(self.path, "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map = np.frombuffer(m, dtype=ROW).reshape(-1, self.width)
+        return self._map[i]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@define
+class SegmentStore:
+    """Append-only message log shared by every thread's ``History``.
+
+    Encoded messages are packed into blocks of about ``block_size`` bytes. A
+    full block is written to the current ``seg-NNNNNN.dat`` file, zstd
+    compressed when ``compress`` is set, and a new segment is started past
+    ``segment_size`` bytes. ``blocks.idx`` locates each block and
+    ``messages.idx`` locates each message within its block, together with
+    the previous message of the same thread, so a thread's history is a
+    chain from its newest message back. Segments and indexes are read
+    through ``mmap``; uncompressed messages are returned as zero-copy views
+    and decompressed blocks are kept in an LRU of ``block_cache`` entries.
+
+    Messages in the open block are only in memory until it fills or
+    ``flush`` is called. Files are opened on first use. One process writes
+    a directory at a time.
+    """
+
+    path: str = field(default=settings.MESSAGES_DIR)
+    block_size: int = field(default=settings.MESSAGES_BLOCK_SIZE)
+    segment_size: int = field(default=settings.MESSAGES_SEGMENT_SIZE)
+    compress: bool = field(default=settings.MESSAGES_COMPRESS)
+    block_cache: int = field(default=64)
+    _blocks: _Rows = field(default=None, init=False)
+    _messages: _Rows = field(default=None, init=False)
+    _segment: int = field(default=0, init=False)
+    _segment_file: Any = field(default=None, init=False)
+    _maps: dict = field(factory=dict, init=False)
+    _pending: bytearray = field(factory=bytearray, init=False)
+    _pending_rows: List[Tuple[int, int, int]] = field(factory=list, init=False)
+    _cache: LRUCache = field(default=None, init=False)
+    _zstd: Any = field(default=None, init=False)
+
+    def _open(self):
+        if self._blocks is not None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self._cache = LRUCache(self.block_cache)
+        blocks = _Rows(os.path.join(self.path, "blocks.idx"), 4)
+        messages = _Rows(os.path.join(self.path, "messages.idx"), 4)
+        blocks.open()
+        messages.open()
+
+        # Drop message rows of a block whose write was torn off.
+        while messages.count and messages[messages.count - 1][0] >= blocks.count:
+            messages.truncate(messages.count - 1)
+        end = 0
+        if blocks.count:
+            segment, offset, stored, _ = blocks[blocks.count - 1].tolist()
+            self._segment, end = segment, offset + stored
+        self._segment_file = open(self._segment_path(self._segment), "a+b")
+        self._segment_file.truncate(end)
+        self._blocks, self._messages = blocks, messages
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"seg-{segment:06d}.dat")
+
+    def __len__(self):
+        self._open()
+        return self._messages.count + len(self._pending_rows)
+
+    def append(self, content: Content, prev: int = -1) -> int:
+        """Store ``content`` after message ``prev``; returns its sequence number."""
+
+        self._open()
+        data = encode_content(content)
+        seq = len(self)
+        self._pending_rows.append((len(self._pending), len(data), prev))
+        self._pending += data
+        if len(self._pending) >= self.block_size:
+            self.flush()
+        return seq
+
+    def flush(self):
+        """Write the open block, even if it is not full."""
+
+        if not self._pending_rows:
+            return
+        data = bytes(self._pending)
+        codec = RAW
+        if self.compress:
+            packed = self._compressor().compress(data)
+            if len(packed) < len(data):
+                data, codec = packed, ZSTD
+
+        f = self._segment_file
+        offset = f.seek(0, os.SEEK_END)
+        if offset and offset + len(data) > self.segment_size:
+            f.close()
+            self._segment += 1
+            f = self._segment_file = open(self._segment_path(self._segment), "w+b")
+            offset = 0
+        f.write(data)
+        f.flush()
+
+        block = self._blocks.count
+        self._blocks.append(np.array([[self._segment, offset, len(data), codec]]))
+        rows = np.array([(block, *row) for row in self._pending_rows])
+        self._messages.append(rows)
+        self._pending.clear()
+        self._pending_rows.clear()
+
+    def _compressor(self):
+        if self._zstd is None:
+            import zstandard
+
+            self._zstd = (zstandard.ZstdCompressor(), zstandard.ZstdDecompressor())
+        return self._zstd[0]
+
+    def _block(self, block: int) -> memoryview:
+        segment, offset, stored, codec = self._blocks[block].tolist()
+        if codec == ZSTD:
+            data = self._cache.get(block)
+            if data is None:
+                self._compressor()
+                data = memoryview(self._zstd[1].decompress(self._read(segment, offset, stored)))
+                self._cache.put(block, data)
+            return data
+        return self._read(segment, offset, stored)
+
+    def _read(self, segment: int, offset: int, length: int) -> memoryview:
+        m = self._maps.get(segment)
+        if m is None or offset + length > len(m):
+            with open(self._segment_path(segment), "rb") as f:
+                m = self._maps[segment] = memoryview(
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                )
+        return m[offset : offset + length]
+
+    def _row(self, seq: int) -> Tuple[int, int, int, int]:
+        if seq >= self._messages.count:
+            return (-1, *self._pending_rows[seq - self._messages.count])
+        return tuple(self._messages[seq].tolist())
+
+    def raw(self, seq: int) -> memoryview:
+        """The encoded message; a view into the segment when uncompressed."""
+
+        self._open()
+        block, offset, length, _ = self._row(seq)
+        if block < 0:
+            # A copy: views would pin the open block's buffer.
+            return memoryview(self._pending[offset : offset + length])
+        return self._block(block)[offset : offset + length]
+
+    def get(self, seq: int) -> Content:
+        return decode_content(self.raw(seq))
+
+    def prev(self, seq: int) -> int:
+        self._open()
+        return self._row(seq)[3]
+
+    def chain(self, last: int, count: int | None = None) -> List[int]:
+        """Up to ``count`` sequence numbers ending at ``last``, oldest first."""
+
+        seqs = []
+        while last >= 0 and (count is None or len(seqs) < count):
+            seqs.append(last)
+            last = self.prev(last)
+        seqs.reverse()
+        return seqs
+
+    def close(self):
+        if self._blocks is None:
+            return
+        self.flush()
+        self._segment_file.close()
+        self._blocks.close()
+        self._messages.close()
+        self._blocks = self._messages = None
+        self._maps.clear()
+
+
+MESSAGES = SegmentStore()
+
+
+@define
+class History:
+    """A thread's messages: a handle into a ``SegmentStore`` plus a window.
+
+    Only the last ``window`` messages are kept in memory; older ones are
+    read back from the store. ``recent(n)`` serves from the window without
+    touching the store. ``handle`` is enough to reattach the history to the
+    same store later with ``History.attach``.
+    """
+
+    store: SegmentStore = field(default=MESSAGES)
+    window: int = field(default=settings.MESSAGES_WINDOW)
+    last: int = field(default=-1)
+    count: int = field(default=0)
+    _recent: Deque[Content] = field(default=(), init=False)
+
+    @classmethod
+    def attach(cls, handle: Tuple[int, int], store: SegmentStore = MESSAGES, **kwargs):
+        last, count = handle
+        history = cls(store, last=last, count=count, **kwargs)
+        recent = store.chain(last, history.window)
+        history._recent = deque((store.get(s) for s in recent), maxlen=history.window)
+        return history
+
+    @property
+    def handle(self) -> Tuple[int, int]:
+        return self.last, self.count
+
+    def append(self, content: Content):
+        self.last = self.store.append(content, self.last)
+        self.count += 1
+        if not self._recent:
+            # Created on first use: most threads of a large container are empty.
+            self._recent = deque(maxlen=self.window)
+        self._recent.append(content)
+
+    def recent(self, n: int | None = None) -> List[Content]:
+        """The last ``n`` messages, read from the store only past the window."""
+
+        n = self.count if n is None else min(n, self.count)
+        if n <= len(self._recent):
+            return list(self._recent)[len(self._recent) - n :]
+        older = self.store.chain(self.last, n)[: n - len(self._recent)]
+        return [self.store.get(s) for s in older] + list(self._recent)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self) -> Iterator[Content]:
+        return iter(self.recent())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.recent()[i]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("history index out of range")
+        back = self.count - 1 - i
+        if back < len(self._recent):
+            return self._recent[len(self._recent) - 1 - back]
+        return self.store.get(self.store.chain(self.last, back + 1)[0])
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, List, Tuple
+
+import numpy as np
+from attrs import define, field
+
+
+def normalize(vectors: Any) -> np.ndarray:
+    """Return ``vectors`` as float32 rows scaled to unit length.
+
+    Zero rows are left as zeros so they score ``0`` against everything.
+    """
+
+    arr = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    np.divide(arr, norms, out=arr, where=norms > 0)
+    return arr
+
+
+def cosine_similarity(vec_a, vec_b) -> float:
+    a, b = normalize([vec_a, vec_b])
+    return float(a @ b)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest ``scores`` in descending order."""
+
+    n = scores.shape[-1]
+    if k <= 0 or n == 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k >= n:
+        return np.argsort(-scores, axis=-1)
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+
+def above(scores: np.ndarray, threshold: float) -> np.ndarray:
+    """Indices whose score is at least ``threshold``, best first."""
+
+    idx = np.flatnonzero(scores >= threshold)
+    return idx[np.argsort(-scores[idx])]
+
+
+@define
+class VectorMatrix:
+    """Growable matrix of pre-normalized float32 rows with parallel ids.
+
+    Rows are normalized once on insert, so scoring a query against every
+    candidate is a single matrix-vector product.
+    """
+
+    dim: int = field(default=1536)
+    ids: List[Any] = field(factory=list)
+    _data: np.ndarray = field(default=None, init=False)
+
+    def __attrs_post_init__(self):
+        self._data = np.zeros((0, self.dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._data[: len(self.ids)]
+
+    def add(self, ids: Iterable[Any], vectors: Any):
+        ids = list(ids)
+        rows = normalize(vectors)
+        if rows.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}")
+
+        n = len(self.ids)
+        if n + len(ids) > self._data.shape[0]:
+            grown = np.zeros(
+                (max(2 * self._data.shape[0], n + len(ids), 64), self.dim),
+                dtype=np.float32,
+            )
+            grown[:n] = self._data[:n]
+            self._data = grown
+        self._data[n : n + len(ids)] = rows
+        self.ids.extend(ids)
+
+    def update(self, row: int, vector: Any):
+        self._data[row] = normalize(vector)[0]
+
+    def scores(self, query: Any) -> np.ndarray:
+        return self.matrix @ normalize(query)[0]
+
+    def batch_scores(self, queries: Any) -> np.ndarray:
+        return normalize(queries) @ self.matrix.T
+
+    def top_k(self, query: Any, k: int) -> List[Tuple[Any, float]]:
+        scores = self.scores(query)
+        return [(self.ids[i], float(scores[i])) for i in top_k(scores, k)]
+
+    def batch_top_k(self, queries: Any, k: int) -> List[List[Tuple[Any, float]]]:
+        scores = self.batch_scores(queries)
+        return [
+            [(self.ids[i], float(row[i])) for i in idx]
+            for row, idx in zip(scores, top_k(scores, k))
+        ]
+
+    def above(self, query: Any, threshold: float) -> List[Tuple[Any, float]]:
+        scores = self.scores(query)
+        return [(self.ids[i], float(scores[i])) for i in above(scores, threshold)]
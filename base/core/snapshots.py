@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, List
+
+from attrs import define, field
+
+from base.config import settings
+from base.core.ann import VectorIndex
+from base.core.lexical import LexicalIndex, lexical_ranker
+from base.core.retrieval import Ranker, Retriever
+
+log = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, MANIFEST), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def linked(source: str) -> Callable[[str], None]:
+    """A ``publish`` writer that hard-links the files of a saved snapshot.
+
+    ``VectorIndex.save`` and ``LexicalIndex.save`` write a new directory and
+    rename it into place, never rewriting a file, so links stay valid after
+    the next save and publishing costs no second serialization.
+    """
+
+    def save(path: str):
+        os.makedirs(path)
+        for name in os.listdir(source):
+            try:
+                os.link(os.path.join(source, name), os.path.join(path, name))
+            except OSError:
+                shutil.copy2(os.path.join(source, name), os.path.join(path, name))
+
+    return save
+
+
+@define
+class SnapshotPublisher:
+    """Writes numbered index snapshots for read-only workers.
+
+    ``publish`` saves every index into a fresh ``vNNNNNNNN`` directory and
+    only then replaces ``manifest.json``, so a reader never sees a version
+    that is half written. The newest ``keep`` versions are kept; older ones
+    are deleted, which is safe for readers still mapping them.
+    """
+
+    path: str = field(default=settings.SNAPSHOT_DIR)
+    keep: int = field(default=settings.SNAPSHOT_KEEP)
+
+    def publish(self, writers: Dict[str, Callable[[str], Any]]) -> int:
+        """Save ``{name: save(path)}`` as the next version; returns it."""
+
+        version = read_manifest(self.path).get("version", 0) + 1
+        name = f"v{version:08d}"
+        root = os.path.join(self.path, name)
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        for index, save in writers.items():
+            save(os.path.join(root, index))
+
+        manifest = os.path.join(self.path, MANIFEST)
+        with open(f"{manifest}.tmp", "w") as f:
+            json.dump(
+                {"version": version, "dir": name, "indexes": list(writers), "published": time.time()},
+                f,
+            )
+        os.replace(f"{manifest}.tmp", manifest)
+
+        versions = sorted(d for d in os.listdir(self.path) if d.startswith("v"))
+        for old in versions[: -self.keep]:
+            shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+        return version
+
+
+@define
+class Snapshot:
+    version: int
+    vectors: VectorIndex
+    lexical: List[LexicalIndex]
+
+    def rankers(self, *local: LexicalIndex) -> Dict[str, Ranker]:
+        """``Retriever`` rankers pinned to this version, plus in-process
+        lexical indexes, for ``Retriever.search(rankers=...)``."""
+
+        async def dense(text: str, vector: Any, k: int, filter: Dict[str, Any] | None):
+            return self.vectors.search(vector, k, filter=filter)
+
+        return {"dense": dense, "lexical": lexical_ranker(*self.lexical, *local)}
+
+
+@define
+class SnapshotReader:
+    """Follows the published snapshots and serves searches from the newest.
+
+    Snapshots are loaded with ``mmap``, so every worker process on a host
+    reads the same page-cache copy of the vectors and postings instead of
+    holding its own. ``refresh`` loads a new version completely before
+    swapping it in with one assignment; searches already running finish on
+    the version they started with.
+    """
+
+    path: str = field(default=settings.SNAPSHOT_DIR)
+    vectors: str = field(default="default")
+    interval: float = field(default=settings.RETRIEVE_RELOAD_INTERVAL)
+    dim: int = field(default=settings.EMBED_DIMENSIONS)
+    stats: Dict[str, int] = field(factory=lambda: {"reloads": 0, "failed": 0})
+    _current: Snapshot | None = field(default=None, init=False)
+    _task: asyncio.Task | None = field(default=None, init=False)
+
+    @property
+    def current(self) -> Snapshot:
+        if self._current is None:
+            self.refresh()
+        if self._current is None:
+            self._current = Snapshot(0, VectorIndex(dim=self.dim), [])
+        return self._current
+
+    def load(self, manifest: Dict[str, Any]) -> Snapshot:
+        root = os.path.join(self.path, manifest["dir"])
+        vectors = VectorIndex(dim=self.dim)
+        lexical = []
+        for name in manifest["indexes"]:
+            path = os.path.join(root, name)
+            if name == self.vectors:
+                vectors = VectorIndex.load(path, mmap=True)
+            elif name.endswith(".bm25"):
+                lexical.append(LexicalIndex.load(path, mmap=True))
+        return Snapshot(manifest["version"], vectors, lexical)
+
+    def refresh(self) -> bool:
+        """Swap in the published version if it is newer; True if it was."""
+
+        manifest = read_manifest(self.path)
+        version = manifest.get("version", 0)
+        if not version or (self._current is not None and version <= self._current.version):
+            return False
+        try:
+            snapshot = self.load(manifest)
+        except (OSError, ValueError, KeyError):
+            # Pruned or replaced while loading; the next refresh retries.
+            log.exception("loading snapshot %d failed", version)
+            self.stats["failed"] += 1
+            return False
+        self._current = snapshot
+        self.stats["reloads"] += 1
+        return True
+
+    def info(self) -> Dict[str, Any]:
+        snapshot = self.current
+        return {
+            "version": snapshot.version,
+            "vectors": len(snapshot.vectors),
+            "lexical": [len(index) for index in snapshot.lexical],
+            **self.stats,
+        }
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def run(self, stop: asyncio.Event | None = None):
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            await asyncio.to_thread(self.refresh)
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+PUBLISHER = SnapshotPublisher()
+READER = SnapshotReader()
+# Fusion settings only: ``/query`` and ``/context`` pass the rankers of the
+# ``Snapshot`` they took, so both rankers search one version.
+SNAPSHOT_RETRIEVER = Retriever()
@@ -1,13 +1,277 @@
-from sqlmodel import Session, SQLModel, create_engine
+from __future__ import annotations
 
-from base import settings
+import functools
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+from attrs import define, field
 
+from base.config import settings
 
-def init_db(session: Session) -> None:
+# SQLAlchemy and the SQLModel records take longer to import than the rest of
+# the app together, so they are imported on first use of the database.
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+    from base.schema.records import MessageRecord, ThreadRecord
+
+MESSAGE_COLUMNS = ("id", "thread_id", "kind", "content", "created")
+EVENT_COLUMNS = ("thread_id", "event", "at", "content")
+
+
+@functools.cache
+def statements() -> Dict[str, Any]:
+    """Hot lookups, built once so SQLAlchemy's compiled cache and the
+    driver's prepared statement cache are hit on every call."""
+
+    from sqlalchemy import bindparam, select
+
+    from base.schema.records import MessageRecord, ThreadRecord
+
+    return {
+        "THREAD_BY_ID": select(ThreadRecord).where(
+            ThreadRecord.thread_id == bindparam("thread_id")
+        ),
+        "UNSUMMARIZED": select(ThreadRecord).where(
+            ThreadRecord.state == "encoded", ThreadRecord.summary.is_(None)
+        ),
+        "LAST_MESSAGES": (
+            select(MessageRecord)
+            .where(MessageRecord.thread_id == bindparam("thread_id"))
+            .order_by(MessageRecord.created.desc())
+            .limit(bindparam("n"))
+        ),
+    }
+
+
+def database_url() -> str:
+    return settings.DATABASE_URL or str(settings.SQLALCHEMY_DATABASE_URI)
+
+
+def create_engine(url: str | None = None, **kwargs) -> AsyncEngine:
+    """Create an async engine with the pool settings from ``Settings``.
+
+    SQLite URLs (``sqlite+aiosqlite://``) keep SQLAlchemy's default pool so
+    the same code runs against a local file or in-memory database.
+    """
+
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(url or database_url())
+    if url.get_backend_name() == "sqlite":
+        return create_async_engine(url, **kwargs)
+    if url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict(
+            {"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)}
+        )
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    return create_async_engine(url, **(options | kwargs))
+
+
+@define
+class Storage:
+    """Async access to threads, messages and thread events.
+
+    Bulk inserts use ``COPY`` on asyncpg once a batch reaches
+    ``copy_threshold`` rows and multi-row ``INSERT ... VALUES`` otherwise.
+    ``stats`` counts pool activity and the time spent waiting for a
+    connection. Without an ``engine`` one is created from ``Settings`` on
+    first use.
+    """
+
+    _engine: AsyncEngine | None = field(default=None)
+    copy_threshold: int = field(default=settings.DB_COPY_THRESHOLD)
+    stats: Dict[str, float] = field(
+        factory=lambda: {
+            "connects": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "wait": 0.0,
+            "max_wait": 0.0,
+        }
+    )
+
+    def __attrs_post_init__(self):
+        if self._engine is not None:
+            self._instrument()
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = create_engine()
+            self._instrument()
+        return self._engine
+
+    def _instrument(self):
+        from sqlalchemy import event
+
+        target = self._engine.sync_engine
+        event.listen(target, "connect", lambda *_: self._count("connects"))
+        event.listen(target, "checkout", lambda *_: self._count("checkouts"))
+        event.listen(target, "checkin", lambda *_: self._count("checkins"))
+
+    def _count(self, name: str):
+        self.stats[name] += 1
+
+    @asynccontextmanager
+    async def connect(self):
+        start = time.perf_counter()
+        async with self.engine.connect() as conn:
+            waited = time.perf_counter() - start
+            self.stats["wait"] += waited
+            self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+            yield conn
+
+    async def init(self):
+        from sqlmodel import SQLModel
+
+        import base.schema.records  # noqa: F401  registers the tables
+
+        async with self.engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+    async def aclose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+
+    def pool_status(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        status = {"pool": type(pool).__name__} | dict(self.stats)
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            if method is not None:
+                status[name] = method()
+        return status
+
+    async def upsert_threads(self, rows: List[Dict[str, Any]]):
+        from base.schema.records import ThreadRecord
+
+        await self._upsert(ThreadRecord.__table__, "thread_id", rows)
+
+    async def insert_messages(self, rows: List[Dict[str, Any]]) -> int:
+        from base.schema.records import MessageRecord
+
+        return await self._bulk(
+            MessageRecord.__table__, MESSAGE_COLUMNS, rows, json_columns=("content",)
+        )
+
+    async def upsert_messages(self, rows: List[Dict[str, Any]]):
+        """Insert messages, replacing rows whose ``id`` already exists."""
+
+        from base.schema.records import MessageRecord
+
+        await self._upsert(MessageRecord.__table__, "id", rows)
+
+    async def _upsert(self, table, key: str, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        dialect = self.engine.dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            raise NotImplementedError(dialect)
+
+        stmt = upsert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={c: stmt.excluded[c] for c in rows[0] if c != key},
+        )
+        async with self.connect() as conn:
+            await conn.execute(stmt, rows)
+            await conn.commit()
+
+    async def insert_events(self, rows: List[Dict[str, Any]]) -> int:
+        from base.schema.records import ThreadEventRecord
+
+        return await self._bulk(ThreadEventRecord.__table__, EVENT_COLUMNS, rows)
+
+    async def thread(self, thread_id: str) -> ThreadRecord | None:
+        from base.schema.records import ThreadRecord
+
+        async with self.connect() as conn:
+            res = await conn.execute(statements()["THREAD_BY_ID"], {"thread_id": thread_id})
+            row = res.first()
+        return None if row is None else ThreadRecord(**row._mapping)
+
+    async def unsummarized(self) -> List[ThreadRecord]:
+        """Encoded threads whose summary has not been stored yet."""
+
+        from base.schema.records import ThreadRecord
+
+        async with self.connect() as conn:
+            res = await conn.execute(statements()["UNSUMMARIZED"])
+            return [ThreadRecord(**r._mapping) for r in res]
+
+    async def last_messages(self, thread_id: str, n: int = 20) -> List[MessageRecord]:
+        """Return the newest ``n`` messages of a thread, oldest first."""
+
+        from base.schema.records import MessageRecord
+
+        async with self.connect() as conn:
+            res = await conn.execute(
+                statements()["LAST_MESSAGES"], {"thread_id": thread_id, "n": n}
+            )
+            rows = [MessageRecord(**r._mapping) for r in res]
+        rows.reverse()
+        return rows
+
+    async def _bulk(self, table, columns, rows, json_columns=()) -> int:
+        if not rows:
+            return 0
+        defaults = {
+            c: table.c[c].default.arg
+            for c in columns
+            if table.c[c].default is not None and table.c[c].default.is_scalar
+        }
+        rows = [{c: r.get(c, defaults.get(c)) for c in columns} for r in rows]
+        async with self.connect() as conn:
+            if len(rows) >= self.copy_threshold and self.engine.dialect.driver == "asyncpg":
+                raw = (await conn.get_raw_connection()).driver_connection
+                records = [
+                    tuple(
+                        json.dumps(r[c]) if c in json_columns else r[c]
+                        for c in columns
+                    )
+                    for r in rows
+                ]
+                await raw.copy_records_to_table(table.name, records=records, columns=columns)
+            else:
+                from sqlalchemy import insert
+
+                # One executemany; SQLAlchemy batches it into multi-row
+                # VALUES where the dialect supports it.
+                await conn.execute(insert(table), rows)
+            await conn.commit()
+        return len(rows)
+
+
+def event_rows(thread_id: str, events: Iterable[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Convert ``Metadata.events`` entries into ``thread_events`` rows."""
+
+    rows = []
+    for item in events:
+        item = dict(item)
+        content = item.pop("content", None)
+        for name, at in item.items():
+            rows.append({"thread_id": thread_id, "event": name, "at": at, "content": content})
+    return rows
+
+
+STORAGE = Storage()
+
+
+async def init_db():
     """Initialise the database tables."""
 
-    # SQLModel collects metadata for all model classes. Calling ``create_all``
-    # will create any tables that do not already exist.
-    SQLModel.metadata.create_all(engine)
+    await STORAGE.init()
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from attrs import define, field
+from redis.exceptions import ResponseError
+
+
+def _ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _key(id: str) -> Tuple[int, int]:
+    ms, _, seq = id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+@define
+class _Pending:
+    consumer: str
+    delivered: int
+    count: int = 1
+
+
+@define
+class _Group:
+    last_id: str = "0-0"
+    pending: OrderedDict = field(factory=OrderedDict)
+
+
+@define
+class _Stream:
+    entries: OrderedDict = field(factory=OrderedDict)
+    groups: Dict[str, _Group] = field(factory=dict)
+    last_id: Tuple[int, int] = (0, 0)
+
+
+@define
+class _Pipeline:
+    """Queues commands and runs them in order on ``execute``."""
+
+    target: Any
+    _calls: List[Tuple[str, tuple, dict]] = field(factory=list, init=False)
+
+    def __getattr__(self, name: str):
+        def call(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+
+        return call
+
+    async def execute(self):
+        calls, self._calls = self._calls, []
+        return [await getattr(self.target, n)(*a, **kw) for n, a, kw in calls]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._calls = []
+
+
+@define
+class MemoryStreams:
+    """In-process stand-in for the subset of ``redis.asyncio.Redis`` used by
+    the ingest queue. Values behave as with ``decode_responses=True``.
+    """
+
+    _streams: Dict[str, _Stream] = field(factory=dict, init=False)
+    _signal: asyncio.Event | None = field(default=None, init=False)
+
+    def _stream(self, name: str, create: bool = True) -> _Stream | None:
+        if name not in self._streams and create:
+            self._streams[name] = _Stream()
+        return self._streams.get(name)
+
+    def _group(self, name: str, group: str) -> _Group:
+        stream = self._stream(name, create=False)
+        if stream is None or group not in stream.groups:
+            raise ResponseError(f"NOGROUP No such key '{name}' or consumer group '{group}'")
+        return stream.groups[group]
+
+    async def xadd(self, name: str, fields: Dict[str, Any], id: str = "*", **kwargs):
+        stream = self._stream(name)
+        ms = _ms()
+        last_ms, last_seq = stream.last_id
+        key = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        stream.last_id = key
+        entry_id = f"{key[0]}-{key[1]}"
+        stream.entries[entry_id] = {str(k): str(v) for k, v in fields.items()}
+        if self._signal is not None:
+            self._signal.set()
+        return entry_id
+
+    async def xlen(self, name: str) -> int:
+        stream = self._stream(name, create=False)
+        return 0 if stream is None else len(stream.entries)
+
+    async def xdel(self, name: str, *ids: str) -> int:
+        stream = self._stream(name, create=False)
+        if stream is None:
+            return 0
+        return sum(stream.entries.pop(i, None) is not None for i in ids)
+
+    async def xrange(self, name: str, min: str = "-", max: str = "+", count=None):
+        stream = self._stream(name, create=False)
+        if stream is None:
+            return []
+        out = [(i, dict(f)) for i, f in stream.entries.items()]
+        return out[:count] if count else out
+
+    async def xgroup_create(self, name: str, groupname: str, id: str = "$", mkstream: bool = False):
+        stream = self._stream(name, create=mkstream)
+        if stream is None:
+            raise ResponseError("ERR The XGROUP subcommand requires the key to exist")
+        if groupname in stream.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        last = f"{stream.last_id[0]}-{stream.last_id[1]}" if id == "$" else id
+        stream.groups[groupname] = _Group(last_id=last)
+        return True
+
+    async def xreadgroup(
+        self,
+        groupname: str,
+        consumername: str,
+        streams: Dict[str, str],
+        count: int | None = None,
+        block: int | None = None,
+        noack: bool = False,
+    ):
+        deadline = None if block is None else time.monotonic() + block / 1000
+        while True:
+            out = []
+            for name, start in streams.items():
+                group = self._group(name, groupname)
+                stream = self._streams[name]
+                batch = []
+                if start == ">":
+                    last = _key(group.last_id)
+                    for entry_id, fields in stream.entries.items():
+                        if _key(entry_id) <= last:
+                            continue
+                        batch.append((entry_id, dict(fields)))
+                        group.last_id = entry_id
+                        group.pending[entry_id] = _Pending(consumername, _ms())
+                        if count and len(batch) >= count:
+                            break
+                else:
+                    for entry_id, p in group.pending.items():
+                        if p.consumer == consumername and _key(entry_id) > _key(start):
+                            batch.append((entry_id, dict(stream.entries.get(entry_id, {}))))
+                            if count and len(batch) >= count:
+                                break
+                if batch:
+                    out.append([name, batch])
+            if out or deadline is None:
+                return out
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            self._signal = self._signal or asyncio.Event()
+            self._signal.clear()
+            try:
+                await asyncio.wait_for(self._signal.wait(), remaining)
+            except asyncio.TimeoutError:
+                return []
+
+    async def xack(self, name: str, groupname: str, *ids: str) -> int:
+        group = self._group(name, groupname)
+        return sum(group.pending.pop(i, None) is not None for i in ids)
+
+    async def xpending(self, name: str, groupname: str):
+        group = self._group(name, groupname)
+        ids = list(group.pending)
+        consumers: Dict[str, int] = {}
+        for p in group.pending.values():
+            consumers[p.consumer] = consumers.get(p.consumer, 0) + 1
+        return {
+            "pending": len(ids),
+            "min": ids[0] if ids else None,
+            "max": ids[-1] if ids else None,
+            "consumers": [{"name": c, "pending": n} for c, n in consumers.items()],
+        }
+
+    async def xpending_range(
+        self, name: str, groupname: str, min: str, max: str, count: int, consumername=None, idle=None
+    ):
+        group = self._group(name, groupname)
+        lo = (0, 0) if min == "-" else _key(min)
+        hi = None if max == "+" else _key(max)
+        now, out = _ms(), []
+        for entry_id, p in group.pending.items():
+            if _key(entry_id) < lo or (hi is not None and _key(entry_id) > hi):
+                continue
+            if consumername and p.consumer != consumername:
+                continue
+            if idle and now - p.delivered < idle:
+                continue
+            out.append(
+                {
+                    "message_id": entry_id,
+                    "consumer": p.consumer,
+                    "time_since_delivered": now - p.delivered,
+                    "times_delivered": p.count,
+                }
+            )
+            if len(out) >= count:
+                break
+        return out
+
+    async def xautoclaim(
+        self,
+        name: str,
+        groupname: str,
+        consumername: str,
+        min_idle_time: int,
+        start_id: str = "0-0",
+        count: int | None = None,
+        justid: bool = False,
+    ):
+        group = self._group(name, groupname)
+        stream = self._streams[name]
+        now, claimed, deleted = _ms(), [], []
+        for entry_id, p in list(group.pending.items()):
+            if _key(entry_id) < _key(start_id) or now - p.delivered < min_idle_time:
+                continue
+            if entry_id not in stream.entries:
+                group.pending.pop(entry_id)
+                deleted.append(entry_id)
+                continue
+            p.consumer, p.delivered, p.count = consumername, now, p.count + 1
+            claimed.append(entry_id if justid else (entry_id, dict(stream.entries[entry_id])))
+            if count and len(claimed) >= count:
+                break
+        return ["0-0", claimed, deleted]
+
+    def pipeline(self, transaction: bool = True):
+        return _Pipeline(self)
+
+    async def aclose(self):
+        return None
+
+
+@define
+class MemoryRedis(MemoryStreams):
+    """``MemoryStreams`` plus the string commands used by the context cache.
+
+    Values are stored and returned as ``bytes``.
+    """
+
+    _values: Dict[str, bytes] = field(factory=dict, init=False)
+    _expires: Dict[str, float] = field(factory=dict, init=False)
+
+    def _live(self, key: str) -> bytes | None:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return self._values.get(key)
+
+    @staticmethod
+    def _bytes(value: Any) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    async def get(self, key: str):
+        return self._live(key)
+
+    async def mget(self, keys: List[str], *args: str):
+        return [self._live(k) for k in [*keys, *args]]
+
+    async def set(self, key: str, value: Any, ex: int | None = None):
+        self._values[key] = self._bytes(value)
+        self._expires.pop(key, None)
+        if ex:
+            self._expires[key] = time.time() + ex
+        return True
+
+    async def append(self, key: str, value: Any) -> int:
+        self._values[key] = (self._live(key) or b"") + self._bytes(value)
+        return len(self._values[key])
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        if self._live(key) is None:
+            return False
+        self._expires[key] = time.time() + seconds
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        removed = 0
+        for key in keys:
+            removed += self._live(key) is not None
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return removed
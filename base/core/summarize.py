@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Collection, Deque, Dict, Iterable, List
+
+from attrs import define, field
+
+from base.config import settings
+from base.core.classify import generate
+from base.core.context import render_content
+from base.core.graph import ThreadGraph
+from base.core.limits import TokenBucket
+from base.core.storage import STORAGE
+from base.helpers import _json_dumps, hash_text
+from base.schema.threads import THREAD_TIMEOUT, Thread, Threads, ThreadState
+
+log = logging.getLogger(__name__)
+
+
+@define
+class SummaryNode:
+    """A node of the summary tree: a thread (level 0) or a parent summary."""
+
+    id: str
+    level: int
+    summary: str
+    children: List[str] = field(factory=list)
+
+
+async def summarize_texts(texts: List[str]) -> str:
+    res = await generate(
+        model=settings.SUMMARY_MODEL,
+        input="Summarize the following conversation history in one dense paragraph, "
+        "keeping names, decisions and open questions:\n\n" + "\n\n".join(texts),
+    )
+    return res.output_text
+
+
+async def store_summary(node: SummaryNode):
+    """``SummaryScheduler.store``: a thread summary goes on its ``threads``
+    row, a parent summary into ``messages`` with kind ``summary``."""
+
+    if node.level == 0:
+        await STORAGE.upsert_threads([{"thread_id": node.id, "summary": node.summary}])
+        return
+    content = {"level": node.level, "summary": node.summary, "children": node.children}
+    await STORAGE.upsert_messages(
+        [
+            {
+                "id": node.id,
+                "thread_id": "",
+                "kind": "summary",
+                "content": content,
+                "created": time.time(),
+            }
+        ]
+    )
+
+
+@define
+class SummaryScheduler:
+    """Background worker that builds hierarchical summaries of stale threads.
+
+    Threads that go untouched for ``stale_after`` are encoded by ``Threads``;
+    each encoded thread gets its own summary (a level 0 node). Every
+    ``fanout`` nodes at one level are summarized into a parent one level up,
+    so old history collapses into a tree whose roots cover everything.
+
+    Model calls run with at most ``concurrency`` in flight and are paced by
+    ``rate``. Completed nodes are appended to ``journal`` before anything
+    else happens, so after a crash ``load`` restores the open groups and
+    skips work already done. ``store`` writes each node to long-term
+    storage. Threads encoded before a crash but not yet summarized are only
+    in memory, so ``backlog`` returns them from storage when the scheduler
+    starts, and they are queued again. With a ``graph``, every thread summary is
+    linked to its most similar predecessors and the graph is saved after
+    each tick that linked something. ``notify`` is synchronous and O(1); request
+    handlers never wait on summarization.
+    """
+
+    threads: Threads = field()
+    journal: str = field(default=settings.SUMMARY_JOURNAL)
+    summarize: Callable[[List[str]], Awaitable[str]] = field(default=summarize_texts)
+    store: Callable[[SummaryNode], Awaitable[Any]] | None = field(default=None)
+    backlog: Callable[[], Awaitable[Iterable[Thread]]] | None = field(default=None)
+    graph: ThreadGraph | None = field(default=None)
+    fanout: int = field(default=settings.SUMMARY_FANOUT)
+    stale_after: timedelta = field(default=THREAD_TIMEOUT)
+    interval: float = field(default=settings.SUMMARY_INTERVAL)
+    concurrency: int = field(default=settings.SUMMARY_CONCURRENCY)
+    rate: TokenBucket = field(
+        factory=lambda: TokenBucket(settings.SUMMARY_RATE, settings.SUMMARY_RATE)
+    )
+    stats: Dict[str, int] = field(factory=lambda: {"leaves": 0, "parents": 0, "failed": 0})
+    _pending: Deque[Thread] = field(factory=deque, init=False)
+    _levels: Dict[int, List[str]] = field(factory=dict, init=False)
+    _summaries: Dict[str, str] = field(factory=dict, init=False)
+    _done: set = field(factory=set, init=False)
+    _slots: asyncio.Semaphore | None = field(default=None, init=False)
+    _task: asyncio.Task | None = field(default=None, init=False)
+
+    def __attrs_post_init__(self):
+        if self.threads.on_transition is None:
+            self.threads.on_transition = self.notify
+        self.load()
+
+    def notify(self, thread: Thread, state: ThreadState):
+        if state is ThreadState.ENCODED:
+            self._pending.append(thread)
+
+    def load(self):
+        """Replay the journal: every node not yet listed as a child is open."""
+
+        nodes: Dict[str, SummaryNode] = {}
+        children = set()
+        for node in self._read():
+            nodes[node.id] = node
+            children.update(node.children)
+
+        self._done = set(nodes)
+        for node in nodes.values():
+            if node.id not in children:
+                self._levels.setdefault(node.level, []).append(node.id)
+                self._summaries[node.id] = node.summary
+
+    def _read(self, ids: Collection[str] | None = None) -> List[SummaryNode]:
+        if not os.path.exists(self.journal):
+            return []
+        nodes = []
+        with open(self.journal, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    node = SummaryNode(**json.loads(line))
+                except (ValueError, TypeError):
+                    continue  # torn final write
+                if ids is None or node.id in ids:
+                    nodes.append(node)
+        return nodes
+
+    async def recover(self):
+        """Queue the threads ``backlog`` returns.
+
+        Threads the journal already covers were summarized before the
+        crash, so only their journaled summary is stored again.
+        """
+
+        if self.backlog is None:
+            return
+        threads = list(await self.backlog())
+        done = {t.metadata.thread_id for t in threads} & self._done
+        self._pending.extend(t for t in threads if t.metadata.thread_id not in done)
+        if done and self.store is not None:
+            for node in await asyncio.to_thread(self._read, done):
+                await self.store(node)
+        if threads:
+            log.info("recovered %d unsummarized threads", len(threads))
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def run(self, stop: asyncio.Event | None = None):
+        stop = stop or asyncio.Event()
+        try:
+            await self.recover()
+        except Exception:
+            log.exception("recovering unsummarized threads failed")
+        while not stop.is_set():
+            try:
+                await self.tick()
+            except Exception:
+                log.exception("summary tick failed")
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def tick(self):
+        self.threads.advance_stale(self.stale_after)
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        if batch:
+            linked = await asyncio.gather(*(self._leaf(t) for t in batch))
+            if self.graph is not None and self.graph.path and any(linked):
+                await asyncio.to_thread(self.graph.save)
+        await self._merge()
+
+    async def _leaf(self, thread: Thread):
+        node_id = thread.metadata.thread_id or hash_text(*map(render_content, thread.content))
+        if node_id in self._done:
+            return
+        try:
+            summary = await self._call([render_content(c) for c in thread.content])
+        except Exception:
+            log.exception("summarizing thread %s failed", node_id)
+            self.stats["failed"] += 1
+            self._pending.append(thread)
+            return
+
+        thread.metadata.summary = summary
+        await self._commit(SummaryNode(node_id, 0, summary))
+        self.stats["leaves"] += 1
+        if self.graph is None:
+            return False
+        try:
+            await self.graph.link(node_id, summary)
+        except Exception:
+            log.exception("linking thread %s failed", node_id)
+            return False
+        return True
+
+    async def _merge(self):
+        level = 0
+        while level in self._levels:
+            group = self._levels[level]
+            ready = []
+            while len(group) >= self.fanout:
+                ready.append(group[: self.fanout])
+                del group[: self.fanout]
+            results = await asyncio.gather(
+                *(self._parent(level + 1, ids) for ids in ready), return_exceptions=True
+            )
+            for ids, res in zip(ready, results):
+                if isinstance(res, Exception):
+                    log.error("summarizing %d nodes at level %d failed: %r", len(ids), level, res)
+                    self.stats["failed"] += 1
+                    group[:0] = ids
+            level += 1
+
+    async def _parent(self, level: int, ids: List[str]):
+        summary = await self._call([self._summaries[i] for i in ids])
+        await self._commit(SummaryNode(hash_text(*ids), level, summary, ids))
+        for i in ids:
+            self._summaries.pop(i, None)
+        self.stats["parents"] += 1
+
+    async def _call(self, texts: List[str]) -> str:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            await self.rate.acquire()
+            return await self.summarize(texts)
+
+    def _append(self, line: str):
+        directory = os.path.dirname(self.journal)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.journal, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _commit(self, node: SummaryNode):
+        record = {
+            "id": node.id,
+            "level": node.level,
+            "summary": node.summary,
+            "children": node.children,
+        }
+        await asyncio.to_thread(self._append, _json_dumps(record) + "\n")
+        self._done.add(node.id)
+        self._summaries[node.id] = node.summary
+        self._levels.setdefault(node.level, []).append(node.id)
+        if self.store is not None:
+            try:
+                await self.store(node)
+            except Exception:
+                # Journaled already; ``recover`` stores it after a restart.
+                log.exception("storing summary %s failed", node.id)
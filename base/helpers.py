@@ -4,7 +4,9 @@ import hashlib
 import inspect
 import json
 import os
+import re
 import textwrap
+import weakref
 from datetime import datetime as dt
 from datetime import timezone as tz
 from enum import Enum
@@ -49,12 +51,9 @@ def iso_to_epoch(ts: str):
 
 
 def cosine_similarity(vec_a, vec_b):
-    dot_product = sum(a * b for a, b in zip(vec_a, vec_b))
-    magnitude_a = sum(a * a for a in vec_a) ** 0.5
-    magnitude_b = sum(b * b for b in vec_b) ** 0.5
-    if magnitude_a == 0 or magnitude_b == 0:
-        return 0
-    return dot_product / (magnitude_a * magnitude_b)
+    from base.core.similarity import cosine_similarity
+
+    return cosine_similarity(vec_a, vec_b)
 
 
 def generate_hash(file_path):
@@ -70,6 +69,14 @@ def generate_hash(file_path):
     return readable_hash
 
 
+def hash_text(*parts: str):
+    sha256_hash = hashlib.sha256()
+    for part in parts:
+        sha256_hash.update(part.encode("utf-8"))
+        sha256_hash.update(b"\x00")
+    return sha256_hash.hexdigest()
+
+
 def env(var: str):
     dotenv.load_dotenv()
     return dotenv.get_key(".env", var)
@@ -87,6 +94,7 @@ _IGNORED = {
     "kind",
     "created",
     "metadata",
+    "events",
     "_reply_future",
 }
 
@@ -110,16 +118,16 @@ def _json_type(tp: Any):
     return {"type": primitives.get(tp, "string")}
 
 
+_PARAM_DOC = re.compile(r"^\s*(\w+)\s*:\s*(.+?)(?=\n\s*\w+\s*:|\Z)", re.S | re.M)
+
+
 def _param_docs(func):
     doc = textwrap.dedent(inspect.getdoc(func) or "")
     body = next(
         (doc.split(h, 1)[1] for h in ("Args:", "Arguments:", "Parameters") if h in doc),
         "",
     )
-    import re
-
-    pat = re.compile(r"^\s*(\w+)\s*:\s*(.+?)(?=\n\s*\w+\s*:|\Z)", re.S | re.M)
-    return {n: " ".join(t.split()) for n, t in pat.findall(body)}
+    return {n: " ".join(t.split()) for n, t in _PARAM_DOC.findall(body)}
 
 
 def _func_schema(func):
@@ -162,7 +170,7 @@ def _type_schema(cls):
     }
 
 
-def serialize(obj: Any):
+def _build_schema(obj: Any):
     if inspect.isfunction(obj):
         return {
             "type": "function",
@@ -182,6 +190,72 @@ def serialize(obj: Any):
     raise TypeError(f"Unsupported object: {obj!r}")
 
 
+def _source_hash(obj: Any) -> str:
+    try:
+        source = inspect.getsource(obj)
+    except (OSError, TypeError):
+        source = repr(attrs.fields(obj)) if attrs.has(obj) else str(inspect.signature(obj))
+        source += inspect.getdoc(obj) or ""
+    return hash_text(source)
+
+
+@attrs.define
+class SchemaRegistry:
+    """Memoized ``serialize`` results.
+
+    Schemas are looked up by object first and then by qualname plus a hash
+    of the source, so a reloaded module with unchanged code reuses its
+    schemas and an edited one gets fresh ones. Returned schemas are shared;
+    do not mutate them.
+    """
+
+    _by_object: weakref.WeakKeyDictionary = attrs.field(
+        factory=weakref.WeakKeyDictionary, init=False
+    )
+    _by_source: Dict[tuple, Dict[str, Any]] = attrs.field(factory=dict, init=False)
+    stats: Dict[str, int] = attrs.field(
+        factory=lambda: {"hits": 0, "misses": 0, "builds": 0}
+    )
+
+    def __len__(self):
+        return len(self._by_source)
+
+    def get(self, obj: Any) -> Dict[str, Any]:
+        if not (inspect.isfunction(obj) or inspect.isclass(obj)):
+            raise TypeError(f"Unsupported object: {obj!r}")
+        schema = self._by_object.get(obj)
+        if schema is not None:
+            self.stats["hits"] += 1
+            return schema
+
+        self.stats["misses"] += 1
+        key = (obj.__module__, obj.__qualname__, _source_hash(obj))
+        schema = self._by_source.get(key)
+        if schema is None:
+            schema = self._by_source[key] = _build_schema(obj)
+            self.stats["builds"] += 1
+        self._by_object[obj] = schema
+        return schema
+
+    def register(self, obj: T) -> T:
+        """Build ``obj``'s schema now; usable as a decorator."""
+
+        if inspect.isfunction(obj) or inspect.isclass(obj):
+            self.get(obj)
+        return obj
+
+    def clear(self):
+        self._by_object.clear()
+        self._by_source.clear()
+
+
+SCHEMAS = SchemaRegistry()
+
+
+def serialize(obj: Any):
+    return SCHEMAS.get(obj)
+
+
 class Primitive(Enum):
     BOOLEAN = {"type": "number"}
     NUMBER = {"type": "integer"}
@@ -1,19 +1,69 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
-from base.api import api_router
+from base.api.main import api_router
 from base.config import settings
+from base.core.graph import GRAPH
+from base.core.lexical import LEXICAL
+from base.core.preferences import PREFERENCES
+from base.core.registry import REGISTRY, unsummarized_threads
+from base.core.snapshots import READER
+from base.core.storage import STORAGE, init_db
+from base.core.summarize import SummaryScheduler, store_summary
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
+    if not route.tags:
+        return route.name
     return f"{route.tags[0]}-{route.name}"
 
 
+async def save_lexical():
+    """Save the message index every ``INGEST_SNAPSHOT_INTERVAL`` seconds."""
+
+    while True:
+        await asyncio.sleep(settings.INGEST_SNAPSHOT_INTERVAL)
+        LEXICAL.save()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create missing tables, then run the registry sweep, the summary
+    scheduler (linking into ``GRAPH``), the snapshot reader and the message
+    index saver while the app serves."""
+
+    await init_db()
+    summaries = SummaryScheduler(
+        REGISTRY.threads, store=store_summary, backlog=unsummarized_threads, graph=GRAPH
+    )
+    tasks = [
+        REGISTRY.start(),
+        summaries.start(),
+        READER.start(),
+        asyncio.get_running_loop().create_task(save_lexical()),
+    ]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        REGISTRY.threads.on_transition = None
+        LEXICAL.save()
+        GRAPH.save()
+        await PREFERENCES.save()
+        await STORAGE.aclose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 
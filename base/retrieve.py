@@ -0,0 +1,13 @@
+from fastapi import FastAPI
+
+from base.api.retrieve import router
+from base.config import settings
+from base.main import custom_generate_unique_id
+
+app = FastAPI(
+    title=f"{settings.PROJECT_NAME} retrieve",
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    generate_unique_id_function=custom_generate_unique_id,
+)
+
+app.include_router(router, prefix=settings.API_V1_STR)
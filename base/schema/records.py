@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import Any
+
+from sqlalchemy import JSON, Column, Index
+from sqlmodel import Field, SQLModel
+
+
+class ThreadRecord(SQLModel, table=True):
+    __tablename__ = "threads"
+
+    thread_id: str = Field(primary_key=True)
+    state: str = Field(default="active")
+    summary: str | None = Field(default=None)
+    touched: float = Field(default=0.0)
+    history_last: int = Field(default=-1)
+    history_count: int = Field(default=0)
+
+
+class MessageRecord(SQLModel, table=True):
+    __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_thread_created", "thread_id", "created"),)
+
+    id: str = Field(primary_key=True)
+    thread_id: str
+    kind: str = Field(default="message")
+    content: Any = Field(default=None, sa_column=Column(JSON))
+    created: float = Field(default=0.0)
+
+
+class ThreadEventRecord(SQLModel, table=True):
+    __tablename__ = "thread_events"
+
+    id: int | None = Field(default=None, primary_key=True)
+    thread_id: str = Field(index=True)
+    event: str
+    at: str
+    content: str | None = Field(default=None)
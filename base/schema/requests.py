@@ -4,9 +4,18 @@ from pydantic import BaseModel
 class IngestRequest(BaseModel):
     text: str
     type: str = "message"
+    source: str | None = None
+    sender_id: str | None = None
+    thread_id: str | None = None
+    created: float | None = None
 
 
 class QueryRequest(BaseModel):
     text: str
     k: int = 8
     type: str | None = None
+    thread_id: str | None = None
+    budget: int | None = None
+    sender_id: str | None = None
+    since: float | None = None
+    until: float | None = None
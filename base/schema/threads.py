@@ -1,170 +1,253 @@
 from __future__ import annotations
 
+import asyncio
+import time
 from enum import Enum
 from datetime import timedelta
-from typing import Callable, List, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
 
 from attrs import define, field
 
-from base.core.helpers import timestamp
-from base.schema.context import Metadata
+from base.core.context import Metadata
+from base.core.segments import History
+from base.helpers import timestamp
 from base.schema.messages import Content
 
 
 THREAD_TIMEOUT = timedelta(minutes=30)
 
+Observer = Callable[["Thread", Content, List[float] | None], Awaitable[None] | None]
+
+_OBSERVERS: List[Observer] = []
+
+
+def observe(callback: Observer):
+    """Register ``callback`` to run after every ``Thread.update``.
+
+    Plain functions run inline, in registration order; coroutine functions
+    are awaited together, so their I/O overlaps.
+    """
+
+    _OBSERVERS.append(callback)
+    return callback
 
-class ThreadTransition(Enum):
-    CREATED = {"created": lambda: timestamp()}
-    ENCODED = {"encoded": lambda: timestamp()}
-    ARCHIVED = {"archived": lambda: timestamp()}
-    PRUNED = {"pruned": lambda: timestamp()}
 
-    def __init__(self, event):
-        self.event = event
+class ThreadTransition(Enum):
+    CREATED = "created"
+    ENCODED = "encoded"
+    ARCHIVED = "archived"
+    PRUNED = "pruned"
 
     def __call__(self, content: str = None):
+        event = {self.value: timestamp()}
         if content is not None:
-            self.event["content"] = content
-        return self.event
+            event["content"] = content
+        return event
+
+
+class ThreadState(Enum):
+    ACTIVE = "active"
+    ENCODED = "encoded"
+    ARCHIVED = "archived"
+    PRUNED = "pruned"
+
+
+_NEXT_STATE = {
+    ThreadState.ACTIVE: (ThreadState.ENCODED, ThreadTransition.ENCODED),
+    ThreadState.ENCODED: (ThreadState.ARCHIVED, ThreadTransition.ARCHIVED),
+    ThreadState.ARCHIVED: (ThreadState.PRUNED, ThreadTransition.PRUNED),
+}
 
 
 @define
 class Thread:
-    content: List[Content] = field(factory=list)
-    prev: Optional[Thread] = field(default=None)
-    next: Optional[Thread] = field(default=None)
+    metadata: Metadata = field(factory=Metadata)
+    content: History = field(factory=History)
+    prev: Optional[Thread] = field(default=None, repr=False)
+    next: Optional[Thread] = field(default=None, repr=False)
+    state: ThreadState = field(default=ThreadState.ACTIVE)
+    touched: float = field(factory=time.time)
+    owner: Optional[Threads] = field(default=None, repr=False, eq=False)
+    # ``messages`` rows appended since the thread was last saved.
+    unsaved: List[Dict[str, Any]] = field(factory=list, repr=False, eq=False)
+    # How many of ``metadata.events`` are already in storage.
+    saved_events: int = field(default=0, repr=False, eq=False)
 
     async def update(self, content: Content, *, embed: List[float] | None = None):
         self.content.append(content)
+        if self.owner is not None:
+            self.owner.touch(self)
+        else:
+            self.touched = time.time()
         if embed is not None:
             self.metadata.embedding = embed
-
-    def transition(self):
-        if self._NEXT is None or self._EVENT_AFTER is None:
-            raise NotImplementedError("Subclass didn’t set _NEXT/_EVENT_AFTER")
-        nxt = self._NEXT(
-            metadata=self.metadata,
-            prev=self.prev,
-            next=self.next,
-            content=self._transform_content(),
-        )
-        nxt._record(self._EVENT_AFTER)
-        return nxt
+        pending = [
+            res for callback in _OBSERVERS if (res := callback(self, content, embed)) is not None
+        ]
+        if pending:
+            await asyncio.gather(*pending)
 
     def _record(self, event: ThreadTransition, msg: str | None = None):
-        self.metadata.events.append(event(msg) if msg else event())
+        self.metadata.events.append(event(msg))
 
 
 @define
-class Threads:
-    maxlen: int = 0
-    index_threshold: int = 10
-    encode_threshold: int = 20
-    should_index: Callable[[Thread], bool] = lambda self, t: False
+class _Lane:
+    """Intrusive doubly linked list of the threads in one state.
+
+    ``prev``/``next`` on each ``Thread`` are the links; the head is always
+    the oldest (least recently touched) thread in the lane.
+    """
+
     head: Optional[Thread] = None
     tail: Optional[Thread] = None
-    counts: dict[str, int] = field(default=None)
+    size: int = 0
 
-    def append(self, *, metadata: Metadata = None, left: bool = False):
-        node = Thread(metadata or Metadata())
-        node._record(ThreadTransition.ACTIVATED)
-
-        if self.head is None:
-            self.head = self.tail = node
-        elif left:
-            node.next, self.head.prev = self.head, node
+    def push(self, node: Thread):
+        node.prev, node.next = self.tail, None
+        if self.tail is None:
             self.head = node
         else:
-            node.prev, self.tail.next = self.tail, node
-            self.tail = node
+            self.tail.next = node
+        self.tail = node
+        self.size += 1
+
+    def remove(self, node: Thread):
+        if node.prev is None:
+            self.head = node.next
+        else:
+            node.prev.next = node.next
+        if node.next is None:
+            self.tail = node.prev
+        else:
+            node.next.prev = node.prev
+        node.prev = node.next = None
+        self.size -= 1
 
-        self._bump(Thread, +1)
-        self._maybe_rollover()
+    def __iter__(self) -> Iterator[Thread]:
+        cur = self.head
+        while cur:
+            nxt = cur.next
+            yield cur
+            cur = nxt
+
+
+@define
+class Threads:
+    """Thread lifecycle engine: active → encoded → archived → pruned.
+
+    Each state has its own intrusive list, so finding the oldest thread of a
+    state, moving a thread between states and touching a thread are all
+    O(1). When a state holds more threads than its limit, its oldest threads
+    advance to the next state; pruned threads leave the container. A limit
+    of ``0`` means unbounded. ``on_transition`` is called with the thread and
+    its new state after every move.
+    """
+
+    maxlen: int = 0
+    encode_threshold: int = 20
+    archive_threshold: int = 0
+    on_transition: Callable[[Thread, ThreadState], None] | None = None
+    lanes: Dict[ThreadState, _Lane] = field(
+        factory=lambda: {s: _Lane() for s in ThreadState if s is not ThreadState.PRUNED}
+    )
+    pruned: int = 0
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return {s.value: lane.size for s, lane in self.lanes.items()} | {
+            ThreadState.PRUNED.value: self.pruned
+        }
+
+    def __len__(self):
+        return sum(lane.size for lane in self.lanes.values())
+
+    def append(self, *, metadata: Metadata = None) -> Thread:
+        node = Thread(metadata or Metadata(), owner=self)
+        node._record(ThreadTransition.CREATED)
+        self.lanes[ThreadState.ACTIVE].push(node)
+        self._rollover()
         return node
 
-    def pop(self, *, left: bool = False):
-        if self.head is None:
-            raise IndexError("pop from empty Threads")
-        node = self.head if left else self.tail
-        self._detach(node)
-        self._bump(type(node).__name__, -1)
+    def add(self, node: Thread) -> Thread:
+        """Track an existing thread, e.g. one loaded from storage.
+
+        It joins the young end of its lane; ``touch`` it if it was just used.
+        """
+
+        if node.owner is self or node.state is ThreadState.PRUNED:
+            return node
+        node.owner = self
+        self.lanes[node.state].push(node)
+        self._rollover()
         return node
 
-    def walk(self, *types):
-        cur = self.head
-        while cur:
-            if not types or isinstance(cur, types):
-                yield cur
-            cur = cur.next
+    def discard(self, node: Thread):
+        """Stop tracking ``node`` without changing its state."""
 
-    def _bump(self, name: str, d: int):
-        self.counts[name] += d
+        if node.owner is self:
+            self.lanes[node.state].remove(node)
+            node.owner = None
 
-    def _detach(self, n: Thread):
-        if n.prev:
-            n.prev.next = n.next
-        else:
-            self.head = n.next
-        if n.next:
-            n.next.prev = n.prev
-        else:
-            self.tail = n.prev
-        n.prev = n.next = None
-
-    def _maybe_rollover(self):
-        self._rollover(Thread, self.maxlen, self._index)
-        self._rollover(Thread, self.index_threshold, self._advance_stale)
-
-    def _rollover(self, kind, limit: int, advance: Callable[[Thread], Thread]):
-        while self.counts.get(kind, 0) > limit:
-            node = self._oldest(kind)
-            if node is None:
-                break
-            nxt = advance(node)
-            self._replace(node, nxt)
-
-    def _index(self, thread: Thread):
-        nxt = Thread(
-            metadata=thread.metadata,
-            prev=thread.prev,
-            next=thread.next,
-            content=thread.content,
-        )
-        nxt._record(ThreadTransition.TimedOut)
-        self._shift_counts(Thread, Thread)
-        return nxt
-
-    def _advance_stale(self, node: Thread):
-        dequeue = self.should_index(node)
-        nxt = node.transition(purge=dequeue)
-        self._shift_counts(Thread, type(nxt).__name__)
-        if dequeue:
-            return nxt
-
-        self._replace(node, nxt)
-        self._rollover(Thread, self.encode_threshold, self._purge_encoded)
-        return nxt
-
-    def _shift_counts(self, frm, to):
-        self.counts[frm] -= 1
-        self.counts[to] += 1
-
-    def _oldest(self, kind):
-        cls = kind if isinstance(kind, type) else globals()[kind]
-        cur = self.head
-        while cur and not isinstance(cur, cls):
-            cur = cur.next
-        return cur
+    def pop(self, state: ThreadState = ThreadState.ACTIVE, *, left: bool = False) -> Thread:
+        lane = self.lanes[state]
+        node = lane.head if left else lane.tail
+        if node is None:
+            raise IndexError(f"pop from empty {state.value} threads")
+        lane.remove(node)
+        node.owner = None
+        return node
 
-    def _replace(self, old: Thread, new: Thread):
-        if old.prev:
-            old.prev.next = new
-        else:
-            self.head = new
-        if old.next:
-            old.next.prev = new
+    def oldest(self, state: ThreadState = ThreadState.ACTIVE) -> Thread | None:
+        return self.lanes[state].head
+
+    def touch(self, node: Thread):
+        """Mark ``node`` as used now, moving it to the young end of its lane."""
+
+        node.touched = time.time()
+        lane = self.lanes[node.state]
+        if lane.tail is not node:
+            lane.remove(node)
+            lane.push(node)
+
+    def advance(self, node: Thread) -> Thread:
+        """Move ``node`` to the next lifecycle state."""
+
+        state, event = _NEXT_STATE[node.state]
+        self.lanes[node.state].remove(node)
+        node.state = state
+        node._record(event)
+        if state is ThreadState.PRUNED:
+            self.pruned += 1
+            node.owner = None
         else:
-            self.tail = new
-        new.prev, new.next = old.prev, old.next
-        old.prev = old.next = None
+            self.lanes[state].push(node)
+        if self.on_transition is not None:
+            self.on_transition(node, state)
+        return node
+
+    def advance_stale(self, timeout: timedelta = THREAD_TIMEOUT, now: float | None = None) -> int:
+        """Encode active threads untouched for ``timeout``; oldest first."""
+
+        cutoff = (now or time.time()) - timeout.total_seconds()
+        lane, moved = self.lanes[ThreadState.ACTIVE], 0
+        while lane.head is not None and lane.head.touched <= cutoff:
+            self.advance(lane.head)
+            moved += 1
+        if moved:
+            self._rollover()
+        return moved
+
+    def walk(self, *states: ThreadState) -> Iterator[Thread]:
+        for state in states or tuple(self.lanes):
+            yield from self.lanes[state]
+
+    def _rollover(self):
+        for state, limit in (
+            (ThreadState.ACTIVE, self.maxlen),
+            (ThreadState.ENCODED, self.encode_threshold),
+            (ThreadState.ARCHIVED, self.archive_threshold),
+        ):
+            lane = self.lanes[state]
+            while limit and lane.size > limit:
+                self.advance(lane.head)
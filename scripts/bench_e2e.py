@@ -0,0 +1,410 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tomllib
+
+from aiohttp import ClientError, ClientSession
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOPICS = [
+    "billing", "deployment", "postgres", "redis", "latency", "onboarding", "invoices",
+    "search", "embeddings", "backups", "alerts", "migrations", "permissions", "exports",
+]
+WORDS = [
+    "failed", "slow", "yesterday", "again", "retry", "timeout", "config", "staging",
+    "production", "customer", "weekly", "report", "token", "limit", "cache", "index",
+]
+
+
+def conversations(threads: int, turns: int, seed: int):
+    """Interleaved turns of ``threads`` synthetic conversations, same for a seed."""
+
+    rng = random.Random(seed)
+    plans = [
+        (f"thread-{t}", f"user-{rng.randrange(max(threads // 4, 1))}", rng.sample(TOPICS, 3))
+        for t in range(threads)
+    ]
+    for turn in range(turns):
+        for thread_id, sender_id, topics in plans:
+            topic = topics[turn % len(topics)]
+            words = " ".join(rng.choices(WORDS, k=rng.randint(4, 24)))
+            yield {
+                "text": f"{sender_id} on {topic}: {words}",
+                "thread_id": thread_id,
+                "sender_id": sender_id,
+                "created": time.time(),
+            }, topic
+
+
+def release() -> str:
+    root = os.path.join(os.path.dirname(__file__), "..", "pyproject.toml")
+    with open(root, "rb") as f:
+        return tomllib.load(f)["project"]["version"]
+
+
+def peak_rss_mb(pid: int | None = None) -> float | None:
+    """Peak RSS of this process, or of a running child ``pid`` (Linux only)."""
+
+    if pid is None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS.
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+
+async def accepting(port: int) -> bool:
+    try:
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        return False
+    writer.close()
+    await writer.wait_closed()
+    return True
+
+
+async def drive(client, path: str, bodies, clients: int, histogram):
+    slots = asyncio.Semaphore(clients)
+    status = {}
+
+    async def one(body):
+        async with slots:
+            start = time.perf_counter()
+            res = await client.post(path, json=body)
+            histogram.observe(time.perf_counter() - start)
+            status[res.status_code] = status.get(res.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(b) for b in bodies))
+    wall = time.perf_counter() - start
+    return histogram.snapshot() | {
+        "per_s": len(bodies) / wall,
+        "errors": sum(n for code, n in status.items() if code >= 400),
+        "status": status,
+    }
+
+
+async def model_stats(port: int, wait: float = 0.0) -> dict:
+    deadline = time.monotonic() + wait
+    async with ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/stats") as res:
+                    return await res.json()
+            except ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def until(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not await check():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"timed out waiting for {what}")
+        await asyncio.sleep(0.01)
+
+
+async def run(args) -> dict:
+    # The fake model server and the ingest workers get their own processes
+    # so they do not share the event loop, and the CPU time they cost, with
+    # the service under test.
+    root = tempfile.mkdtemp(prefix="bench-e2e-")
+    tag = f"bench-e2e-{os.getpid()}"
+    redis = None
+    if args.redis_url is None:
+        if shutil.which(args.redis_server) is None:
+            sys.exit(f"{args.redis_server} not found; install Redis or pass --redis-url")
+        redis = subprocess.Popen(
+            [args.redis_server, "--port", str(args.redis_port), "--save", "", "--appendonly", "no"],
+            stdout=subprocess.DEVNULL,
+        )
+        args.redis_url = f"redis://127.0.0.1:{args.redis_port}/0"
+    os.environ.update(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.port}/v1",
+        OPENAI_API_KEY="local",
+        REDIS_URL=args.redis_url,
+        REDIS_STREAM_KEY=f"{tag}:ingest",
+        INGEST_DEAD_LETTER_KEY=f"{tag}:dead",
+        INGEST_SNAPSHOT_INTERVAL=str(args.snapshot_interval),
+        RETRIEVE_RELOAD_INTERVAL=str(args.snapshot_interval),
+        DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(root, 'bench.db')}",
+        EMBED_DIMENSIONS=str(args.dimensions),
+        EMBED_CACHE_DIR=os.path.join(root, "embeddings"),
+        INDEX_DIR=os.path.join(root, "indexes"),
+        MESSAGES_DIR=os.path.join(root, "messages"),
+        SNAPSHOT_DIR=os.path.join(root, "snapshots"),
+        INGEST_SPOOL_DIR=os.path.join(root, "uploads"),
+        SUMMARY_JOURNAL=os.path.join(root, "summaries.jsonl"),
+        PREFERENCES_JOURNAL=os.path.join(root, "preferences.jsonl"),
+    )
+    scripts = os.path.dirname(os.path.abspath(__file__))
+    fake = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(scripts, "fake_openai.py"),
+            f"--port={args.port}",
+            f"--latency={args.latency}",
+            f"--dimensions={args.dimensions}",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    workers = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(scripts, "ingest_workers.py"),
+            f"--consumers={args.consumers}",
+        ],
+        stdout=subprocess.DEVNULL,
+        # The pool starts its own children; a session lets them go together.
+        start_new_session=True,
+    )
+    try:
+        await model_stats(args.port, wait=10.0)
+        if redis is not None:
+            await until(lambda: accepting(args.redis_port), 10.0, "redis-server to start")
+        report = await measure(args, tag)
+        report["peak_rss_mb"] |= {
+            "workers": peak_rss_mb(workers.pid),
+            "model": peak_rss_mb(fake.pid),
+        }
+        return report
+    finally:
+        os.killpg(workers.pid, signal.SIGTERM)
+        workers.wait()
+        for child in (fake, redis):
+            if child is not None:
+                child.terminate()
+                child.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+async def measure(args, tag: str) -> dict:
+    # Settings are read on import, so everything under base is imported here.
+    import httpx
+
+    from base.config import redis_client, settings
+    from base.core.context_cache import CONTEXT_CACHE
+    from base.core.gateway import LatencyHistogram
+    from base.core.indexes import EMBED_CACHE
+    from base.core.snapshots import READER, read_manifest
+    from base.main import app
+
+    redis = redis_client(decode_responses=True)
+    CONTEXT_CACHE.prefix = tag
+
+    def histogram():
+        return LatencyHistogram(base=1e-4, growth=1.05, size=320)
+
+    workload = list(conversations(args.threads, args.turns, args.seed))
+    slices = {}
+    for m, _ in workload:
+        slices.setdefault((m["thread_id"], m["sender_id"]), []).append(m["text"])
+    transport = httpx.ASGITransport(app=app)
+    report = {"release": args.release, "workload": vars(args) | {"messages": len(workload)}}
+    # ASGITransport does not run the lifespan, so the registry sweep, the
+    # summary scheduler and the snapshot reader are started here.
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        start = time.perf_counter()
+        report["ingest"] = await drive(
+            client, "/api/v1/ingest", [m for m, _ in workload], args.clients, histogram()
+        )
+        report["messages"] = await drive(
+            client, "/api/v1/messages", [m for m, _ in workload], args.clients, histogram()
+        )
+        report["preferences"] = await drive(
+            client,
+            "/api/v1/preferences",
+            [{"text": "\n".join(t), "sender_id": s} for (_, s), t in slices.items()],
+            args.clients,
+            histogram(),
+        )
+        async def drained_queue():
+            return not await redis.xlen(settings.REDIS_STREAM_KEY)
+
+        await until(drained_queue, args.timeout, "the ingest queue to drain")
+        drained = time.perf_counter() - start
+        # /context searches what the workers publish. The next version may
+        # have been saved before the queue drained; the one after cannot.
+        visible = read_manifest(settings.SNAPSHOT_DIR).get("version", 0) + 2
+
+        async def published():
+            return read_manifest(settings.SNAPSHOT_DIR).get("version", 0) >= visible
+
+        await until(published, args.timeout, "the workers to publish a snapshot")
+        READER.refresh()
+        report["indexed"] = {
+            "per_s": len(workload) / drained,
+            "seconds": drained,
+            "published": time.perf_counter() - start,
+            "vectors": READER.info()["vectors"],
+            "dead": await redis.xlen(settings.INGEST_DEAD_LETTER_KEY),
+        }
+
+        rng = random.Random(args.seed + 1)
+        queries = [
+            {
+                "text": f"{topic} {' '.join(rng.choices(WORDS, k=3))}",
+                "thread_id": m["thread_id"],
+                "sender_id": m["sender_id"],
+                "k": 8,
+            }
+            for m, topic in rng.sample(workload, min(args.queries, len(workload)))
+        ]
+        report["context"] = await drive(
+            client, "/api/v1/context", queries, args.clients, histogram()
+        )
+
+    await redis.delete(settings.REDIS_STREAM_KEY, settings.INGEST_DEAD_LETTER_KEY)
+    await redis.aclose()
+    report["model_calls"] = await model_stats(args.port)
+    report["embed_cache"] = EMBED_CACHE.info()
+    report["peak_rss_mb"] = {"api": peak_rss_mb()}
+    return report
+
+
+# Timings, compared with --tolerance: (path into the report, higher is better).
+TIMINGS = [
+    (("ingest", "per_s"), True),
+    (("ingest", "p99"), False),
+    (("messages", "per_s"), True),
+    (("messages", "p99"), False),
+    (("preferences", "p99"), False),
+    (("indexed", "per_s"), True),
+    (("context", "per_s"), True),
+    (("context", "p50"), False),
+    (("context", "p99"), False),
+    (("peak_rss_mb", "api"), False),
+    (("peak_rss_mb", "workers"), False),
+]
+# Counts of a deterministic workload, compared with --calls-tolerance.
+COUNTS = [
+    ("ingest", "errors"),
+    ("messages", "errors"),
+    ("preferences", "errors"),
+    ("indexed", "dead"),
+    ("context", "errors"),
+    ("model_calls", "embeddings"),
+    ("model_calls", "inputs"),
+    ("model_calls", "responses"),
+]
+
+
+def _at(report: dict, path) -> float | None:
+    for key in path:
+        report = report.get(key, {}) if isinstance(report, dict) else {}
+    return report if isinstance(report, (int, float)) else None
+
+
+def regressions(report: dict, baseline: dict, tolerance: float, calls: float):
+    """Metrics worse than ``baseline`` by more than the allowed fraction."""
+
+    out = []
+    for path, higher in TIMINGS:
+        new, old = _at(report, path), _at(baseline, path)
+        if new is None or not old:
+            continue
+        change = (old - new) / old if higher else (new - old) / old
+        if change > tolerance:
+            out.append((".".join(path), old, new, change))
+    for path in COUNTS:
+        new, old = _at(report, path), _at(baseline, path)
+        if new is None or old is None:
+            continue
+        if new > old * (1 + calls):
+            out.append((".".join(path), old, new, (new - old) / old if old else float("inf")))
+    return out
+
+
+def show(report: dict):
+    print(f"{'phase':>11} {'count':>7} {'per s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for phase in ("ingest", "messages", "preferences", "context"):
+        s = report[phase]
+        print(
+            f"{phase:>11} {s['count']:>7} {s['per_s']:>9.0f} "
+            f"{s['p50'] * 1000:>8.1f} {s['p99'] * 1000:>8.1f}   errors {s['errors']}"
+        )
+    i = report["indexed"]
+    print(
+        f"{'indexed':>11} {i['vectors']:>7} {i['per_s']:>9.0f}   dead {i['dead']}, "
+        f"searchable after {i['published']:.1f} s"
+    )
+    c = report["model_calls"]
+    print(
+        f"model calls: {c['embeddings']} embedding requests for {c['inputs']} inputs, "
+        f"{c['responses']} responses"
+    )
+    rss = ", ".join(
+        f"{name} {mb:.0f}" for name, mb in report["peak_rss_mb"].items() if mb is not None
+    )
+    print(f"peak RSS (MiB): {rss}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay synthetic conversations through the API."
+    )
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--consumers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument(
+        "--redis-url",
+        default=os.environ.get("REDIS_URL"),
+        help="existing server to use; without it a local redis-server is started",
+    )
+    parser.add_argument("--redis-server", default="redis-server", help="binary to start")
+    parser.add_argument("--redis-port", type=int, default=9103)
+    parser.add_argument("--snapshot-interval", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--release", default=release())
+    parser.add_argument("--results", default="bench/e2e.json")
+    parser.add_argument("--baseline", help="release in --results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--calls-tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    show(report)
+
+    results = {}
+    if os.path.exists(args.results):
+        with open(args.results, "r") as f:
+            results = json.load(f)
+    baseline = results.get(args.baseline) if args.baseline else None
+    results[args.release] = report
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    with open(args.results, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline and baseline is None:
+        sys.exit(f"no results for release {args.baseline} in {args.results}")
+    if baseline is not None:
+        failed = regressions(report, baseline, args.tolerance, args.calls_tolerance)
+        for name, old, new, change in failed:
+            print(f"REGRESSION {name}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+        sys.exit(1 if failed else 0)
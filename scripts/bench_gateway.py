@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from aiohttp import web
+from openai import AsyncOpenAI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from base.core.gateway import Gateway, LatencyHistogram  # noqa: E402
+from fake_openai import make_app  # noqa: E402
+
+
+async def run(args):
+    app = make_app(
+        args.latency,
+        fail_rate=args.fail_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+    )
+    # Cancelled hedges show up as dropped connections on the server.
+    logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    client = AsyncOpenAI(base_url=f"http://127.0.0.1:{args.port}/v1", api_key="local")
+
+    print(f"{'hedge':>6} {'calls':>6} {'errors':>6} {'retries':>7} {'hedged':>6} {'wins':>5} "
+          f"{'limit':>6} {'p50 ms':>7} {'p99 ms':>7} {'wall s':>7}")
+    for hedge in (None, args.hedge):
+        gateway = Gateway(
+            client,
+            rate=args.rate,
+            concurrency=args.concurrency,
+            hedge_quantile=hedge,
+            backoff=0.05,
+        )
+        observed = LatencyHistogram()
+        slots = asyncio.Semaphore(args.clients)
+
+        async def one(i):
+            async with slots:
+                start = time.perf_counter()
+                try:
+                    await gateway.responses.create(model="fake", input=f"request {i}")
+                except Exception:
+                    return
+                observed.observe(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - start
+        s = gateway.stats()["fake"]
+        print(
+            f"{str(hedge):>6} {s['calls']:>6} {s['errors']:>6} {s['retries']:>7} "
+            f"{s['hedged']:>6} {s['hedge_wins']:>5} {s['limit']:>6.1f} "
+            f"{observed.quantile(0.5) * 1000:>7.0f} {observed.quantile(0.99) * 1000:>7.0f} "
+            f"{wall:>7.2f}"
+        )
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model gateway against a local fake server.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=1000.0)
+    parser.add_argument("--concurrency", type=float, default=8.0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--fail-rate", type=float, default=0.01)
+    parser.add_argument("--slow-rate", type=float, default=0.02)
+    parser.add_argument("--slow-latency", type=float, default=0.5)
+    parser.add_argument("--hedge", type=float, default=0.95)
+    parser.add_argument("--port", type=int, default=9101)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,67 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+
+def import_times(module: str):
+    """Import ``module`` in a fresh interpreter; return ``{name: (self, cumulative)}`` in us."""
+
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if res.returncode != 0:
+        sys.exit(f"import {module} failed:\n{res.stderr}")
+
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        if own.strip().isdigit():
+            times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def run(module: str, repeats: int, budget: float, top: int) -> bool:
+    runs = [import_times(module) for _ in range(repeats)]
+    totals = [r[module][1] / 1000 for r in runs]
+
+    packages = defaultdict(list)
+    for r in runs:
+        per_run = defaultdict(int)
+        for name, (own, _) in r.items():
+            per_run[name.split(".")[0]] += own
+        for name, us in per_run.items():
+            packages[name].append(us / 1000)
+
+    print(f"{'package':<24} {'ms (median self time)':>22}")
+    ranked = sorted(packages.items(), key=lambda kv: statistics.median(kv[1]), reverse=True)
+    for name, ms in ranked[:top]:
+        print(f"{name:<24} {statistics.median(ms):>22.1f}")
+
+    median = statistics.median(totals)
+    ok = median <= budget
+    print(
+        f"\nimport {module}: median {median:.0f} ms over {repeats} runs "
+        f"(min {min(totals):.0f}, max {max(totals):.0f}), budget {budget:.0f} ms "
+        f"-> {'ok' if ok else 'OVER BUDGET'}"
+    )
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import time of the service against a budget.")
+    parser.add_argument("--module", default="base.main")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1000.0, help="milliseconds")
+    parser.add_argument("--top", type=int, default=12)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.module, args.repeats, args.budget, args.top) else 1)
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from base.core.ann import VectorIndex  # noqa: E402
+from base.core.indexes import Indexes  # noqa: E402
+from base.core.retrieval import Retriever, build_filter  # noqa: E402
+from base.core.similarity import normalize, top_k  # noqa: E402
+
+DAY = 24 * 3600.0
+TYPES = ["message", "doc", "note"]
+
+
+class QueryVectors:
+    """Embedder for the benchmark: the query text is a key into ``vectors``."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    async def embed(self, text):
+        return self.vectors[int(text)]
+
+
+def corpus(n, dim, clusters, senders, now, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((clusters, dim)))
+    labels = rng.integers(clusters, size=n)
+    vectors = normalize(centers[labels] + 0.35 * rng.standard_normal((n, dim)) / np.sqrt(dim) * 4)
+    payloads = [
+        {
+            "type": TYPES[i % len(TYPES)],
+            "sender_id": f"u{rng.integers(senders)}",
+            "created": float(now - rng.uniform(0, 90 * DAY)),
+        }
+        for i in range(n)
+    ]
+    return vectors, payloads
+
+
+def matches(payload, filter):
+    for key, want in (filter or {}).items():
+        value = payload.get(key)
+        if isinstance(want, dict):
+            if value is None or not (want.get("gte", -np.inf) <= value <= want.get("lte", np.inf)):
+                return False
+        elif value != want:
+            return False
+    return True
+
+
+def exact(vectors, payloads, queries, filters, k):
+    truth = []
+    for q, f in zip(queries, filters):
+        rows = np.array([i for i, p in enumerate(payloads) if matches(p, f)], dtype=np.int64)
+        scores = vectors[rows] @ q
+        truth.append({str(rows[i]) for i in top_k(scores, k)})
+    return truth
+
+
+def measure(search, queries, filters, truth, k):
+    recalls, times = [], []
+    for q, f, want in zip(queries, filters, truth):
+        t0 = time.perf_counter()
+        hits = search(q, f)
+        times.append(time.perf_counter() - t0)
+        got = {h["id"] for h in hits[:k]}
+        recalls.append(len(got & want) / max(len(want), 1))
+    ms = np.array(times) * 1000
+    return np.mean(recalls), np.percentile(ms, 50), np.percentile(ms, 95)
+
+
+def run(n, dim, clusters, queries, k, senders):
+    now = time.time()
+    vectors, payloads = corpus(n, dim, clusters, senders, now)
+    index = VectorIndex(dim=dim)
+    t0 = time.perf_counter()
+    for start in range(0, n, 10_000):
+        index.add(
+            [str(i) for i in range(start, min(start + 10_000, n))],
+            vectors[start : start + 10_000],
+            payloads[start : start + 10_000],
+        )
+    print(f"indexed {n} x {dim} in {time.perf_counter() - t0:.1f}s, {len(index._lists)} cells")
+
+    rng = np.random.default_rng(1)
+    picks = rng.integers(n, size=queries)
+    qs = normalize(vectors[picks] + 0.1 * rng.standard_normal((queries, dim)) / np.sqrt(dim))
+    plain = [None] * queries
+    narrow = [
+        build_filter(sender_id=payloads[i]["sender_id"], since=now - 30 * DAY) for i in picks
+    ]
+    broad = [build_filter(type=payloads[i]["type"]) for i in picks]
+
+    print(f"{'filter':>8} {'mode':>10} {'nprobe':>6} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, filters in (("none", plain), ("type", broad), ("sender+30d", narrow)):
+        truth = exact(vectors, payloads, qs, filters, k)
+        for nprobe in (1, 4, 8, 16, 32):
+            r, p50, p95 = measure(
+                lambda q, f: index.search(q, k, filter=f, nprobe=nprobe), qs, filters, truth, k
+            )
+            print(f"{label:>8} {'pushdown':>10} {nprobe:>6} {r:>9.3f} {p50:>8.2f} {p95:>8.2f}")
+        if label != "none":
+            r, p50, p95 = measure(
+                lambda q, f: [
+                    h for h in index.search(q, 4 * k) if matches(h["payload"], f)
+                ],
+                qs,
+                filters,
+                truth,
+                k,
+            )
+            print(f"{label:>8} {'postfilter':>10} {index.nprobe:>6} {r:>9.3f} {p50:>8.2f} {p95:>8.2f}")
+
+    # Recall of the fused ranking is still measured against pure cosine
+    # order, so it shows how far the recency term moves results.
+    indexes = Indexes(indexes={"default": index}, dim=dim)
+    truth = exact(vectors, payloads, qs, narrow, k)
+    lookup = {q.tobytes(): i for i, q in enumerate(qs)}
+    for weight in (0.0, 0.1, 0.5):
+        retriever = Retriever(indexes, QueryVectors(qs), recency_weight=weight)
+        retriever._loaded = True
+
+        def fused(q, f):
+            return asyncio.run(retriever.search(str(lookup[q.tobytes()]), k, filter=f, now=now))
+
+        r, p50, p95 = measure(fused, qs, narrow, truth, k)
+        mode = f"fused@{weight}"
+        print(f"{'sender+30d':>8} {mode:>10} {index.nprobe:>6} {r:>9.3f} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k against latency for filtered retrieval.")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--senders", type=int, default=50)
+    args = parser.parse_args()
+    run(args.n, args.dim, args.clusters, args.queries, args.k, args.senders)
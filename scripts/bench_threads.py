@@ -0,0 +1,34 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from base.schema.threads import Threads  # noqa: E402
+
+
+def run(total: int, window: int, maxlen: int, encoded: int, archived: int):
+    threads = Threads(maxlen=maxlen, encode_threshold=encoded, archive_threshold=archived)
+    print(f"{'appended':>10} {'ns/append':>10} {'active':>8} {'encoded':>8} {'archived':>8} {'pruned':>10}")
+    for start in range(0, total, window):
+        t0 = time.perf_counter_ns()
+        for _ in range(window):
+            threads.append()
+        per = (time.perf_counter_ns() - t0) / window
+        c = threads.counts
+        print(
+            f"{start + window:>10} {per:>10.0f} {c['active']:>8} {c['encoded']:>8} "
+            f"{c['archived']:>8} {c['pruned']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-append cost of Threads rollover.")
+    parser.add_argument("--total", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, default=100_000)
+    parser.add_argument("--maxlen", type=int, default=1_000)
+    parser.add_argument("--encoded", type=int, default=10_000)
+    parser.add_argument("--archived", type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.total, args.window, args.maxlen, args.encoded, args.archived)
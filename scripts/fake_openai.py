@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import struct
+
+from aiohttp import web
+
+DIMENSIONS = 1536
+
+
+def fake_vector(text: str, dimensions: int = DIMENSIONS):
+    out, seed = [], hashlib.sha256(text.encode()).digest()
+    while len(out) < dimensions:
+        seed = hashlib.sha256(seed).digest()
+        out.extend(v / 2**31 for v in struct.unpack("<8i", seed))
+    return out[:dimensions]
+
+
+def make_app(
+    latency: float = 0.0,
+    dimensions: int = DIMENSIONS,
+    fail_rate: float = 0.0,
+    slow_rate: float = 0.0,
+    slow_latency: float = 1.0,
+):
+    """``fail_rate`` of requests get a 429 or 503; ``slow_rate`` of them take
+    ``slow_latency`` seconds instead of ``latency``."""
+
+    calls = {"embeddings": 0, "inputs": 0, "responses": 0, "failed": 0}
+
+    async def delay():
+        """Return an error response, or sleep and return ``None``."""
+
+        if random.random() < fail_rate:
+            calls["failed"] += 1
+            return web.json_response(
+                {"error": {"message": "fake failure", "type": "fake"}},
+                status=random.choice((429, 503)),
+                headers={"retry-after": "0"},
+            )
+        wait = slow_latency if random.random() < slow_rate else latency
+        if wait:
+            await asyncio.sleep(wait)
+
+    async def embeddings(request: web.Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        calls["embeddings"] += 1
+        calls["inputs"] += len(inputs)
+        if (error := await delay()) is not None:
+            return error
+
+        return web.json_response(
+            {
+                "object": "list",
+                "model": body.get("model", "fake"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_vector(t, dimensions)}
+                    for i, t in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+        )
+
+    async def responses(request: web.Request):
+        body = await request.json()
+        calls["responses"] += 1
+        if (error := await delay()) is not None:
+            return error
+
+        digest = hashlib.sha256(str(body.get("input")).encode()).hexdigest()[:12]
+        text = f"Response {digest}\nGenerated for {body.get('model', 'fake')}."
+        if (body.get("text") or {}).get("format", {}).get("type") == "json_object":
+            text = json.dumps({"style": f"style-{digest[:2]}"})
+        return web.json_response(
+            {
+                "id": f"resp_{digest}",
+                "object": "response",
+                "created_at": 0,
+                "model": body.get("model", "fake"),
+                "status": "completed",
+                "output": [
+                    {
+                        "type": "message",
+                        "id": f"msg_{digest}",
+                        "role": "assistant",
+                        "status": "completed",
+                        "content": [{"type": "output_text", "text": text, "annotations": []}],
+                    }
+                ],
+                "parallel_tool_calls": False,
+                "tool_choice": "auto",
+                "tools": [],
+            }
+        )
+
+    async def stats(request: web.Request):
+        return web.json_response(calls)
+
+    app = web.Application()
+    app.router.add_post("/v1/embeddings", embeddings)
+    app.router.add_post("/v1/responses", responses)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI API.")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--dimensions", type=int, default=DIMENSIONS)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    args = parser.parse_args()
+    app = make_app(
+        args.latency,
+        dimensions=args.dimensions,
+        fail_rate=args.fail_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+    )
+    web.run_app(app, port=args.port, access_log=None)
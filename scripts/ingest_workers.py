@@ -0,0 +1,13 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from base.core.ingest import run_pool  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drain the ingest stream.")
+    parser.add_argument("--consumers", type=int, default=4)
+    args = parser.parse_args()
+    run_pool(args.consumers)
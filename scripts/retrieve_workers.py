@@ -0,0 +1,19 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve /query from published index snapshots.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    # Workers only read the embedding cache the ingest side writes.
+    os.environ.setdefault("EMBED_CACHE_READONLY", "true")
+
+    import uvicorn
+
+    uvicorn.run("base.retrieve:app", host=args.host, port=args.port, workers=args.workers)
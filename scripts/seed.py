@@ -1,22 +1,107 @@
+import argparse
 import asyncio
-import sys
+import json
+import os
+from urllib.parse import quote
 
 import aiohttp
 
-ingest_url = "http://localhost:8000/ingest"
+base_url = "http://localhost:8000"
 
+BLOCK_SIZE = 1 << 16
+ARCHIVE_SUFFIXES = (".jsonl", ".ndjson")
 
-async def seed_file(path):
-    text = open(path).read()
-    async with aiohttp.ClientSession() as session:
-        async with session.post(ingest_url, json={"text": text, "type": "doc"}) as resp:
+
+async def read_file(path):
+    with open(path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            yield block
+
+
+def read_batches(path, batch_size):
+    """Yield lists of at most ``batch_size`` non-empty NDJSON lines."""
+
+    batch = []
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                batch.append(line.rstrip(b"\n"))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+async def seed_file(session, limit, path):
+    url = f"{base_url}/ingest/file?source={quote(os.path.abspath(path))}"
+    async with limit:
+        async with session.post(url, data=read_file(path)) as resp:
             result = await resp.json()
             print(path, result)
 
 
-async def main(paths):
-    await asyncio.gather(*(seed_file(p) for p in paths))
+async def send_batch(session, lines, retries=5):
+    """Post one NDJSON batch, resending items the server rejected."""
+
+    counts = {"queued": 0, "invalid": 0, "rejected": 0}
+    for attempt in range(retries + 1):
+        async with session.post(
+            f"{base_url}/ingest/batch",
+            data=b"\n".join(lines),
+            headers={"Content-Type": "application/x-ndjson"},
+        ) as resp:
+            if resp.status == 503:
+                results = [{"index": i, "status": "rejected"} for i in range(len(lines))]
+            else:
+                resp.raise_for_status()
+                results = [json.loads(line) async for line in resp.content if line.strip()]
+
+        rejected = [lines[r["index"]] for r in results if r["status"] == "rejected"]
+        for r in results:
+            if r["status"] != "rejected":
+                counts[r["status"]] += 1
+        if not rejected or attempt == retries:
+            counts["rejected"] = len(rejected)
+            return counts
+        lines = rejected
+        await asyncio.sleep(2**attempt)
+
+
+async def seed_archive(session, limit, path, batch_size):
+    pending, totals = set(), {"queued": 0, "invalid": 0, "rejected": 0}
+
+    def collect(done):
+        for task in done:
+            for k, v in task.result().items():
+                totals[k] += v
+
+    for lines in read_batches(path, batch_size):
+        if len(pending) >= limit:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            collect(done)
+        pending.add(asyncio.create_task(send_batch(session, lines)))
+    if pending:
+        collect((await asyncio.wait(pending))[0])
+    print(path, totals)
+
+
+async def main(paths, concurrency=8, batch_size=500):
+    files = [p for p in paths if not p.endswith(ARCHIVE_SUFFIXES)]
+    archives = [p for p in paths if p.endswith(ARCHIVE_SUFFIXES)]
+    limit = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(seed_file(session, limit, p) for p in files))
+        for path in archives:
+            await seed_archive(session, concurrency, path, batch_size)
 
 
 if __name__ == "__main__":
-    asyncio.run(main(sys.argv[1:]))
+    parser = argparse.ArgumentParser(description="Upload documents and NDJSON archives.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--url", default=base_url)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    base_url = args.url.rstrip("/")
+    asyncio.run(main(args.paths, args.concurrency, args.batch_size))
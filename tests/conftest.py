@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+# Settings are read when base.config is imported, so point every on-disk
+# default at a scratch directory before any test module imports base.
+_root = tempfile.mkdtemp(prefix="continuity-tests-")
+for name, sub in {
+    "EMBED_CACHE_DIR": "embeddings",
+    "INDEX_DIR": "indexes",
+    "MESSAGES_DIR": "messages",
+    "SNAPSHOT_DIR": "snapshots",
+    "INGEST_SPOOL_DIR": "uploads",
+    "SUMMARY_JOURNAL": "summaries.jsonl",
+    "PREFERENCES_JOURNAL": "preferences.jsonl",
+}.items():
+    os.environ[name] = os.path.join(_root, sub)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest  # noqa: E402
+
+from base.core import registry, summarize  # noqa: E402
+from base.core.context_cache import CONTEXT_CACHE  # noqa: E402
+from base.core.storage import Storage, create_engine  # noqa: E402
+from base.core.streams import MemoryRedis  # noqa: E402
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """A fresh ``MemoryRedis`` behind the shared context cache."""
+
+    client = MemoryRedis()
+    monkeypatch.setattr(CONTEXT_CACHE, "_redis", client)
+    return client
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    """A SQLite ``Storage`` behind the registry's and the summary
+    scheduler's storage functions.
+
+    The engine binds to the first event loop that uses it, so a test should
+    use it from one ``asyncio.run``.
+    """
+
+    store = Storage(create_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}"))
+    monkeypatch.setattr(registry, "STORAGE", store)
+    monkeypatch.setattr(summarize, "STORAGE", store)
+    return store
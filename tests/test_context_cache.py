@@ -0,0 +1,93 @@
+import asyncio
+
+from base.core.context_cache import ContextCache, pack, unpack
+from base.core.streams import MemoryRedis
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_pack_concatenates():
+    lines = ["", "ascii", "ünïcødé", "x" * 300]
+    assert unpack(pack(lines)) == lines
+    assert unpack(pack(lines[:2]) + pack(lines[2:])) == lines
+    assert unpack(None) == []
+
+
+def test_missing_sections_are_built_once():
+    calls = []
+
+    async def related(thread_id):
+        calls.append(thread_id)
+        return [f"related to {thread_id}"]
+
+    async def current(thread_id):
+        return ["hello"]
+
+    cache = ContextCache(MemoryRedis(), builders={"related": related, "current": current})
+    first = run(cache.get("t1"))
+    assert first.sections == {"preferences": [], "related": ["related to t1"], "current": ["hello"]}
+    assert sorted(first.rebuilt) == ["current", "preferences", "related"]
+
+    second = run(cache.get("t1"))
+    assert second.sections["related"] == ["related to t1"]
+    assert calls == ["t1"]
+    assert cache.stats["misses"] == 2  # preferences has no builder, so it stays missing
+
+
+def test_append_extends_current_until_rebuilt():
+    async def current(thread_id):
+        return ["a"]
+
+    cache = ContextCache(MemoryRedis(), builders={"current": current})
+
+    async def scenario():
+        await cache.get("t")
+        await cache.append("t", "b")
+        await cache.append("t", "c")
+        appended = (await cache.get("t")).sections["current"]
+        await cache.put("t", "current", ["fresh"])
+        return appended, (await cache.get("t")).sections["current"]
+
+    appended, rebuilt = run(scenario())
+    assert appended == ["a", "b", "c"]
+    assert rebuilt == ["fresh"]
+
+
+def test_builder_without_source_keeps_the_tail():
+    # The thread is not resident, so there is nothing to rebuild ``current``
+    # from; the appended lines must survive instead of being overwritten.
+    async def current(thread_id):
+        return None
+
+    redis = MemoryRedis()
+    cache = ContextCache(redis, builders={"current": current})
+
+    async def scenario():
+        await cache.append("t", "one")
+        await cache.append("t", "two")
+        first = (await cache.get("t")).sections["current"]
+        second = (await cache.get("t")).sections["current"]
+        return first, second, await redis.get("ctx:t:current")
+
+    first, second, stored = run(scenario())
+    assert first == second == ["one", "two"]
+    assert stored is None
+
+
+def test_invalidate_drops_sections():
+    async def related(thread_id):
+        return ["r"]
+
+    cache = ContextCache(MemoryRedis(), builders={"related": related})
+
+    async def scenario():
+        await cache.get("t")
+        await cache.append("t", "line")
+        await cache.invalidate("t", "related")
+        assert (await cache.get("t")).rebuilt == ["preferences", "related", "current"]
+        await cache.invalidate("t")
+        return await cache.redis.get("ctx:t:current:tail")
+
+    assert run(scenario()) is None
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+from openai import AsyncOpenAI
+
+from base.core.cache import EmbeddingCache
+from base.core.embeddings import EmbeddingService
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+from fake_openai import fake_vector, make_app  # noqa: E402
+
+DIM = 8
+
+
+def served(scenario, **app):
+    """Run ``scenario(client, calls)`` against a local fake embeddings API."""
+
+    async def run():
+        server = TestServer(make_app(dimensions=DIM, **app))
+        await server.start_server()
+        client = AsyncOpenAI(
+            base_url=str(server.make_url("/v1")), api_key="local", max_retries=0
+        )
+        try:
+            return await scenario(client, server)
+        finally:
+            await client.close()
+            await server.close()
+
+    return asyncio.run(run())
+
+
+async def calls(server: TestServer):
+    async with ClientSession() as session:
+        async with session.get(server.make_url("/stats")) as res:
+            return await res.json()
+
+
+def test_concurrent_calls_share_one_deduplicated_request():
+    texts = ["a", "b", "a", "c", "b", "a"]
+
+    async def scenario(client, server):
+        svc = EmbeddingService(client, batch_size=16, window=0.05)
+        vectors = await svc.embed_many(texts)
+        return vectors, svc.stats, await calls(server)
+
+    vectors, stats, seen = served(scenario)
+    assert vectors == [pytest.approx(fake_vector(t, DIM)) for t in texts]
+    assert stats == {"requests": 1, "inputs": 3, "deduped": 3}
+    assert (seen["embeddings"], seen["inputs"]) == (1, 3)
+
+
+def test_full_batches_are_sent_without_waiting():
+    async def scenario(client, server):
+        svc = EmbeddingService(client, batch_size=2, window=60)
+        vectors = await asyncio.wait_for(svc.embed_many(["a", "b", "c", "d"]), 5)
+        return vectors, await calls(server)
+
+    vectors, seen = served(scenario)
+    assert len(vectors) == 4
+    assert (seen["embeddings"], seen["inputs"]) == (2, 4)
+
+
+def test_cache_hits_skip_the_request():
+    async def scenario(client, server):
+        svc = EmbeddingService(client, window=0.01, cache=EmbeddingCache())
+        first = await svc.embed_many(["a", "b"])
+        second = await svc.embed_many(["b", "a"])
+        return first, second, await calls(server)
+
+    first, second, seen = served(scenario)
+    assert second == [pytest.approx(v, rel=1e-6) for v in first[::-1]]
+    assert seen["embeddings"] == 1
+
+
+def test_failed_request_reaches_every_waiter():
+    async def scenario(client, server):
+        svc = EmbeddingService(client, window=0.01)
+        results = await asyncio.gather(
+            svc.embed("a"), svc.embed("a"), svc.embed("b"), return_exceptions=True
+        )
+        await svc.aclose()
+        return results, svc.stats
+
+    results, stats = served(scenario, fail_rate=1.0)
+    assert all(isinstance(r, Exception) for r in results)
+    assert stats["requests"] == 0
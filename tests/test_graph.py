@@ -0,0 +1,51 @@
+from base.core.graph import ThreadGraph
+
+DIM = 4
+
+
+def graph(**kwargs):
+    return ThreadGraph(degree=2, threshold=0.1, dim=DIM, **kwargs)
+
+
+def vec(*values):
+    return list(values) + [0.0] * (DIM - len(values))
+
+
+def test_readding_an_id_reuses_its_slot():
+    g = graph()
+    g.add("a", "A", vec(1))
+    g.add("b", "B", vec(1, 0.2))
+    g.add("a", "A2", vec(1, 0.1))
+    assert g.ids == ["a", "b"]
+    assert len(g) == 2
+    assert g.summaries[g._slots["a"]] == "A2"
+    assert [id for id, _ in g.neighbors("b")] == ["a"]
+
+
+def test_remove_only_touches_rows_that_link_to_it():
+    g = graph()
+    g.add("a", "A", vec(1))
+    g.add("b", "B", vec(1, 0.1))
+    g.add("c", "C", vec(0, 0, 1))
+    assert sorted(g.remove("a")) == ["b"]
+    assert g.neighbors("b") == []
+    assert g._incoming[g._slots["b"]] == set()
+    g.add("d", "D", vec(1, 0.2))
+    assert g._slots["d"] == 0  # the freed slot
+    assert [id for id, _ in g.neighbors("b")] == ["d"]
+
+
+def test_snapshot_round_trip_and_pathless_save(tmp_path):
+    graph().save()  # no path: nothing written, no error
+    path = str(tmp_path / "threads.graph")
+    g = graph(path=path)
+    g.add("a", "A", vec(1))
+    g.add("b", "B", vec(1, 0.1))
+    g.remove("a")
+    g.save()
+
+    loaded = graph(path=path)
+    assert "b" in loaded and "a" not in loaded
+    assert loaded._free == [0]
+    loaded.add("c", "C", vec(1, 0.2))
+    assert loaded.remove("c") == ["b"]
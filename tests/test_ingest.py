@@ -0,0 +1,179 @@
+import asyncio
+import json
+
+import pytest
+from attrs import define, field
+
+from base.core.indexes import Indexes
+from base.core.ingest import Backpressure, IngestQueue, IngestWorker
+from base.core.lexical import LexicalIndex
+from base.core.streams import MemoryStreams
+
+DIM = 4
+
+
+@define
+class FakeEmbedder:
+    fail: set = field(factory=set)
+    calls: int = 0
+
+    async def embed_many(self, texts):
+        self.calls += 1
+        if self.fail & set(texts):
+            raise RuntimeError("embedding failed")
+        return [[float(len(t)), 1.0, 0.0, 0.0] for t in texts]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def worker(redis, tmp_path, **kwargs):
+    kwargs.setdefault("embedder", FakeEmbedder())
+    return IngestWorker(
+        redis,
+        Indexes(path=str(tmp_path), dim=DIM),
+        stream="ingest",
+        group="g",
+        dead_letter="dead",
+        block=1,
+        **kwargs,
+    )
+
+
+async def drain(w: IngestWorker):
+    await w.setup()
+    while res := await w.redis.xreadgroup(w.group, w.name, {w.stream: ">"}, count=w.batch_size):
+        for _, entries in res:
+            await w.process(entries)
+
+
+def test_queue_applies_backpressure():
+    queue = IngestQueue(MemoryStreams(), stream="ingest", max_backlog=2, check_interval=0)
+
+    async def scenario():
+        await queue.submit({"text": "a"})
+        await queue.submit({"text": "b"})
+        with pytest.raises(Backpressure):
+            await queue.submit({"text": "c"})
+        return await queue.submit_many([{"text": "d"}])
+
+    assert run(scenario()) == []
+
+
+def test_submit_stream_reports_each_item():
+    queue = IngestQueue(MemoryStreams(), stream="ingest", max_backlog=2, check_interval=0)
+
+    async def items():
+        yield json.dumps({"text": "a"})
+        yield "{not json"
+        yield {"text": "b"}
+        yield {"text": "c"}
+
+    async def scenario():
+        return [r["status"] async for r in queue.submit_stream(items(), batch_size=10)]
+
+    assert run(scenario()) == ["queued", "invalid", "queued", "rejected"]
+
+
+def test_worker_indexes_stores_and_deletes_entries(tmp_path):
+    redis = MemoryStreams()
+    stored = []
+
+    async def store(records):
+        stored.extend(records)
+
+    lexical = LexicalIndex()
+    w = worker(redis, tmp_path, store=store, lexical=lexical)
+    queue = IngestQueue(redis, stream="ingest")
+
+    async def scenario():
+        await w.setup()
+        for text in ("deploy failed", "billing question"):
+            await queue.submit({"text": text, "thread_id": "t1", "created": 1.0})
+        await drain(w)
+        return await redis.xlen("ingest"), await w.indexes.get_index("default")
+
+    backlog, index = run(scenario())
+    assert backlog == 0
+    assert len(index) == 2
+    assert w.stats["processed"] == 2
+    assert [r["payload"]["text"] for r in stored] == ["deploy failed", "billing question"]
+    assert all(r["payload"]["thread_id"] == "t1" for r in stored)
+    assert [h["payload"]["text"] for h in lexical.search("billing")] == ["billing question"]
+
+
+def test_one_bad_entry_does_not_block_the_batch(tmp_path):
+    redis = MemoryStreams()
+    w = worker(redis, tmp_path, embedder=FakeEmbedder(fail={"poison"}))
+    queue = IngestQueue(redis, stream="ingest")
+
+    async def scenario():
+        await w.setup()
+        for text in ("good one", "poison", "good two"):
+            await queue.submit({"text": text})
+        await drain(w)
+        return await redis.xlen("ingest")
+
+    assert run(scenario()) == 1
+    assert w.stats == {"processed": 2, "failed": 1, "retried": 0, "dead": 0}
+
+
+def test_reclaim_retries_then_dead_letters(tmp_path):
+    redis = MemoryStreams()
+    w = worker(redis, tmp_path, embedder=FakeEmbedder(fail={"poison"}), retry_idle=0, max_retries=2)
+    queue = IngestQueue(redis, stream="ingest")
+
+    async def scenario():
+        await w.setup()
+        entry_id = await queue.submit({"text": "poison"})
+        await drain(w)
+        for _ in range(3):
+            await w.reclaim()
+        return entry_id, await redis.xrange("dead"), await redis.xlen("ingest")
+
+    entry_id, dead, backlog = run(scenario())
+    assert backlog == 0
+    assert [fields["source_id"] for _, fields in dead] == [entry_id]
+    assert w.stats["retried"] == 1
+    assert w.stats["dead"] == 1
+
+
+def test_reclaim_counts_deliveries_of_claimed_entries_only(tmp_path):
+    redis = MemoryStreams()
+    w = worker(redis, tmp_path, name="fast", retry_idle=50, max_retries=1)
+    queue = IngestQueue(redis, stream="ingest")
+
+    async def scenario():
+        await w.setup()
+        ids = [await queue.submit({"text": t}) for t in "abc"]
+        await redis.xreadgroup("g", "fast", {"ingest": ">"}, count=3)
+        await asyncio.sleep(0.06)
+        # ``slow`` takes over the middle entry, between the two ``fast`` reclaims.
+        await redis.xautoclaim("ingest", "g", "slow", 0, start_id=ids[1], count=1)
+        await w.reclaim()
+        return ids, await redis.xrange("dead"), await redis.xpending("ingest", "g")
+
+    ids, dead, pending = run(scenario())
+    # Both reclaimed entries were delivered twice; the middle one stays with ``slow``.
+    assert [fields["source_id"] for _, fields in dead] == [ids[0], ids[2]]
+    assert pending["pending"] == 1 and pending["min"] == ids[1]
+
+
+def test_dead_lettering_removes_the_spooled_upload(tmp_path):
+    redis = MemoryStreams()
+    upload = tmp_path / "upload.md"
+    upload.write_text("# Title\n\npoison\n")
+    w = worker(redis, tmp_path, embedder=FakeEmbedder(fail={"poison"}), retry_idle=0, max_retries=1)
+    queue = IngestQueue(redis, stream="ingest")
+
+    async def scenario():
+        await w.setup()
+        await queue.submit({"text": "poison", "path": str(upload), "spooled": True})
+        await drain(w)
+        for _ in range(2):
+            await w.reclaim()
+
+    run(scenario())
+    assert w.stats["dead"] == 1
+    assert not upload.exists()
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from base.core.preferences import PreferenceStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Embedder:
+    """Maps each text to a fixed vector."""
+
+    VECTORS = {"tea": [1.0, 0.0], "more tea": [0.95, 0.05], "code": [0.0, 1.0]}
+
+    async def embed(self, text):
+        return self.VECTORS[text]
+
+
+def store(journal, extract=None, **kwargs):
+    async def rewrite(current, text):
+        return current | {text.split()[-1]: "yes"}
+
+    return PreferenceStore(
+        embedder=Embedder(), extract=extract or rewrite, journal=str(journal), **kwargs
+    )
+
+
+def test_absorbed_slices_stay_in_memory_until_a_snapshot(tmp_path):
+    journal = tmp_path / "preferences.jsonl"
+    prefs = store(journal, snapshot_every=100)
+
+    async def scenario():
+        await prefs.observe("u", "tea")
+        for _ in range(3):
+            assert not (await prefs.observe("u", "more tea"))["extracted"]
+        lines = journal.read_text().splitlines()
+        await prefs.save()
+        return lines
+
+    assert len(run(scenario())) == 1  # just the diff that added "tea"
+    assert len(journal.read_text().splitlines()) == 1  # one snapshot line
+
+    restored = store(journal).get("u")
+    assert restored.values() == {"tea": "yes"}
+    assert restored.items["tea"].weight == 4
+    assert restored.items["tea"].centroid == pytest.approx(prefs.get("u").items["tea"].centroid)
+
+
+def test_journal_is_compacted_and_replays_later_diffs(tmp_path):
+    journal = tmp_path / "preferences.jsonl"
+    prefs = store(journal, snapshot_every=2)
+
+    async def scenario():
+        await prefs.observe("u", "tea")
+        await prefs.observe("u", "more tea")  # second change: snapshot
+        await prefs.observe("u", "code")
+
+    run(scenario())
+    assert len(journal.read_text().splitlines()) == 2  # snapshot, then the diff
+    restored = store(journal).get("u")
+    assert restored.values() == {"tea": "yes", "code": "yes"}
+    assert restored.version == 2
+    assert len(restored.history) == 2
@@ -0,0 +1,172 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import text
+
+from base.core.context import Metadata
+from base.core.registry import HashRing, ThreadRegistry, save_thread
+from base.schema.threads import Thread, ThreadState
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def registry(**kwargs):
+    kwargs.setdefault("load", None)
+    kwargs.setdefault("save", None)
+    return ThreadRegistry(shards=4, ring=HashRing([]), timeout=timedelta(seconds=60), **kwargs)
+
+
+def test_append_creates_and_reuses_threads(redis):
+    reg = registry()
+
+    async def scenario():
+        thread = await reg.append("t1", "hello")
+        again = await reg.append("t1", "world")
+        fresh = await reg.append(None, "new thread")
+        return thread, again, fresh
+
+    thread, again, fresh = run(scenario())
+    assert thread is again
+    assert thread.content.recent() == ["hello", "world"]
+    assert fresh.metadata.thread_id not in (None, "t1")
+    assert len(reg) == 2
+    assert reg.stats["created"] == 2
+    assert thread.owner is reg.threads
+
+
+def test_saved_threads_write_their_new_messages_and_events_once(redis, storage):
+    reg = registry()
+
+    async def scenario():
+        await storage.init()
+        thread = await reg.append("t1", "hello")
+        await reg.append("t1", {"text": "world", "sender": "u1"})
+        await save_thread(thread)
+        await reg.append("t1", "again")
+        await save_thread(thread)
+        await save_thread(thread)
+        rows = await storage.last_messages("t1", 10)
+        last = await storage.last_messages("t1", 2)
+        async with storage.connect() as conn:
+            events = (await conn.execute(text("SELECT event FROM thread_events"))).all()
+        await storage.aclose()
+        return thread, rows, last, events
+
+    thread, rows, last, events = run(scenario())
+    assert [r.id for r in rows] == ["t1:0", "t1:1", "t1:2"]
+    assert [r.content for r in last] == [{"text": "world", "sender": "u1"}, "again"]
+    assert thread.unsaved == []
+    assert [e.event for e in events] == ["created"]
+
+
+def test_concurrent_misses_share_one_load(redis):
+    loads = []
+
+    async def load(thread_id):
+        loads.append(thread_id)
+        await asyncio.sleep(0.01)
+        return Thread(Metadata(thread_id=thread_id))
+
+    reg = registry(load=load)
+
+    async def scenario():
+        return await asyncio.gather(*(reg.get("t1") for _ in range(5)))
+
+    threads = run(scenario())
+    assert loads == ["t1"]
+    assert all(t is threads[0] for t in threads)
+    assert threads[0].owner is reg.threads
+
+
+def test_evict_idle_saves_encodes_and_drops(redis):
+    saved = []
+
+    async def save(thread):
+        saved.append((thread.metadata.thread_id, thread.state))
+
+    reg = registry(save=save)
+
+    async def scenario():
+        await reg.append("old", "a")
+        await reg.append("new", "b")
+        reg.peek("old").touched -= 120
+        return await reg.evict_idle()
+
+    assert run(scenario()) == 1
+    assert saved == [("old", ThreadState.ENCODED)]
+    assert reg.peek("old") is None and reg.peek("new") is not None
+    assert reg.threads.counts["encoded"] == 0  # no longer tracked once saved
+    assert reg.stats["evicted"] == 1
+
+
+def test_failed_save_keeps_the_thread(redis):
+    async def save(thread):
+        raise OSError("database unavailable")
+
+    reg = registry(save=save)
+
+    async def scenario():
+        thread = await reg.append("t1", "a")
+        thread.touched -= 120
+        await reg.evict_idle()
+        return thread
+
+    thread = run(scenario())
+    assert reg.peek("t1") is thread
+    assert thread.owner is reg.threads
+    assert reg.stats["evicted"] == 0
+
+
+def test_get_during_eviction_restores_the_thread(redis):
+    release = None
+
+    async def save(thread):
+        await release.wait()
+
+    reg = registry(save=save)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        thread = await reg.append("t1", "a")
+        thread.touched -= 120
+        eviction = asyncio.create_task(reg.evict_idle())
+        await asyncio.sleep(0)
+        restored = await reg.get("t1")
+        release.set()
+        await eviction
+        return thread, restored
+
+    thread, restored = run(scenario())
+    assert restored is thread
+    assert reg.peek("t1") is thread
+    assert reg.stats["restored"] == 1
+
+
+def test_current_section_only_for_resident_threads(redis):
+    reg = registry()
+
+    async def scenario():
+        await reg.append("t1", "hello")
+        await reg.append("t1", {"text": "hi", "sender": "u1"})
+        return await reg.current("t1"), await reg.current("missing")
+
+    resident, missing = run(scenario())
+    assert len(resident) == 2 and resident[0] == "hello"
+    assert missing is None
+
+
+@pytest.mark.parametrize("replicas", [16, 64])
+def test_hash_ring_moves_only_keys_of_the_new_node(replicas):
+    keys = [f"thread-{i}" for i in range(2000)]
+    ring = HashRing(["a", "b", "c"], replicas=replicas)
+    before = {k: ring.owner(k) for k in keys}
+    ring.add("d")
+    after = {k: ring.owner(k) for k in keys}
+    moved = [k for k in keys if before[k] != after[k]]
+    assert moved and all(after[k] == "d" for k in moved)
+    ring.remove("d")
+    assert {k: ring.owner(k) for k in keys} == before
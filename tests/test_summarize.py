@@ -0,0 +1,96 @@
+import asyncio
+import json
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from base.core.registry import HashRing, ThreadRegistry, save_thread, unsummarized_threads
+from base.core.summarize import SummaryScheduler, store_summary
+from base.schema.records import MessageRecord
+
+SUMMARIES = select(MessageRecord).where(MessageRecord.kind == "summary")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def scheduler(threads, journal, calls, **kwargs):
+    async def summarize(texts):
+        calls.append(texts)
+        return "summary of " + " / ".join(texts)
+
+    return SummaryScheduler(
+        threads, journal=str(journal), summarize=summarize, store=store_summary, **kwargs
+    )
+
+
+def test_evicted_threads_keep_the_summary_written_later(redis, storage, tmp_path):
+    reg = ThreadRegistry(shards=2, ring=HashRing([]), timeout=timedelta(seconds=60), load=None)
+    calls = []
+    summaries = scheduler(reg.threads, tmp_path / "journal.jsonl", calls)
+
+    async def scenario():
+        await storage.init()
+        await reg.append("t1", "hello")
+        await reg.evict_idle(now=1e12)
+        before = await storage.thread("t1")
+        await summaries.tick()
+        after = await storage.thread("t1")
+        await storage.aclose()
+        return before, after
+
+    before, after = run(scenario())
+    assert (before.state, before.summary) == ("encoded", None)
+    assert after.summary == "summary of hello"
+    assert calls == [["hello"]]
+
+
+def test_unsummarized_threads_are_recovered_after_a_crash(redis, storage, tmp_path):
+    reg = ThreadRegistry(shards=2, ring=HashRing([]), timeout=timedelta(seconds=60), load=None)
+    journal = tmp_path / "journal.jsonl"
+    # t2 was summarized and journaled, but the crash came before it was stored.
+    journal.write_text(json.dumps({"id": "t2", "level": 0, "summary": "old", "children": []}) + "\n")
+
+    async def scenario():
+        await storage.init()
+        for thread_id in ("t1", "t2"):
+            await reg.append(thread_id, f"message in {thread_id}")
+        reg.threads.on_transition = None  # the scheduler that queued them is gone
+        await reg.evict_idle(now=1e12)
+
+        calls = []
+        summaries = scheduler(reg.threads, journal, calls, backlog=unsummarized_threads)
+        await summaries.recover()
+        await summaries.tick()
+        stored = {t: (await storage.thread(t)).summary for t in ("t1", "t2")}
+        left = await storage.unsummarized()
+        await storage.aclose()
+        return calls, stored, left
+
+    calls, stored, left = run(scenario())
+    assert calls == [["message in t1"]]
+    assert stored == {"t1": "summary of message in t1", "t2": "old"}
+    assert left == []
+
+
+def test_parent_summaries_are_stored_as_messages(redis, storage, tmp_path):
+    reg = ThreadRegistry(shards=2, ring=HashRing([]), timeout=timedelta(seconds=60), load=None)
+    calls = []
+    summaries = scheduler(reg.threads, tmp_path / "journal.jsonl", calls, fanout=2)
+
+    async def scenario():
+        await storage.init()
+        for thread_id in ("t1", "t2"):
+            await reg.append(thread_id, thread_id)
+        await reg.evict_idle(now=1e12)
+        await summaries.tick()
+        async with storage.connect() as conn:
+            rows = (await conn.execute(SUMMARIES)).all()
+        await storage.aclose()
+        return rows
+
+    rows = run(scenario())
+    assert len(rows) == 1
+    assert rows[0].content["level"] == 1
+    assert sorted(rows[0].content["children"]) == ["t1", "t2"]
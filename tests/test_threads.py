@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from base.schema import threads as module
+from base.schema.threads import Threads, ThreadState
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_observers_overlap_and_plain_ones_run_inline(monkeypatch):
+    monkeypatch.setattr(module, "_OBSERVERS", [])
+    seen = []
+
+    @module.observe
+    def inline(thread, content, embed):
+        seen.append((content, len(thread.content)))
+
+    @module.observe
+    async def slow(thread, content, embed):
+        await asyncio.sleep(0.1)
+
+    @module.observe
+    async def slower(thread, content, embed):
+        await asyncio.sleep(0.1)
+
+    thread = Threads().append()
+
+    async def scenario():
+        start = time.perf_counter()
+        await asyncio.gather(thread.update("a"), thread.update("b"))
+        return time.perf_counter() - start
+
+    assert run(scenario()) < 0.19
+    assert seen == [("a", 1), ("b", 2)]
+
+
+def test_rollover_moves_the_oldest_threads():
+    threads = Threads(maxlen=2, encode_threshold=1)
+    first, second, third = (threads.append() for _ in range(3))
+    assert first.state is ThreadState.ENCODED
+    threads.touch(second)
+    threads.append()
+    assert third.state is ThreadState.ENCODED
+    assert first.state is ThreadState.ARCHIVED
+    assert threads.counts == {"active": 2, "encoded": 1, "archived": 1, "pruned": 0}